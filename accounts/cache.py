@@ -0,0 +1,69 @@
+"""
+Cached /accounts/v1/whoami/ payloads.
+
+Clients poll whoami every time the app comes to the foreground, and the
+profile rarely changes in between. The serialized profile is cached per
+user, together with an ETag of its content, in the Django cache named by
+settings.ACCOUNTS_PROFILE_CACHE['alias']. A hit costs no database query
+and no serializer work. A client that sends the ETag back in If-None-Match
+gets an empty 304 instead of the body.
+
+Entries are dropped on post_save and post_delete of the user (see
+accounts/signals.py). Writes that skip signals, such as
+``QuerySet.update()``, are only picked up once the entry's ``ttl`` runs
+out. With more than one worker, point the alias at a shared cache so that
+one worker's invalidation reaches the others.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+
+from server import metrics
+from .serializers import UserSerializer
+
+PROFILE_CACHE = metrics.counter(
+    'accounts_profile_cache_total', 'whoami lookups by cache outcome.', ('result',)
+)
+
+
+def profile_cache():
+    return caches[settings.ACCOUNTS_PROFILE_CACHE['alias']]
+
+
+def profile_key(user_id):
+    return f"accounts:whoami:{user_id}"
+
+
+def profile_etag(data):
+    content = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    return '"%s"' % hashlib.sha256(content.encode()).hexdigest()[:32]
+
+
+def get_profile(user_id):
+    """
+    ``(etag, data)`` for the user's whoami payload, or None if there is no
+    active user with that id.
+    """
+    cache = profile_cache()
+    key = profile_key(user_id)
+    entry = cache.get(key)
+    if entry is not None:
+        PROFILE_CACHE.inc('hit')
+        return entry
+
+    PROFILE_CACHE.inc('miss')
+    user = get_user_model().objects.filter(pk=user_id).first()
+    if user is None or not user.is_active:
+        return None
+    data = dict(UserSerializer(user).data)
+    entry = (profile_etag(data), data)
+    cache.set(key, entry, settings.ACCOUNTS_PROFILE_CACHE['ttl'])
+    return entry
+
+
+def invalidate_profile(user_id):
+    profile_cache().delete(profile_key(user_id))
@@ -0,0 +1,131 @@
+"""
+Typeahead lookup of users by username, first name and last name.
+
+A query is answered in up to three steps, each only run while the page
+isn't full:
+
+1. username prefix: a range scan of user_username_prefix in username
+   order, which stops after ``limit`` rows however many users match;
+2. first or last name prefix, from the two name prefix indexes;
+3. fuzzy matches (PostgreSQL, 3+ characters): word similarity against the
+   three trigram indexes, best match first, so typos and infixes still find
+   someone.
+
+Results are a slim projection (id, username, names, picture URL) read with
+values_list(), without model instances or UserSerializer.
+
+Short queries match the most users and are typed by everyone, so results
+for queries of up to ``cached_length`` characters are cached in the Django
+cache named by settings.ACCOUNTS_USER_LOOKUP['alias'] for ``ttl`` seconds.
+Renamed and new users can take that long to show up under those prefixes.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Greatest, Upper
+
+from server import metrics
+
+USER_LOOKUP_CACHE = metrics.counter(
+    'accounts_user_lookup_cache_total', 'User lookups by cache outcome.', ('result',)
+)
+
+LOOKUP_FIELDS = ('id', 'username', 'first_name', 'last_name', 'profile_pic')
+
+MAX_QUERY_LENGTH = 50
+
+FUZZY_MIN_LENGTH = 3
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+def lookup_cache():
+    return caches[settings.ACCOUNTS_USER_LOOKUP['alias']]
+
+
+def lookup_key(query, limit):
+    digest = hashlib.sha256(query.encode()).hexdigest()[:32]
+    return f"accounts:lookup:{limit}:{digest}"
+
+
+def user_result(row):
+    user = dict(zip(LOOKUP_FIELDS, row))
+    user['profile_pic'] = default_storage.url(user['profile_pic']) if user['profile_pic'] else None
+    return user
+
+
+def find_users(query, limit):
+    """
+    Up to ``limit`` users matching ``query``, best first, as dicts.
+    """
+    users = get_user_model().objects.all()
+    rows = list(
+        users.filter(username__istartswith=query)
+        .order_by(Upper('username'))
+        .values_list(*LOOKUP_FIELDS)[:limit]
+    )
+
+    if len(rows) < limit:
+        rows += (
+            users.filter(Q(first_name__istartswith=query) | Q(last_name__istartswith=query))
+            .exclude(pk__in=[row[0] for row in rows])
+            .order_by(Upper('username'))
+            .values_list(*LOOKUP_FIELDS)[:limit - len(rows)]
+        )
+
+    if len(rows) < limit and len(query) >= FUZZY_MIN_LENGTH and connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        rows += (
+            users.filter(
+                Q(username__trigram_word_similar=query)
+                | Q(first_name__trigram_word_similar=query)
+                | Q(last_name__trigram_word_similar=query)
+            )
+            .exclude(pk__in=[row[0] for row in rows])
+            .annotate(similarity=Greatest(
+                TrigramWordSimilarity(query, 'username'),
+                TrigramWordSimilarity(query, 'first_name'),
+                TrigramWordSimilarity(query, 'last_name'),
+            ))
+            .order_by('-similarity', Upper('username'))
+            .values_list(*LOOKUP_FIELDS)[:limit - len(rows)]
+        )
+
+    return [user_result(row) for row in rows]
+
+
+def lookup_users(query, limit, exclude_id=None):
+    """
+    Users matching ``query`` for the typeahead, without ``exclude_id`` (the
+    user asking). Raises InvalidQuery for an empty or overlong query.
+    """
+    query = ' '.join((query or '').split()).lower()
+    if not query or len(query) > MAX_QUERY_LENGTH:
+        raise InvalidQuery(query)
+
+    # One extra result, so that dropping the user asking still fills the page.
+    options = settings.ACCOUNTS_USER_LOOKUP
+    if len(query) <= options['cached_length']:
+        cache = lookup_cache()
+        key = lookup_key(query, limit + 1)
+        users = cache.get(key)
+        if users is None:
+            USER_LOOKUP_CACHE.inc('miss')
+            users = find_users(query, limit + 1)
+            cache.set(key, users, options['ttl'])
+        else:
+            USER_LOOKUP_CACHE.inc('hit')
+    else:
+        USER_LOOKUP_CACHE.inc('uncached')
+        users = find_users(query, limit + 1)
+
+    # Token users carry the id claim as a string.
+    return [user for user in users if str(user['id']) != str(exclude_id)][:limit]
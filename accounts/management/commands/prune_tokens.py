@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired outstanding and blacklisted refresh tokens in small batches. "
+        "Safe to run from cron while the site is serving traffic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Rows deleted per statement; each batch is its own short transaction.")
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help="Seconds to pause between batches to spread the load.")
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help="Stop after this many batches; the next run picks up the rest.")
+
+    def handle(self, *args, **options):
+        # Fixed up front, so tokens expiring during the run are left for next time.
+        cutoff = aware_utcnow()
+        start = time.monotonic()
+        deleted = batches = 0
+
+        while options['max_batches'] is None or batches < options['max_batches']:
+            # Tokens expire in roughly the order they were issued, so walking
+            # the primary key finds expired rows first without an index on
+            # expires_at. Each delete locks only the rows of this batch.
+            ids = list(
+                OutstandingToken.objects.filter(expires_at__lte=cutoff)
+                .order_by('id').values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            BlacklistedToken.objects.filter(token_id__in=ids).delete()
+            OutstandingToken.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+            batches += 1
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} expired tokens in {batches} batches ({time.monotonic() - start:.1f}s)."
+        ))
@@ -0,0 +1,64 @@
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations, models
+
+
+class PostgresOnly(migrations.SeparateDatabaseAndState):
+    """
+    Records the operations in the migration state everywhere, but only runs
+    them against PostgreSQL; the other backends (the SQLite test database)
+    have no pattern opclasses or pg_trgm.
+    """
+
+    def __init__(self, operations):
+        super().__init__(database_operations=operations, state_operations=operations)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run in a transaction. It doesn't block
+    # sign-ups and profile edits while the indexes are built.
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        PostgresOnly([
+            TrigramExtension(),
+            AddIndexConcurrently(
+                model_name='customuser',
+                index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('username'), name='text_pattern_ops'), name='user_username_prefix'),
+            ),
+            AddIndexConcurrently(
+                model_name='customuser',
+                index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('first_name'), name='text_pattern_ops'), name='user_first_name_prefix'),
+            ),
+            AddIndexConcurrently(
+                model_name='customuser',
+                index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('last_name'), name='text_pattern_ops'), name='user_last_name_prefix'),
+            ),
+            AddIndexConcurrently(
+                model_name='customuser',
+                index=django.contrib.postgres.indexes.GinIndex(fields=['username'], name='user_username_trgm', opclasses=['gin_trgm_ops']),
+            ),
+            AddIndexConcurrently(
+                model_name='customuser',
+                index=django.contrib.postgres.indexes.GinIndex(fields=['first_name'], name='user_first_name_trgm', opclasses=['gin_trgm_ops']),
+            ),
+            AddIndexConcurrently(
+                model_name='customuser',
+                index=django.contrib.postgres.indexes.GinIndex(fields=['last_name'], name='user_last_name_trgm', opclasses=['gin_trgm_ops']),
+            ),
+        ]),
+    ]
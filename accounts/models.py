@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.functions import Upper
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 # Create your models here.
 
@@ -53,4 +55,18 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username'] 
 
+    class Meta:
+        # User lookup (accounts/lookup.py). istartswith compares UPPER(field),
+        # so the prefix indexes are on that expression; text_pattern_ops lets
+        # LIKE 'AL%' use them whatever the database collation. The trigram
+        # indexes serve the fuzzy matches. PostgreSQL only, see migration 0002.
+        indexes = [
+            models.Index(OpClass(Upper('username'), name='text_pattern_ops'), name='user_username_prefix'),
+            models.Index(OpClass(Upper('first_name'), name='text_pattern_ops'), name='user_first_name_prefix'),
+            models.Index(OpClass(Upper('last_name'), name='text_pattern_ops'), name='user_last_name_prefix'),
+            GinIndex(fields=['username'], opclasses=['gin_trgm_ops'], name='user_username_trgm'),
+            GinIndex(fields=['first_name'], opclasses=['gin_trgm_ops'], name='user_first_name_trgm'),
+            GinIndex(fields=['last_name'], opclasses=['gin_trgm_ops'], name='user_last_name_trgm'),
+        ]
+
 
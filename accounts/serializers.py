@@ -1,5 +1,7 @@
 from rest_framework import serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
 from django.contrib.auth import get_user_model
+from .tokens import RefreshToken
 
 User = get_user_model()
 
@@ -24,6 +26,7 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'email', 'username', 'first_name', 'last_name', 'profile_pic','bio', 'status_message', 'phone_number', 'date_of_birth', 'date_joined']
 
-        
-
 
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    # Blacklist checks come from memory; see accounts/tokens.py.
+    token_class = RefreshToken
@@ -0,0 +1,69 @@
+import io
+import json
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.test import TestCase
+
+from accounts.bulk_import import UserImporter, read_rows
+
+User = get_user_model()
+
+
+class ImportUsersTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(email='taken@example.com', username='taken', password='test')
+
+    def write_input(self, name, content):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test_csv_import_reports_rejected_rows(self):
+        path = self.write_input('users.csv', (
+            "email,username,password,bio\n"
+            "ann@example.com,ann,secret,hi there\n"
+            "not-an-email,bad,secret,\n"
+            "taken@example.com,other,secret,\n"
+            "bea@example.com,ann,secret,\n"
+            "cid@example.com,cid,,\n"
+        ))
+        rejects = path + '.rejects'
+        out = io.StringIO()
+        call_command('import_users', path, '--workers', '0', '--batch-size', '2', '--rejects', rejects,
+                     stdout=out, stderr=io.StringIO())
+
+        ann = User.objects.get(username='ann')
+        self.assertTrue(ann.check_password('secret'))
+        self.assertEqual(ann.bio, 'hi there')
+        self.assertEqual(User.objects.count(), 2)
+        self.assertIn("Imported 1 of 5 rows", out.getvalue())
+
+        with open(rejects, encoding='utf-8') as f:
+            reasons = {r['line']: r['reason'] for r in map(json.loads, f)}
+        self.assertEqual(reasons, {
+            3: 'invalid_email', 4: 'duplicate_email', 5: 'duplicate_username', 6: 'missing_password',
+        })
+
+    def test_jsonl_with_prehashed_passwords_and_a_process_pool(self):
+        rows = [
+            {"email": "dan@example.com", "username": "dan", "password_hash": make_password("pre")},
+            {"email": "eve@example.com", "username": "eve", "password": "plain"},
+            {"email": "fay@example.com", "username": "fay", "password_hash": "not a hash"},
+        ]
+        stream = io.StringIO("\n".join(json.dumps(row) for row in rows) + "\n{broken\n")
+
+        with UserImporter(batch_size=10, workers=2) as importer:
+            stats = importer.run(read_rows(stream, 'jsonl'))
+
+        self.assertEqual((stats.read, stats.created), (4, 2))
+        self.assertEqual(dict(stats.rejected), {'unknown_password_hash': 1, 'unparseable': 1})
+        self.assertTrue(User.objects.get(username='dan').check_password('pre'))
+        self.assertTrue(User.objects.get(username='eve').check_password('plain'))
@@ -0,0 +1,69 @@
+import io
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from accounts.tokens import RefreshToken, get_blacklist_cache
+
+User = get_user_model()
+
+
+class BlacklistCacheTests(APITestCase):
+
+    def setUp(self):
+        # A fresh cache per test that only refreshes when told to.
+        self.enterContext(self.settings(ACCOUNTS_BLACKLIST_CACHE={'refresh_interval': 3600, 'prune_interval': 3600}))
+        self.user = User.objects.create_user(email='test@example.com', username='test', password='test')
+        self.refresh_url = reverse('refresh-tokens')
+
+    def test_checks_after_the_first_load_skip_the_database(self):
+        first, second = str(RefreshToken.for_user(self.user)), str(RefreshToken.for_user(self.user))
+        RefreshToken(first)
+        with self.assertNumQueries(0):
+            RefreshToken(second)
+        self.assertEqual(get_blacklist_cache().stats(), {'checks': 2, 'blacklisted': 0, 'refreshes': 1, 'size': 0})
+
+    def test_rotated_tokens_are_rejected(self):
+        old = str(RefreshToken.for_user(self.user))
+
+        response = self.client.post(self.refresh_url, {'refresh': old}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('refresh', response.data)
+
+        response = self.client.post(self.refresh_url, {'refresh': old}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_blacklisting_missed_by_the_cache_still_rejects_reuse(self):
+        token = RefreshToken.for_user(self.user)
+        get_blacklist_cache().is_blacklisted('prime')
+        # Written by another worker: no signal reaches this process's cache.
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=OutstandingToken.objects.get(jti=token['jti']))])
+
+        response = self.client.post(self.refresh_url, {'refresh': str(token)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+
+class PruneTokensTests(APITestCase):
+
+    def test_only_expired_tokens_are_deleted(self):
+        user = User.objects.create_user(email='test@example.com', username='test', password='test')
+        now = aware_utcnow()
+        for i in range(5):
+            token = OutstandingToken.objects.create(user=user, jti=f'old-{i}', token='x', expires_at=now - timedelta(hours=1))
+            if i % 2:
+                BlacklistedToken.objects.create(token=token)
+        OutstandingToken.objects.create(user=user, jti='live', token='x', expires_at=now + timedelta(hours=1))
+
+        out = io.StringIO()
+        call_command('prune_tokens', '--batch-size', '2', stdout=out)
+
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), ['live'])
+        self.assertEqual(BlacklistedToken.objects.count(), 0)
+        self.assertIn("Deleted 5 expired tokens in 3 batches", out.getvalue())
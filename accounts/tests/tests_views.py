@@ -1,5 +1,8 @@
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
 
 class UserServiceTests(APITestCase):
@@ -46,3 +49,82 @@ class UserServiceTests(APITestCase):
         response = self.client.post(self.logout_url, {"refresh": refresh_token}, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+
+class CurrentProfileCacheTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.url = reverse('get-current-user')
+        self.user = get_user_model().objects.create_user(email='test@example.com', username='test', password='test')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_repeat_requests_skip_the_database(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data['username'], 'test')
+
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_saving_the_user_invalidates_the_cache(self):
+        etag = self.client.get(self.url)['ETag']
+        self.user.bio = 'hello'
+        self.user.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['bio'], 'hello')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_deleted_users_are_rejected(self):
+        self.client.get(self.url)
+        self.user.delete()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class UserLookupTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.url = reverse('user-lookup')
+        users = get_user_model().objects
+        self.user = users.create_user(email='me@example.com', username='alma', password='test')
+        users.create_user(email='a@example.com', username='Alice', password='test')
+        users.create_user(email='b@example.com', username='bob', first_name='Alan', password='test')
+        users.create_user(email='c@example.com', username='carol', last_name='Allen', password='test')
+        users.create_user(email='d@example.com', username='dave', password='test')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_username_prefixes_come_before_name_prefixes(self):
+        response = self.client.get(self.url, {'q': 'AL'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([user['username'] for user in response.data['results']], ['Alice', 'bob', 'carol'])
+        self.assertEqual(set(response.data['results'][0]),
+                         {'id', 'username', 'first_name', 'last_name', 'profile_pic'})
+
+    def test_short_queries_are_cached(self):
+        first = self.client.get(self.url, {'q': 'al', 'limit': 2})
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url, {'q': ' Al ', 'limit': 2})
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(len(second.data['results']), 2)
+
+        with self.assertNumQueries(2):
+            self.client.get(self.url, {'q': 'alic'})
+
+    def test_bad_parameters(self):
+        for params in ({}, {'q': ' '}, {'q': 'x' * 51}, {'q': 'al', 'limit': 0}):
+            self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST)
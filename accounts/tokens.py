@@ -0,0 +1,137 @@
+"""
+Refresh tokens whose blacklist check is served from memory.
+
+simplejwt checks a refresh token against the token_blacklist tables every
+time one is used (refresh, logout), which is one query per call. Almost
+every token checked is not on the blacklist. BlacklistCache keeps the jtis
+of blacklisted, unexpired tokens in memory. It picks up new rows with one
+``id > last seen`` query at most every ``refresh_interval`` seconds, however
+many tokens are checked. Tokens blacklisted in this process are added right
+away (see accounts/signals.py).
+
+Another worker's blacklisting can take up to ``refresh_interval`` seconds to
+show up here. A missed entry can't be used to reuse a token, though:
+blacklisting is the database's call. RefreshToken.blacklist() rejects a
+token that already had a blacklist row, and both rotation and logout
+blacklist the token they were given.
+
+Expired tokens can't pass verification anyway. They are dropped from the
+cache, and from the tables by ``python manage.py prune_tokens``.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from server import metrics
+
+
+class BlacklistCache:
+
+    def __init__(self, refresh_interval=1.0, prune_interval=60.0, clock=time.monotonic):
+        self.refresh_interval = refresh_interval
+        self.prune_interval = prune_interval
+        self.clock = clock
+        # jti -> expiry as a unix timestamp
+        self._jtis = {}
+        self._last_id = None
+        self._refreshed_at = None
+        self._pruned_at = None
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.blacklisted = 0
+        self.refreshes = 0
+
+    def is_blacklisted(self, jti):
+        self._maybe_refresh()
+        self.checks += 1
+        if jti in self._jtis:
+            self.blacklisted += 1
+            return True
+        return False
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._jtis[jti] = expires_at.timestamp()
+
+    def discard(self, jti):
+        with self._lock:
+            self._jtis.pop(jti, None)
+
+    def _maybe_refresh(self):
+        now = self.clock()
+        if self._refreshed_at is not None and now - self._refreshed_at < self.refresh_interval:
+            return
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock.
+            if self._refreshed_at is not None and now - self._refreshed_at < self.refresh_interval:
+                return
+            rows = BlacklistedToken.objects.order_by('id')
+            if self._last_id is None:
+                rows = rows.filter(token__expires_at__gt=aware_utcnow())
+            else:
+                rows = rows.filter(id__gt=self._last_id)
+            for row_id, jti, expires_at in rows.values_list('id', 'token__jti', 'token__expires_at'):
+                self._jtis[jti] = expires_at.timestamp()
+                self._last_id = row_id
+            if self._last_id is None:
+                self._last_id = 0
+            self._refreshed_at = now
+            self.refreshes += 1
+
+            if self._pruned_at is None or now - self._pruned_at >= self.prune_interval:
+                expired = time.time()
+                self._jtis = {jti: exp for jti, exp in self._jtis.items() if exp > expired}
+                self._pruned_at = now
+
+    def stats(self):
+        return {
+            'checks': self.checks,
+            'blacklisted': self.blacklisted,
+            'refreshes': self.refreshes,
+            'size': len(self._jtis),
+        }
+
+
+_blacklist_cache = None
+
+
+def get_blacklist_cache():
+    global _blacklist_cache
+
+    if _blacklist_cache is None:
+        _blacklist_cache = BlacklistCache(**settings.ACCOUNTS_BLACKLIST_CACHE)
+    return _blacklist_cache
+
+
+def _reset_blacklist_cache(setting, **kwargs):
+    global _blacklist_cache
+    if setting == 'ACCOUNTS_BLACKLIST_CACHE':
+        _blacklist_cache = None
+
+
+setting_changed.connect(_reset_blacklist_cache)
+metrics.register_stats(
+    'auth_blacklist_cache', 'Refresh token blacklist cache counters.', lambda: get_blacklist_cache().stats()
+)
+
+
+class RefreshToken(BaseRefreshToken):
+
+    def check_blacklist(self):
+        if get_blacklist_cache().is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        blacklisted, created = super().blacklist()
+        if not created:
+            # Blacklisted elsewhere since our check; the row is authoritative.
+            raise TokenError(_("Token is blacklisted"))
+        return blacklisted, created
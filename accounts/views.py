@@ -2,13 +2,19 @@ from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 from rest_framework.exceptions import ValidationError
 from django.db import IntegrityError, DatabaseError
-from .serializers import RegistrationSerializer, UserSerializer
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from server.metrics import TimedViewMixin
+from .cache import PROFILE_CACHE, get_profile
+from .lookup import InvalidQuery, lookup_users
+from .serializers import RegistrationSerializer
+from .tokens import RefreshToken
 
 
-class RegistrationView(APIView):
+class RegistrationView(TimedViewMixin, APIView):
     """
     POST /accounts/v1/register/  →  Create a new user and return JWT tokens.
 
@@ -54,7 +60,7 @@ class RegistrationView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
 
-class GetCurrentProfile(APIView):
+class GetCurrentProfile(TimedViewMixin, APIView):
     """
     GET /accounts/v1/whoami → Get the currently authenticated user
     
@@ -62,9 +68,15 @@ class GetCurrentProfile(APIView):
       1) No request body is required
       2) Checks which user is making the request
       3) If the provided token is valid, that user’s info is returned
-      4) Returns all user info with HTTP 200 on success
-      5) Handles errors properly to show where the issue is
+      4) Returns all user info with HTTP 200 on success, with an ETag
+      5) Returns an empty HTTP 304 if If-None-Match has the current ETag
+      6) Handles errors properly to show where the issue is
+
+    The user is taken from the token's claims instead of being loaded, and
+    the payload comes from a per-user cache (accounts/cache.py), so a cache
+    hit doesn't touch the database.
     """
+    authentication_classes = [JWTStatelessUserAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -75,9 +87,24 @@ class GetCurrentProfile(APIView):
                 return Response({
                     'error': 'User is not authenticated'
                 }, status=status.HTTP_403_FORBIDDEN)
-            
-            serializer = UserSerializer(user)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+
+            profile = get_profile(user.id)
+            if profile is None:
+                return Response({
+                    'error': 'User not found'
+                }, status=status.HTTP_401_UNAUTHORIZED)
+
+            etag, data = profile
+            if etag in parse_etags(request.headers.get('If-None-Match', '')):
+                PROFILE_CACHE.inc('not_modified')
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = Response(data, status=status.HTTP_200_OK)
+            response['ETag'] = etag
+            # Clients may keep the body but must check back every time.
+            response['Cache-Control'] = 'private, no-cache'
+            patch_vary_headers(response, ['Authorization'])
+            return response
         
         except Exception as e:
             return Response({
@@ -85,7 +112,7 @@ class GetCurrentProfile(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
         
-class LogoutView(APIView):
+class LogoutView(TimedViewMixin, APIView):
     """
     POST /accounts/v1/logout/ → Invalidate the user’s refresh token
 
@@ -120,3 +147,43 @@ class LogoutView(APIView):
                 {'error': 'Invalid or expired refresh token'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+
+
+class UserLookupView(TimedViewMixin, APIView):
+    """
+    GET /accounts/v1/users/lookup/?q=al → Find people to message
+
+    What this endpoint does:
+      1) Matches `q` (1-50 characters) against username, first and last name:
+         username prefixes first, then name prefixes, then fuzzy matches
+      2) Returns up to `limit` users (default 10, max 25) as id, username,
+         first_name, last_name and profile_pic, never the user asking
+      3) Serves short, hot prefixes from a cache (accounts/lookup.py)
+
+    Like whoami, the user is taken from the token's claims instead of being
+    loaded.
+    """
+    authentication_classes = [JWTStatelessUserAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    default_limit = 10
+    max_limit = 25
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return Response({
+                'error': 'limit must be a positive integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            users = lookup_users(request.query_params.get('q'), limit, exclude_id=request.user.id)
+        except InvalidQuery:
+            return Response({
+                'error': 'q must be 1 to 50 characters'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'results': users}, status=status.HTTP_200_OK)
@@ -0,0 +1,84 @@
+"""
+Throughput comparison between GroupConsumer (sync) and AsyncGroupConsumer.
+
+N clients join the room, one of them sends M messages, and we time how long
+it takes until every client has received every message. Kafka and Mongo are
+replaced by in-memory stand-ins and the room lookup is stubbed out, so only
+the consumer overhead is measured.
+
+    python -m benchmarks.bench_consumers --clients 50 --messages 200
+"""
+import argparse
+import asyncio
+import json
+import sys
+from types import SimpleNamespace
+from unittest import mock
+
+from benchmarks.common import IN_MEMORY_CHANNEL_LAYERS, Timer, setup_django
+
+
+async def run(consumer_class, clients, messages):
+    from channels.routing import URLRouter
+    from channels.testing import WebsocketCommunicator
+    from django.urls import path
+
+    application = URLRouter([path("ws/chat/", consumer_class.as_asgi())])
+    communicators = []
+    for user_id in range(clients):
+        communicator = WebsocketCommunicator(application, "/ws/chat/")
+        communicator.scope["user"] = SimpleNamespace(id=user_id)
+        await communicator.connect()
+        communicators.append(communicator)
+
+    sender = communicators[0]
+    payload = json.dumps({"message": "x" * 64})
+
+    async def drain(communicator):
+        for _ in range(messages):
+            await communicator.receive_from(timeout=30)
+
+    with Timer() as timer:
+        for _ in range(messages):
+            await sender.send_to(text_data=payload)
+        await asyncio.gather(*(drain(c) for c in communicators))
+
+    for communicator in communicators:
+        await communicator.disconnect()
+
+    return timer.elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test.utils import override_settings
+    from chats.consumers import AsyncGroupConsumer, GroupConsumer
+    from chats.models import Room
+    from chats.testing import FakeCollection
+
+    # The consumers print() on every disconnect; keep the report readable.
+    with override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, MONGO_DATABASE={'messages': FakeCollection()},
+                           CHAT_PRODUCER_BACKEND='chats.producer.InMemoryProducer',
+                           CHAT_RATE_LIMIT={'OPTIONS': {}, 'user': None, 'room': None}), \
+            mock.patch('chats.consumers.get_room_for_user', return_value=Room(name='chat', is_public=True)), \
+            mock.patch('builtins.print'):
+        for consumer_class in (GroupConsumer, AsyncGroupConsumer):
+            # Start each run with an empty room backlog, so joining clients
+            # don't get the previous run's messages replayed.
+            with override_settings(CHAT_BACKLOG_BACKEND='chats.backlog.InMemoryBacklog',
+                                   MONGO_DATABASE={'messages': FakeCollection()}):
+                elapsed = asyncio.run(run(consumer_class, args.clients, args.messages))
+            sys.stdout.write(
+                f"{consumer_class.__name__:<20} {elapsed:8.3f}s "
+                f"{args.messages / elapsed:10.1f} msgs/s in "
+                f"{args.messages * args.clients / elapsed:10.1f} msgs/s delivered\n"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Stock channel layer vs LocalFanoutChannelLayer for large-room broadcasts.
+
+Members of one group are spread over --nodes simulated processes sharing a
+single backend. For each layer we report how many messages the backend had
+to carry (with channels_redis every one of them is a per-channel push inside
+the group_send script) and the group_send -> last delivery latency.
+
+    python -m benchmarks.bench_fanout --members 5000 --nodes 4 --messages 50
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from benchmarks.common import percentile, setup_django
+
+
+class CountingLayer:
+    """
+    Wraps the backend and counts the per-channel messages it stores.
+    """
+
+    def __init__(self, layer):
+        self.layer = layer
+        self.pushed = 0
+        original_send = layer.send
+
+        async def counting_send(channel, message):
+            self.pushed += 1
+            await original_send(channel, message)
+
+        layer.send = counting_send
+
+
+async def run(nodes, members, messages):
+    latencies = []
+    channels = []
+    for i in range(members):
+        node = nodes[i % len(nodes)]
+        channel = await node.new_channel()
+        await node.group_add('chat_bench', channel)
+        channels.append((node, channel))
+
+    for _ in range(messages):
+        start = time.perf_counter()
+        await nodes[0].group_send('chat_bench', {'type': 'chat_message', 'message': 'x' * 64})
+        await asyncio.gather(*(node.receive(channel) for node, channel in channels))
+        latencies.append(time.perf_counter() - start)
+
+    return latencies
+
+
+def report(name, counter, latencies, messages):
+    sys.stdout.write(
+        f"{name:<24} backend msgs/send {counter.pushed / messages:9.1f}  "
+        f"p50 {percentile(latencies, 50) * 1000:8.2f}ms  "
+        f"p99 {percentile(latencies, 99) * 1000:8.2f}ms\n"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--members', type=int, default=2000)
+    parser.add_argument('--nodes', type=int, default=4)
+    parser.add_argument('--messages', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from channels.layers import InMemoryChannelLayer
+    from chats.layers import LocalFanoutChannelLayer
+
+    stock = InMemoryChannelLayer(capacity=args.messages + 1)
+    counter = CountingLayer(stock)
+    latencies = asyncio.run(run([stock], args.members, args.messages))
+    report('InMemoryChannelLayer', counter, latencies, args.messages)
+
+    shared = InMemoryChannelLayer()
+    counter = CountingLayer(shared)
+    nodes = []
+    for _ in range(args.nodes):
+        node = LocalFanoutChannelLayer(
+            inner={"BACKEND": "channels.layers.InMemoryChannelLayer"}, capacity=args.messages + 1
+        )
+        node.inner = shared
+        nodes.append(node)
+    latencies = asyncio.run(run(nodes, args.members, args.messages))
+    report(f'LocalFanout ({args.nodes} nodes)', counter, latencies, args.messages)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Room history page latency as the messages collection grows.
+
+Needs a real Mongo (the query planner is what is being measured). The
+benchmark fills a scratch collection in steps, creates the chat indexes,
+and at each size times the first page and a page deep into the history of
+one hot room, along with the documents the server examined for each of
+the two pages (from explain()). The deep page is the keyset query with the
+cursor's $or, so it shows whether that still seeks on the index. Flat
+latency and docs-examined ~= page size is the goal.
+
+    python -m benchmarks.bench_history --mongo-uri mongodb://localhost:27018/ \\
+        --sizes 100000 1000000 10000000
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import percentile, setup_django
+
+
+def fill(collection, start, stop, rooms):
+    base = datetime(2024, 1, 1)
+    batch = []
+    for i in range(start, stop):
+        batch.append({
+            '_id': f"bench-{i:012d}",
+            'room': f"room-{i % rooms}",
+            'message': 'x' * 80,
+            'sender_id': i % 5000,
+            'timestamp': base + timedelta(milliseconds=i * 10),
+        })
+        if len(batch) == 10000:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+
+def time_pages(collection, room, limit, depth, samples):
+    from chats.history import fetch_room_history
+
+    first, deep = [], []
+    deep_cursor = None
+    for _ in range(samples):
+        start = time.perf_counter()
+        _, cursor = fetch_room_history(collection, room, limit)
+        first.append(time.perf_counter() - start)
+
+        for _ in range(depth):
+            if cursor is None:
+                break
+            _, cursor = fetch_room_history(collection, room, limit, cursor)
+        if cursor is not None:
+            deep_cursor = cursor
+            start = time.perf_counter()
+            fetch_room_history(collection, room, limit, cursor)
+            deep.append(time.perf_counter() - start)
+    return first, deep, deep_cursor
+
+
+def docs_examined(collection, room, limit, cursor=None):
+    from chats.history import history_query
+
+    plan = history_query(collection, room, limit, cursor).explain()
+    return plan['executionStats']['totalDocsExamined']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mongo-uri', required=True)
+    parser.add_argument('--database', default='chat_bench')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--rooms', type=int, default=1000)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--depth', type=int, default=20, help="Pages to walk back for the deep-page timing.")
+    parser.add_argument('--samples', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from pymongo import MongoClient
+    from chats.indexes import ensure_indexes
+
+    collection = MongoClient(args.mongo_uri)[args.database]['messages']
+    collection.drop()
+    ensure_indexes(collection)
+
+    size = 0
+    for target in sorted(args.sizes):
+        fill(collection, size, target, args.rooms)
+        size = target
+        room = f"room-{random.randrange(args.rooms)}"
+        first, deep, deep_cursor = time_pages(collection, room, args.limit, args.depth, args.samples)
+        deep_examined = docs_examined(collection, room, args.limit, deep_cursor) if deep_cursor else '-'
+        sys.stdout.write(
+            f"{size:>12,} docs  first page p50 {percentile(first, 50) * 1000:7.2f}ms "
+            f"p99 {percentile(first, 99) * 1000:7.2f}ms  "
+            f"page {args.depth} p50 {percentile(deep, 50) * 1000:7.2f}ms  "
+            f"docs examined first/page {args.depth} "
+            f"{docs_examined(collection, room, args.limit)}/{deep_examined}\n"
+        )
+
+    collection.drop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+"""
+End-to-end WebSocket load test for server.asgi:application.
+
+Authenticated clients connect through JWTAuthMiddlewareHeader and the room
+routing. For each --room-sizes entry, that many clients join a private room,
+and random members send --messages at --rate. Every message carries its
+send time, so each delivery gives one fan-out latency sample.
+
+The report covers connect rate, messages sent and frames delivered per
+second, and p50/p99/p999 latency for each room size. It is printed and also
+written as JSON to --output, so runs can be compared.
+
+In-process (the default): the real ASGI application runs with the in-memory
+channel layer, InMemoryProducer and a FakeCollection, against a throwaway
+test database. Rate limits are turned off, so they don't cap the load.
+
+    python -m benchmarks.bench_load --room-sizes 10,100,1000 --messages 200
+
+Against a running Daphne, with autobahn's asyncio client. Bench users and
+rooms are created in the configured database, so run the benchmark with the
+server's settings (same SECRET_KEY and database):
+
+    daphne server.asgi:application &
+    python -m benchmarks.bench_load --url ws://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from unittest import mock
+
+from benchmarks.common import IN_MEMORY_CHANNEL_LAYERS, Timer, percentile, setup_django
+
+
+class InProcessClient:
+    """
+    A client speaking to the ASGI application through WebsocketCommunicator.
+    """
+
+    def __init__(self, application, path, token):
+        from channels.testing import WebsocketCommunicator
+
+        self.communicator = WebsocketCommunicator(
+            application, path, headers=[(b'authorization', f'Bearer {token}'.encode())]
+        )
+
+    async def connect(self, timeout):
+        connected, _ = await self.communicator.connect(timeout=timeout)
+        return connected
+
+    async def send(self, text):
+        await self.communicator.send_to(text_data=text)
+
+    async def receive(self, timeout):
+        return await self.communicator.receive_from(timeout=timeout)
+
+    async def close(self):
+        await self.communicator.disconnect()
+
+
+class DaphneClient:
+    """
+    The same interface over a real socket, using autobahn (a Daphne
+    dependency) so the benchmark needs nothing extra installed.
+    """
+
+    def __init__(self, url, path, token):
+        self.url = url.rstrip('/') + path
+        self.token = token
+        self.frames = asyncio.Queue()
+        self.protocol = None
+
+    async def connect(self, timeout):
+        from urllib.parse import urlparse
+
+        from autobahn.asyncio.websocket import WebSocketClientFactory, WebSocketClientProtocol
+
+        opened = asyncio.get_running_loop().create_future()
+        frames = self.frames
+
+        class Protocol(WebSocketClientProtocol):
+
+            def onOpen(self):
+                if not opened.done():
+                    opened.set_result(True)
+
+            def onMessage(self, payload, is_binary):
+                frames.put_nowait(payload.decode())
+
+            def onClose(self, was_clean, code, reason):
+                if not opened.done():
+                    opened.set_result(False)
+
+        factory = WebSocketClientFactory(self.url, headers={'Authorization': f'Bearer {self.token}'})
+        factory.protocol = Protocol
+        parsed = urlparse(self.url)
+        _, self.protocol = await asyncio.get_running_loop().create_connection(
+            factory, parsed.hostname, parsed.port or 80
+        )
+        return await asyncio.wait_for(opened, timeout)
+
+    async def send(self, text):
+        self.protocol.sendMessage(text.encode(), isBinary=False)
+
+    async def receive(self, timeout):
+        return await asyncio.wait_for(self.frames.get(), timeout)
+
+    async def close(self):
+        self.protocol.sendClose(1000)
+
+
+def create_fixtures(room_sizes, shards):
+    """
+    Users with access tokens, and one private room per size with the first
+    ``size`` users as members. Safe to run twice against the same database.
+    """
+    from django.contrib.auth import get_user_model
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from chats.models import Room, RoomMembership
+
+    User = get_user_model()
+    count = max(room_sizes)
+    User.objects.bulk_create(
+        [User(email=f'loadbench-{i}@example.com', username=f'loadbench-{i}', password='!') for i in range(count)],
+        ignore_conflicts=True,
+    )
+    users = list(User.objects.filter(username__startswith='loadbench-').order_by('id')[:count])
+    tokens = [str(AccessToken.for_user(user)) for user in users]
+
+    for size in room_sizes:
+        room, _ = Room.objects.update_or_create(
+            name=f'loadbench-{size}', defaults={'is_public': False, 'shard_count': shards}
+        )
+        RoomMembership.objects.bulk_create(
+            [RoomMembership(room=room, user=user) for user in users[:size]], ignore_conflicts=True
+        )
+    return tokens
+
+
+async def connect_all(make_client, path, tokens, concurrency, timeout):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def connect(token):
+        async with semaphore:
+            client = make_client(path, token)
+            return client if await client.connect(timeout) else None
+
+    with Timer() as timer:
+        clients = await asyncio.gather(*(connect(token) for token in tokens))
+    return [c for c in clients if c is not None], timer.elapsed
+
+
+async def run_room(make_client, size, tokens, args):
+    path = f'/ws/chat/loadbench-{size}/'
+    clients, connect_time = await connect_all(make_client, path, tokens[:size], args.connect_concurrency, args.timeout)
+
+    latencies = []
+    counts = {'delivered': 0, 'gaps': 0}
+    expected = args.messages
+
+    async def read(client):
+        seen = 0
+        while seen < expected:
+            try:
+                text = await client.receive(args.timeout)
+            except asyncio.TimeoutError:
+                return
+            received = time.perf_counter()
+            frame = json.loads(text)
+            if frame.get('type') == 'gap':
+                counts['gaps'] += 1
+                seen += frame['count']
+                continue
+            message = frame.get('message')
+            if isinstance(message, dict) and 'sent' in message:
+                latencies.append(received - message['sent'])
+                counts['delivered'] += 1
+                seen += 1
+
+    readers = [asyncio.ensure_future(read(client)) for client in clients]
+    interval = 1 / args.rate if args.rate else 0
+
+    with Timer() as timer:
+        for i in range(args.messages):
+            sender = random.choice(clients)
+            await sender.send(json.dumps({'message': {'sent': time.perf_counter(), 'n': i}}))
+            await asyncio.sleep(interval)
+        await asyncio.gather(*readers)
+
+    await asyncio.gather(*(client.close() for client in clients))
+
+    return {
+        'room_size': size,
+        'clients_connected': len(clients),
+        'connect_seconds': connect_time,
+        'connects_per_second': len(clients) / connect_time if connect_time else 0.0,
+        'messages_sent': args.messages,
+        'frames_expected': args.messages * len(clients),
+        'frames_delivered': counts['delivered'],
+        'gap_frames': counts['gaps'],
+        'elapsed_seconds': timer.elapsed,
+        'messages_per_second': args.messages / timer.elapsed,
+        'frames_per_second': counts['delivered'] / timer.elapsed,
+        'latency_ms': {
+            'p50': percentile(latencies, 50) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'p999': percentile(latencies, 99.9) * 1000,
+            'max': max(latencies, default=0.0) * 1000,
+        },
+    }
+
+
+async def run(make_client, tokens, args):
+    results = []
+    for size in args.room_sizes:
+        result = await run_room(make_client, size, tokens, args)
+        latency = result['latency_ms']
+        sys.stdout.write(
+            f"room {size:>6}  connect {result['connects_per_second']:9.1f}/s  "
+            f"in {result['messages_per_second']:8.1f} msgs/s  out {result['frames_per_second']:10.1f} frames/s  "
+            f"p50 {latency['p50']:8.2f}ms  p99 {latency['p99']:8.2f}ms  p999 {latency['p999']:8.2f}ms  "
+            f"delivered {result['frames_delivered']}/{result['frames_expected']}\n"
+        )
+        results.append(result)
+    return results
+
+
+def in_process(args):
+    from django.db import connection
+    from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+    from chats.testing import FakeCollection
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        tokens = create_fixtures(args.room_sizes, args.shards)
+        with override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+                               CHAT_PRODUCER_BACKEND='chats.producer.InMemoryProducer',
+                               CHAT_BACKLOG_BACKEND='chats.backlog.InMemoryBacklog',
+                               CHAT_RATE_LIMIT={'OPTIONS': {}, 'user': None, 'room': None},
+                               MONGO_DATABASE={'messages': FakeCollection()}), \
+                mock.patch('builtins.print'):
+            from server.asgi import application
+
+            return asyncio.run(run(lambda path, token: InProcessClient(application, path, token), tokens, args))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def against_server(args):
+    tokens = create_fixtures(args.room_sizes, args.shards)
+    return asyncio.run(run(lambda path, token: DaphneClient(args.url, path, token), tokens, args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--room-sizes', type=lambda s: [int(n) for n in s.split(',')], default=[10, 100, 1000])
+    parser.add_argument('--messages', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=200, help='messages per second, 0 for as fast as possible')
+    parser.add_argument('--shards', type=int, default=1, help='shard_count of the bench rooms')
+    parser.add_argument('--connect-concurrency', type=int, default=200)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--url', help='ws:// URL of a running server; in-process when omitted')
+    parser.add_argument('--output', default='bench_load.json')
+    args = parser.parse_args()
+
+    setup_django()
+    results = against_server(args) if args.url else in_process(args)
+
+    report = {
+        'benchmark': 'bench_load',
+        'target': args.url or 'in-process',
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'parameters': {
+            'messages': args.messages,
+            'rate': args.rate,
+            'shards': args.shards,
+            'connect_concurrency': args.connect_concurrency,
+        },
+        'rooms': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    sys.stdout.write(f"wrote {args.output}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Message search latency as the messages collection grows.
+
+Needs a real Mongo (the text index is what is being measured). The benchmark
+fills a scratch collection in steps with a synthetic corpus: messages of 5
+to 15 words drawn from a Zipf-distributed vocabulary, spread over --rooms
+rooms and 5000 senders. It then creates the chat indexes and, at each size,
+times searches in random rooms for common words, rare words, two-word
+queries, with a sender filter, and a second page. It also reports the
+documents the server examined for a common word (from explain()). The target
+is a p99 under 100ms that stays flat as the collection grows, since a search
+only reads one room's postings.
+
+    python -m benchmarks.bench_search --mongo-uri mongodb://localhost:27018/ \\
+        --sizes 1000000 10000000 --rooms 10000
+"""
+import argparse
+import itertools
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import percentile, setup_django
+
+
+VOCABULARY = [f"w{n}" for n in range(5000)]
+CUM_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(VOCABULARY) + 1)))
+
+
+def words(rng, count):
+    return rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=count)
+
+
+def fill(collection, start, stop, rooms, seed=0):
+    rng = random.Random(seed + start)
+    base = datetime(2024, 1, 1)
+    batch = []
+    for i in range(start, stop):
+        batch.append({
+            '_id': f"bench-{i:012d}",
+            'room': f"room-{i % rooms}",
+            'message': ' '.join(words(rng, rng.randint(5, 15))),
+            'sender_id': rng.randrange(5000),
+            'timestamp': base + timedelta(milliseconds=i * 10),
+        })
+        if len(batch) == 10000:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+
+def time_searches(collection, rooms, limit, samples):
+    from chats.search import search_messages
+
+    rng = random.Random(1)
+    queries = {
+        'common word': lambda: {'query': VOCABULARY[rng.randrange(10)]},
+        'rare word': lambda: {'query': VOCABULARY[rng.randrange(1000, 5000)]},
+        'two words': lambda: {'query': ' '.join(words(rng, 2))},
+        'by sender': lambda: {'query': VOCABULARY[rng.randrange(10)], 'sender_id': rng.randrange(5000)},
+    }
+    timings = {name: [] for name in [*queries, 'second page']}
+    for _ in range(samples):
+        room = f"room-{rng.randrange(rooms)}"
+        for name, make in queries.items():
+            params = make()
+            start = time.perf_counter()
+            _, cursor = search_messages(collection, room, params['query'], limit,
+                                        sender_id=params.get('sender_id'))
+            timings[name].append(time.perf_counter() - start)
+
+            if name == 'common word' and cursor is not None:
+                start = time.perf_counter()
+                search_messages(collection, room, params['query'], limit, cursor=cursor)
+                timings['second page'].append(time.perf_counter() - start)
+    return timings
+
+
+def docs_examined(collection, room):
+    plan = collection.find({'room': room, '$text': {'$search': VOCABULARY[0]}}).explain()
+    return plan['executionStats']['totalDocsExamined']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mongo-uri', required=True)
+    parser.add_argument('--database', default='chat_bench')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--rooms', type=int, default=1000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--samples', type=int, default=100)
+    args = parser.parse_args()
+
+    setup_django()
+    from pymongo import MongoClient
+    from chats.indexes import ensure_indexes
+
+    collection = MongoClient(args.mongo_uri)[args.database]['messages']
+    collection.drop()
+    ensure_indexes(collection)
+
+    size = 0
+    for target in sorted(args.sizes):
+        fill(collection, size, target, args.rooms)
+        size = target
+        timings = time_searches(collection, args.rooms, args.limit, args.samples)
+        sys.stdout.write(f"{size:>12,} docs, {size // args.rooms:,} per room, "
+                         f"docs examined for a common word {docs_examined(collection, 'room-0')}\n")
+        for name, samples in timings.items():
+            sys.stdout.write(f"  {name:<12} p50 {percentile(samples, 50) * 1000:7.2f}ms "
+                             f"p99 {percentile(samples, 99) * 1000:7.2f}ms\n")
+
+    collection.drop()
+
+
+if __name__ == '__main__':
+    main()
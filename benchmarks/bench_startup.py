@@ -0,0 +1,46 @@
+"""
+Cold-start regression check for server.asgi:application.
+
+Starts --runs fresh interpreters that each load settings, set Django up and
+import server.asgi. It fails (exit status 1) if the median wall time is over
+--budget-ms, or if one of the deferred stacks (Kafka, Mongo, Redis, dotenv)
+was imported at start-up. Run it in CI on the same kind of machine each
+time; the budget is wall time, not CPU time.
+
+    python -m benchmarks.bench_startup --runs 7 --budget-ms 1500
+
+Use ``python manage.py profile_startup`` to see where the time goes.
+"""
+import argparse
+import sys
+
+from benchmarks.common import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=1500)
+    args = parser.parse_args()
+
+    setup_django()
+    from server.startup import measure
+
+    report = measure(args.runs, importtime=False)
+    total_ms = report['total'] * 1000
+    phases = '  '.join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in report['phases'].items())
+    sys.stdout.write(f"cold start {total_ms:.0f}ms (median of {report['runs']}, budget {args.budget_ms:.0f}ms)\n")
+    sys.stdout.write(f"  {phases}\n")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"cold start {total_ms:.0f}ms is over the {args.budget_ms:.0f}ms budget")
+    if report['deferred_loaded']:
+        failures.append(f"imported at start-up: {', '.join(report['deferred_loaded'])}")
+    for failure in failures:
+        sys.stdout.write(f"FAIL: {failure}\n")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+User typeahead latency at a million users.
+
+Needs a real PostgreSQL with the accounts migrations applied (the pattern
+and trigram indexes are what is being measured), e.g. a scratch database:
+
+    POSTGRES_DB=lookup_bench python manage.py migrate
+    POSTGRES_DB=lookup_bench python -m benchmarks.bench_user_lookup --users 1000000
+
+Synthetic users (username, first and last name built from syllables, with
+unusable passwords so nothing is hashed) are added until there are
+--users of them. The benchmark then times find_users() uncached for one- to
+two-character prefixes (the hot ones), longer prefixes and misspelt names
+that only the fuzzy step finds, then lookup_users() for cached prefixes.
+It also prints the plan of the username prefix query, which should be an
+index scan of user_username_prefix.
+"""
+import argparse
+import random
+import sys
+import time
+
+from benchmarks.common import percentile, setup_django
+
+
+SYLLABLES = ['al', 'an', 'be', 'ca', 'da', 'el', 'fa', 'ge', 'ha', 'is', 'jo', 'ka', 'li', 'ma',
+             'ne', 'ol', 'pa', 'ri', 'sa', 'ta', 'ul', 'va', 'wi', 'ya', 'zo']
+
+
+def name(rng, parts):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(parts))
+
+
+def fill(target, batch_size=10000, seed=0):
+    from django.contrib.auth import get_user_model
+
+    User = get_user_model()
+    start = User.objects.filter(email__endswith='@lookup.bench').count()
+    rng = random.Random(seed + start)
+    for offset in range(start, target, batch_size):
+        User.objects.bulk_create([
+            User(
+                email=f"user{i}@lookup.bench",
+                username=f"{name(rng, 3)}{i}",
+                first_name=name(rng, 2).capitalize(),
+                last_name=name(rng, 3).capitalize(),
+                password='!',
+            )
+            for i in range(offset, min(offset + batch_size, target))
+        ])
+        sys.stdout.write(f"\r{min(offset + batch_size, target):,} users")
+        sys.stdout.flush()
+    sys.stdout.write("\n")
+
+
+def misspell(rng, word):
+    i = rng.randrange(len(word))
+    return word[:i] + rng.choice('aeiouxz') + word[i + 1:]
+
+
+def time_queries(function, queries, **kwargs):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        function(query, **kwargs)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.db.models.functions import Upper
+    from accounts.lookup import find_users, lookup_cache, lookup_users
+
+    if connection.vendor != 'postgresql':
+        sys.exit("bench_user_lookup needs PostgreSQL")
+    fill(args.users)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE accounts_customuser')
+
+    rng = random.Random(1)
+    shapes = {
+        '1-2 chars': [rng.choice(SYLLABLES)[:rng.randint(1, 2)] for _ in range(args.samples)],
+        '4-6 chars': [name(rng, rng.randint(2, 3)) for _ in range(args.samples)],
+        'misspelt': [misspell(rng, name(rng, 3)) for _ in range(args.samples)],
+    }
+    for shape, queries in shapes.items():
+        timings = time_queries(find_users, queries, limit=args.limit + 1)
+        sys.stdout.write(f"{shape:<10} uncached  p50 {percentile(timings, 50) * 1000:7.2f}ms "
+                         f"p99 {percentile(timings, 99) * 1000:7.2f}ms\n")
+
+    lookup_cache().clear()
+    hot = shapes['1-2 chars']
+    time_queries(lookup_users, hot, limit=args.limit)
+    timings = time_queries(lookup_users, hot, limit=args.limit)
+    sys.stdout.write(f"{'1-2 chars':<10} cached    p50 {percentile(timings, 50) * 1000:7.2f}ms "
+                     f"p99 {percentile(timings, 99) * 1000:7.2f}ms\n")
+
+    plan = (
+        get_user_model().objects.filter(username__istartswith='al')
+        .order_by(Upper('username'))
+        .values_list('id')[:args.limit]
+        .explain()
+    )
+    sys.stdout.write(f"username prefix plan:\n{plan}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Encoding cost per fan-out and bytes on the wire, per codec.
+
+For one message delivered to --recipients connections in a process this
+compares:
+
+* json, per recipient: json.dumps in every recipient (the old chat_message)
+* json, shared: the sender's text reused by every recipient
+* msgpack, shared: one cached binary encoding per process
+
+It reports CPU time per fan-out (process time), and bytes per frame for
+each payload size. msgpack rows are skipped if the package isn't installed.
+
+    python -m benchmarks.bench_wire --recipients 1000 --sizes 64,1024,16384
+"""
+import argparse
+import json
+import random
+import string
+import sys
+import time
+
+from benchmarks.common import setup_django
+
+
+def chat_text(rng, size):
+    """
+    Word-like text, so compression ratios are closer to real chat than a
+    repeated string would give.
+    """
+    words = []
+    while sum(len(w) + 1 for w in words) < size:
+        words.append(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9))))
+    return ' '.join(words)[:size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--recipients', type=int, default=1000)
+    parser.add_argument('--sizes', type=lambda s: [int(n) for n in s.split(',')], default=[64, 1024, 16384])
+    parser.add_argument('--messages', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from chats import wire
+    from chats.consumers import chat_frame
+
+    rng = random.Random(0)
+    for size in args.sizes:
+        events = []
+        for seq in range(args.messages):
+            frame = {"message": chat_text(rng, size), "seq": seq}
+            events.append({"type": "chat_message", "sender_id": 1, "text": json.dumps(frame), **frame})
+        # Every recipient gets its own copy of the event, as from the channel layer.
+        deliveries = [[dict(event) for _ in range(args.recipients)] for event in events]
+
+        def per_recipient_json():
+            for copies in deliveries:
+                for event in copies:
+                    json.dumps(chat_frame(event))
+
+        def shared_json():
+            for copies in deliveries:
+                for event in copies:
+                    wire.OutgoingFrame(chat_frame(event), event["text"]).text
+
+        def shared_msgpack():
+            for copies in deliveries:
+                for event in copies:
+                    wire.OutgoingFrame(chat_frame(event), event["text"]).binary()
+
+        rows = [('json, per recipient', per_recipient_json, lambda e: len(e["text"].encode())),
+                ('json, shared', shared_json, lambda e: len(e["text"].encode()))]
+        if wire.msgpack is not None:
+            rows.append(('msgpack, shared', shared_msgpack,
+                         lambda e: len(wire.pack(chat_frame(e)))))
+
+        for name, encode_all, frame_bytes in rows:
+            start = time.process_time()
+            encode_all()
+            cpu = (time.process_time() - start) / len(events)
+            sys.stdout.write(
+                f"payload {size:>6}B  {name:<20} cpu/fan-out {cpu * 1000:8.3f}ms  "
+                f"bytes/frame {frame_bytes(events[0]):>7}\n"
+            )
+
+
+if __name__ == '__main__':
+    main()
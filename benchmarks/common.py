@@ -0,0 +1,42 @@
+"""
+Shared setup for the benchmark scripts in this directory.
+
+Benchmarks run in-process against the real consumers with the in-memory
+channel layer, so they don't need Redis, Kafka or Mongo to be running.
+Run them from the repository root, e.g.:
+
+    python -m benchmarks.bench_consumers
+"""
+import os
+import time
+
+import django
+
+
+IN_MEMORY_CHANNEL_LAYERS = {
+    "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+}
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
+    os.environ.setdefault('DJANGO_SECRET_KEY', 'benchmark-only')
+    django.setup()
+
+
+class Timer:
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
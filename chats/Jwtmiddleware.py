@@ -1,23 +1,49 @@
+import time
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.tokens import UntypedToken
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from django.contrib.auth import get_user_model
 from jwt import InvalidTokenError
+from server import metrics
+from .token_cache import TokenUserCache
 
 User = get_user_model()
 jwt_auth = JWTAuthentication()
+token_user_cache = TokenUserCache(**settings.CHAT_TOKEN_CACHE)
+
+HANDSHAKE_AUTH = metrics.histogram(
+    'ws_handshake_auth_seconds', 'Time to resolve the user of a WebSocket handshake.', ('result',)
+)
+metrics.register_stats('ws_token_cache', 'JWT-to-user cache counters.', token_user_cache.stats)
+
 
 @database_sync_to_async
-def get_user_from_token(token):
+def resolve_user_from_token(token):
     try:
         validated_token = UntypedToken(token)
         user = jwt_auth.get_user(validated_token)
+        token_user_cache.set(token, validated_token, user)
         return user
-    except InvalidTokenError:
+    # get_user() raises AuthenticationFailed for deleted and inactive users.
+    except (InvalidTokenError, TokenError, InvalidToken, AuthenticationFailed):
         return AnonymousUser()
 
 
+async def get_user_from_token(token):
+    """
+    Cached users are returned without leaving the event loop; only a miss
+    pays for signature verification and the database lookup.
+    """
+    user = token_user_cache.get(token)
+    if user is not None:
+        return user
+    return await resolve_user_from_token(token)
+
+
 class JWTAuthMiddlewareHeader:
     """
     JWT Auth Middleware that extracts token from 'Authorization' header
@@ -34,6 +60,9 @@ class JWTAuthMiddlewareHeader:
 
         if auth_header.startswith("Bearer "):
             token = auth_header.split("Bearer ")[1]
+            start = time.perf_counter()
             scope["user"] = await get_user_from_token(token)
+            result = 'authenticated' if scope["user"].is_authenticated else 'rejected'
+            HANDSHAKE_AUTH.observe(time.perf_counter() - start, result)
 
         return await self.app(scope, receive, send)
@@ -1,3 +1,15 @@
 from django.contrib import admin
+from .models import Room, RoomMembership
 
-# Register your models here.
+
+class RoomMembershipInline(admin.TabularInline):
+    model = RoomMembership
+    raw_id_fields = ['user']
+    extra = 0
+
+
+@admin.register(Room)
+class RoomAdmin(admin.ModelAdmin):
+    list_display = ['name', 'is_public', 'shard_count', 'created_at']
+    search_fields = ['name']
+    inlines = [RoomMembershipInline]
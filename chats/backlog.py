@@ -0,0 +1,221 @@
+"""
+Per-room ring buffer of recent messages for join backlog and reconnect replay.
+
+Every chat message gets a per-room sequence number and its outbound frame is
+kept in a bounded buffer. A client joining without state gets the last few
+messages from the buffer; a client reconnecting with ``?last_seq=N`` gets
+just the messages after N. Only when that gap reaches further back than the
+buffer does the replay fall back to a Mongo query on (room, seq).
+
+Two backends, chosen with settings.CHAT_BACKLOG_BACKEND:
+
+* InMemoryBacklog keeps counters and buffers per process. Buffers are also
+  fed from the messages each process delivers, but sequence numbers are
+  only unique when one process serves a room, so it is meant for single
+  process deployments.
+* RedisBacklog allocates sequence numbers with INCR and keeps each buffer
+  in a capped sorted set, so all workers share them.
+"""
+import json
+import threading
+from collections import deque
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+from . import mongo
+from .history import latest_messages, latest_seq, messages_after
+
+
+def requested_last_seq(scope):
+    """
+    The ``last_seq`` query parameter of a reconnecting client, if any.
+    """
+    values = parse_qs(scope.get('query_string', b'').decode()).get('last_seq')
+    try:
+        return int(values[0]) if values else None
+    except ValueError:
+        return None
+
+
+def _messages():
+    return mongo.get_collection('messages')
+
+
+async def stored_latest_seq(room_name):
+    return await mongo.run(latest_seq, _messages(), room_name)
+
+
+class InMemoryBacklog:
+
+    def __init__(self, size=200):
+        self.size = size
+        self._buffers = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    async def next_seq(self, room_name):
+        if room_name not in self._counters:
+            # After a restart, carry on from what has been persisted.
+            seed = await stored_latest_seq(room_name)
+            with self._lock:
+                self._counters.setdefault(room_name, seed)
+        with self._lock:
+            self._counters[room_name] += 1
+            return self._counters[room_name]
+
+    async def append(self, room_name, seq, frame):
+        self.observe(room_name, seq, frame)
+
+    def observe(self, room_name, seq, frame):
+        """
+        Record a delivered frame. Cheap enough to call for every recipient:
+        the common case is a comparison with the newest buffered seq.
+        """
+        with self._lock:
+            buffer = self._buffers.get(room_name)
+            if buffer is None:
+                buffer = self._buffers[room_name] = deque(maxlen=self.size)
+
+            if not buffer or seq > buffer[-1][0]:
+                buffer.append((seq, frame))
+            elif seq >= buffer[0][0] and all(s != seq for s, _ in buffer):
+                # Concurrent senders can deliver slightly out of order.
+                entries = sorted(list(buffer) + [(seq, frame)], key=lambda entry: entry[0])
+                buffer.clear()
+                buffer.extend(entries[-self.size:])
+
+            if room_name in self._counters and seq > self._counters[room_name]:
+                self._counters[room_name] = seq
+
+    async def since(self, room_name, last_seq):
+        """
+        Frames after ``last_seq``, or None if the buffer doesn't reach back
+        that far.
+        """
+        with self._lock:
+            buffer = self._buffers.get(room_name)
+            if not buffer or buffer[0][0] > last_seq + 1:
+                return None
+            return [frame for seq, frame in buffer if seq > last_seq]
+
+    async def recent(self, room_name, count):
+        with self._lock:
+            buffer = self._buffers.get(room_name)
+            if not buffer:
+                return None
+            return [frame for _, frame in list(buffer)[-count:]]
+
+
+# KEYS[1] is the room's counter, ARGV[1] the latest seq already stored, or ''
+# when it hasn't been looked up. A missing counter is seeded and incremented
+# in one step, so no worker can be handed a seq from before the seed; without
+# a seed the script returns nil and the caller looks it up.
+NEXT_SEQ_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    if ARGV[1] == '' then
+        return false
+    end
+    redis.call('SET', KEYS[1], ARGV[1], 'NX')
+end
+return redis.call('INCR', KEYS[1])
+"""
+
+
+class RedisBacklog:
+
+    def __init__(self, url, size=200):
+        import redis.asyncio as redis
+
+        self.size = size
+        self.redis = redis.from_url(url)
+        self.next_seq_script = self.redis.register_script(NEXT_SEQ_SCRIPT)
+
+    @staticmethod
+    def _keys(room_name):
+        return f"chat:seq:{room_name}", f"chat:backlog:{room_name}"
+
+    async def next_seq(self, room_name):
+        seq_key, _ = self._keys(room_name)
+        seq = await self.next_seq_script(keys=[seq_key], args=[''])
+        if seq is None:
+            # A fresh (or flushed) counter: skip past anything already stored.
+            seed = await stored_latest_seq(room_name)
+            seq = await self.next_seq_script(keys=[seq_key], args=[seed or 0])
+        return seq
+
+    async def append(self, room_name, seq, frame):
+        _, backlog_key = self._keys(room_name)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(backlog_key, {json.dumps(frame): seq})
+            pipe.zremrangebyrank(backlog_key, 0, -self.size - 1)
+            await pipe.execute()
+
+    def observe(self, room_name, seq, frame):
+        # The sender already appended it to the shared buffer.
+        pass
+
+    async def since(self, room_name, last_seq):
+        _, backlog_key = self._keys(room_name)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zrange(backlog_key, 0, 0, withscores=True)
+            pipe.zrangebyscore(backlog_key, f"({last_seq}", '+inf')
+            oldest, frames = await pipe.execute()
+        if not oldest or oldest[0][1] > last_seq + 1:
+            return None
+        return [json.loads(frame) for frame in frames]
+
+    async def recent(self, room_name, count):
+        _, backlog_key = self._keys(room_name)
+        frames = await self.redis.zrange(backlog_key, -count, -1)
+        return [json.loads(frame) for frame in frames] or None
+
+
+async def replay_frames(room_name, last_seq):
+    """
+    Frames to send a client that just joined ``room_name``: the gap after
+    ``last_seq`` for a reconnect, otherwise the most recent messages.
+    """
+    backlog = get_backlog()
+    options = settings.CHAT_BACKLOG
+
+    if last_seq is None:
+        frames = await backlog.recent(room_name, options['join_count'])
+        if frames is None:
+            frames = await mongo.run(latest_messages, _messages(), room_name, options['join_count'])
+            for frame in frames:
+                backlog.observe(room_name, frame['seq'], frame)
+        return frames
+
+    frames = await backlog.since(room_name, last_seq)
+    if frames is None:
+        frames = await mongo.run(messages_after, _messages(), room_name, last_seq, options['max_replay'])
+        # The newest messages may not have been persisted yet; the buffer
+        # still has them.
+        newest = frames[-1]['seq'] if frames else last_seq
+        buffered = await backlog.recent(room_name, options['max_replay']) or []
+        frames = (frames + [frame for frame in buffered if frame['seq'] > newest])[-options['max_replay']:]
+    return frames
+
+
+_backlog = None
+
+
+def get_backlog():
+    global _backlog
+
+    if _backlog is None:
+        backend = import_string(settings.CHAT_BACKLOG_BACKEND)
+        _backlog = backend(**settings.CHAT_BACKLOG['OPTIONS'])
+    return _backlog
+
+
+def _reset_backlog(setting, **kwargs):
+    global _backlog
+    if setting in ('CHAT_BACKLOG_BACKEND', 'CHAT_BACKLOG'):
+        _backlog = None
+
+
+setting_changed.connect(_reset_backlog)
@@ -1,77 +1,429 @@
+import asyncio
 import json
-from channels.generic.websocket import WebsocketConsumer
-from asgiref.sync import async_to_sync
-from kafka import KafkaProducer
-from django.conf import settings
+from channels.db import database_sync_to_async
+from channels.generic.websocket import WebsocketConsumer, AsyncWebsocketConsumer
+from asgiref.sync import async_to_sync, sync_to_async
 from datetime import datetime
+from uuid import uuid4
+from django.conf import settings
+from server import metrics
+from .backlog import get_backlog, replay_frames, requested_last_seq
+from .dedupe import ack_frame, client_message_id, get_dedupe
+from .direct import get_channel_registry, send_direct
+from .ephemeral import EPHEMERAL_TYPES, collect_client_event, mark_offline, mark_online
+from .persistence import get_message_writer, message_event
+from .producer import get_producer
+from .ratelimit import get_rate_limiter, rate_limited_frame
+from .rooms import get_room_for_user, group_for_channel, requested_room_name, room_groups
+from .send_queue import OutboundQueue
+from .wire import MESSAGE_TOO_BIG, FrameTooLarge, OutgoingFrame, decode, negotiate, websocket_message
 
-class GroupConsumer(WebsocketConsumer):
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.producer = KafkaProducer(
-            bootstrap_servers='kafka:9092',
-            value_serializer=lambda v: json.dumps(v).encode('utf-8')
+# Close code sent when the user may not join the requested room.
+ROOM_ACCESS_DENIED = 4403
+
+RECEIVE_LATENCY = metrics.histogram('chat_receive_seconds', 'Time to handle one inbound chat frame.')
+RECEIVE_STAGE = metrics.histogram('chat_receive_stage_seconds', 'Time per stage of handling a chat frame.', ('stage',))
+RECEIVE_ERRORS = metrics.counter('chat_receive_errors_total', 'Inbound chat frames that failed.')
+RATE_LIMITED = metrics.counter('chat_rate_limited_total', 'Inbound chat frames rejected by a rate limit.', ('scope',))
+DUPLICATES = metrics.counter('chat_duplicate_messages_total', 'Retried chat frames answered from the dedupe window.')
+
+
+def store_message(room_name, message, sender_id, seq=None, client_id=None):
+    """
+    Publish a chat message to Kafka and, in 'direct' persistence mode, queue
+    it for Mongo.
+
+    With CHAT_PERSISTENCE = 'worker' (the default) the `persist_messages`
+    command writes the topic to Mongo, so the socket only publishes. The
+    message id doubles as the Mongo _id, which keeps both paths idempotent,
+    and a client_id is covered by a unique index for retried sends.
+
+    Neither call waits on I/O in the common case, but the producer can still
+    block on its first metadata fetch, so the async consumer runs this in a
+    worker thread.
+    """
+    doc = {
+        "_id": uuid4().hex,
+        "room": room_name,
+        "message": message,
+        "sender_id": sender_id,
+        "seq": seq,
+        "timestamp": datetime.utcnow()
+    }
+    if client_id is not None:
+        # Only set when present; the unique index is partial on it.
+        doc["client_id"] = client_id
+
+    with RECEIVE_STAGE.time('producer_send'):
+        get_producer().send(
+            topic='chat_messages',
+            key=room_name,
+            value=message_event(doc)
         )
 
+    if settings.CHAT_PERSISTENCE == 'direct':
+        with RECEIVE_STAGE.time('writer_submit'):
+            get_message_writer().submit(doc)
+
+
+def chat_frame(event):
+    """
+    The frame clients receive for a chat_message event.
+    """
+    return {"message": event["message"], "seq": event.get("seq")}
+
+
+class GroupConsumer(WebsocketConsumer):
+
     def connect(self):
         try:
-            self.room_name = 'chat'
-            self.room_group_name = f"chat_{self.room_name}"
+            self.room_name = requested_room_name(self.scope)
+            room = get_room_for_user(self.scope.get('user'), self.room_name)
+            if room is None:
+                self.close(code=ROOM_ACCESS_DENIED)
+                return
+
+            self.room_groups = room_groups(self.room_name, room.shard_count)
+            self.room_group_name = group_for_channel(self.room_name, room.shard_count, self.channel_name)
 
-        
             async_to_sync(self.channel_layer.group_add)(
                 self.room_group_name,
                 self.channel_name
             )
-            self.accept()
+            subprotocol, self.codec = negotiate(self.scope)
+            self.accept(subprotocol)
         except Exception as e:
             print(f"Error in connect: {e}")
+            return
+
+        self.replayed = set()
+        try:
+            for frame in async_to_sync(replay_frames)(self.room_name, requested_last_seq(self.scope)):
+                self.base_send(websocket_message(OutgoingFrame(frame), self.codec))
+                self.replayed.add(frame["seq"])
+        except Exception as e:
+            print(f"Error replaying backlog: {e}")
+
+        self.outbound = OutboundQueue.from_settings(self.send_frame, self.close_socket)
+        async_to_sync(self.outbound.start)()
+        async_to_sync(mark_online)(self.room_name, self.room_groups, self.scope['user'].id)
+        async_to_sync(get_channel_registry().register)(self.scope['user'].id, self.channel_name)
+
+    # The queue's writer task runs on the event loop, while base_send is
+    # wrapped in async_to_sync for sync consumers.
+    async def send_frame(self, frame):
+        await sync_to_async(self.base_send, thread_sensitive=False)(websocket_message(frame, self.codec))
+
+    async def close_socket(self, code):
+        await sync_to_async(self.close, thread_sensitive=False)(code=code)
 
     def disconnect(self, close_code):
         try:
-            async_to_sync(self.channel_layer.group_discard)(
+            if getattr(self, 'outbound', None):
+                async_to_sync(self.outbound.close)()
+                async_to_sync(mark_offline)(self.room_name, self.room_groups, self.scope['user'].id)
+                async_to_sync(get_channel_registry().unregister)(self.scope['user'].id, self.channel_name)
+            if getattr(self, 'room_group_name', None):
+                async_to_sync(self.channel_layer.group_discard)(
+                    self.room_group_name,
+                    self.channel_name
+                )
+            print(f"Disconnected with code {close_code}")
+        except Exception as e:
+            print(f"Error in disconnect: {e}")
+
+    def receive(self, text_data=None, bytes_data=None):
+        with RECEIVE_LATENCY.time():
+            self.handle_message(text_data, bytes_data)
+
+    def handle_message(self, text_data, bytes_data=None):
+        # (user, client_id) claimed in the dedupe window but not yet fanned out.
+        pending_claim = None
+        try:
+            with RECEIVE_STAGE.time('parse'):
+                text_data_json = decode(text_data, bytes_data)
+                message = text_data_json.get("message")
+
+            sender_id = self.scope['user'].id
+
+            if text_data_json.get("type") in EPHEMERAL_TYPES:
+                # Typing and read receipts are batched and never stored.
+                async_to_sync(collect_client_event)(self.room_name, self.room_groups, sender_id, text_data_json)
+                return
+
+            client_id = client_message_id(text_data_json)
+            if client_id is not None:
+                with RECEIVE_STAGE.time('dedupe'):
+                    new, seen_seq = async_to_sync(get_dedupe().claim)(sender_id, client_id)
+                if not new:
+                    # A retry: ack it again, but don't send it again.
+                    DUPLICATES.inc()
+                    async_to_sync(self.outbound.put)(ack_frame(client_id, seen_seq, duplicate=True))
+                    return
+                pending_claim = (sender_id, client_id)
+
+            if text_data_json.get("type") == "direct":
+                reply, conversation = async_to_sync(send_direct)(
+                    self.channel_layer, sender_id, text_data_json, self.channel_name
+                )
+                if conversation is None and pending_claim:
+                    async_to_sync(get_dedupe().release)(*pending_claim)
+                # DMs have no seq, so the claim stays without one and retries
+                # are acked with "seq": null.
+                pending_claim = None
+                if reply is not None:
+                    async_to_sync(self.outbound.put)(reply)
+                if conversation is not None:
+                    store_message(conversation, text_data_json["message"], sender_id, client_id=client_id)
+                return
+
+            with RECEIVE_STAGE.time('rate_limit'):
+                rejected = async_to_sync(get_rate_limiter().allow)(sender_id, self.room_name)
+            if rejected:
+                if pending_claim:
+                    async_to_sync(get_dedupe().release)(*pending_claim)
+                RATE_LIMITED.inc(rejected[0])
+                # Keyed, so a client hammering the limit gets one pending error.
+                async_to_sync(self.outbound.put)(rate_limited_frame(*rejected), key='rate_limited')
+                return
+
+            with RECEIVE_STAGE.time('sequence'):
+                backlog = get_backlog()
+                seq = async_to_sync(backlog.next_seq)(self.room_name)
+                frame = {"message": message, "seq": seq}
+                async_to_sync(backlog.append)(self.room_name, seq, frame)
+
+            with RECEIVE_STAGE.time('group_send'):
+                for group in self.room_groups:
+                    async_to_sync(self.channel_layer.group_send)(
+                        group,
+                        {
+                            "type": "chat_message",
+                            "message": message,
+                            "sender_id": sender_id,
+                            "seq": seq,
+                            # Encoded once here instead of once per recipient.
+                            "text": json.dumps(frame)
+                        }
+                    )
+
+            if pending_claim:
+                pending_claim = None
+                async_to_sync(get_dedupe().complete)(sender_id, client_id, seq)
+                async_to_sync(self.outbound.put)(ack_frame(client_id, seq))
+
+            with RECEIVE_STAGE.time('store'):
+                store_message(self.room_name, message, sender_id, seq, client_id)
+
+        except FrameTooLarge as e:
+            RECEIVE_ERRORS.inc()
+            print(f"Closing socket: {e}")
+            self.close(code=MESSAGE_TOO_BIG)
+        except Exception as e:
+            RECEIVE_ERRORS.inc()
+            print(f"Error in receive: {e}")
+            if pending_claim:
+                # Not sent to anyone, so let the client's retry through.
+                try:
+                    async_to_sync(get_dedupe().release)(*pending_claim)
+                except Exception as e:
+                    print(f"Error releasing client id: {e}")
+
+    def chat_message(self, event):
+        frame = chat_frame(event)
+        if frame["seq"] in self.replayed:
+            # Already sent while replaying the backlog on connect.
+            self.replayed.discard(frame["seq"])
+            return
+        get_backlog().observe(self.room_name, frame["seq"], frame)
+        # Queued rather than sent, so a slow client can't hold up this
+        # consumer or grow its buffer without bound.
+        async_to_sync(self.outbound.put)(OutgoingFrame(frame, event.get("text")))
+
+    def chat_ephemeral(self, event):
+        async_to_sync(self.outbound.put)(event["frame"])
+
+    def chat_direct(self, event):
+        async_to_sync(self.outbound.put)(event["frame"])
+
+
+class AsyncGroupConsumer(AsyncWebsocketConsumer):
+    """
+    Event-loop native version of GroupConsumer.
+
+    Speaks the same wire protocol, but channel layer calls are awaited directly
+    instead of going through async_to_sync, so a frame no longer costs a
+    thread-pool hop. The blocking Kafka/Mongo work is handed to a worker
+    thread so it never stalls the event loop.
+
+    Selected with CHAT_CONSUMER = 'async' (see chats/routing.py).
+    """
+    async def connect(self):
+        try:
+            self.room_name = requested_room_name(self.scope)
+            room = await database_sync_to_async(get_room_for_user)(self.scope.get('user'), self.room_name)
+            if room is None:
+                await self.close(code=ROOM_ACCESS_DENIED)
+                return
+
+            self.room_groups = room_groups(self.room_name, room.shard_count)
+            self.room_group_name = group_for_channel(self.room_name, room.shard_count, self.channel_name)
+
+            await self.channel_layer.group_add(
                 self.room_group_name,
                 self.channel_name
             )
+            subprotocol, self.codec = negotiate(self.scope)
+            await self.accept(subprotocol)
+        except Exception as e:
+            print(f"Error in connect: {e}")
+            return
+
+        # Live messages queue up behind connect(), so anything that arrives
+        # while replaying is only handled afterwards and can be deduplicated.
+        self.replayed = set()
+        try:
+            for frame in await replay_frames(self.room_name, requested_last_seq(self.scope)):
+                await self.base_send(websocket_message(OutgoingFrame(frame), self.codec))
+                self.replayed.add(frame["seq"])
+        except Exception as e:
+            print(f"Error replaying backlog: {e}")
+
+        self.outbound = OutboundQueue.from_settings(self.send_frame, self.close_socket)
+        await self.outbound.start()
+        await mark_online(self.room_name, self.room_groups, self.scope['user'].id)
+        await get_channel_registry().register(self.scope['user'].id, self.channel_name)
+
+    async def send_frame(self, frame):
+        await self.base_send(websocket_message(frame, self.codec))
+
+    async def close_socket(self, code):
+        await self.base_send({"type": "websocket.close", "code": code})
+
+    async def disconnect(self, close_code):
+        try:
+            if getattr(self, 'outbound', None):
+                await self.outbound.close()
+                await mark_offline(self.room_name, self.room_groups, self.scope['user'].id)
+                await get_channel_registry().unregister(self.scope['user'].id, self.channel_name)
+            if getattr(self, 'room_group_name', None):
+                await self.channel_layer.group_discard(
+                    self.room_group_name,
+                    self.channel_name
+                )
             print(f"Disconnected with code {close_code}")
         except Exception as e:
             print(f"Error in disconnect: {e}")
 
-    def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
+        with RECEIVE_LATENCY.time():
+            await self.handle_message(text_data, bytes_data)
+
+    async def handle_message(self, text_data, bytes_data=None):
+        # (user, client_id) claimed in the dedupe window but not yet fanned out.
+        pending_claim = None
         try:
-            text_data_json = json.loads(text_data)
-            message = text_data_json.get("message")
+            with RECEIVE_STAGE.time('parse'):
+                text_data_json = decode(text_data, bytes_data)
+                message = text_data_json.get("message")
 
             sender_id = self.scope['user'].id
 
-            
-            async_to_sync(self.channel_layer.group_send)(
-                self.room_group_name,
-                {
-                    "type": "chat_message",
-                    "message": message,
-                    "sender_id": sender_id
-                }
-            )
+            if text_data_json.get("type") in EPHEMERAL_TYPES:
+                # Typing and read receipts are batched and never stored.
+                await collect_client_event(self.room_name, self.room_groups, sender_id, text_data_json)
+                return
 
-           
-            self.producer.send(
-                topic='chat_messages',
-                value={"room": self.room_name, "message": message,  "sender_id": sender_id}
-            )
-            self.producer.flush()  
+            client_id = client_message_id(text_data_json)
+            if client_id is not None:
+                with RECEIVE_STAGE.time('dedupe'):
+                    new, seen_seq = await get_dedupe().claim(sender_id, client_id)
+                if not new:
+                    # A retry: ack it again, but don't send it again.
+                    DUPLICATES.inc()
+                    await self.outbound.put(ack_frame(client_id, seen_seq, duplicate=True))
+                    return
+                pending_claim = (sender_id, client_id)
+
+            if text_data_json.get("type") == "direct":
+                reply, conversation = await send_direct(self.channel_layer, sender_id, text_data_json, self.channel_name)
+                if conversation is None and pending_claim:
+                    await get_dedupe().release(*pending_claim)
+                # DMs have no seq, so the claim stays without one and retries
+                # are acked with "seq": null.
+                pending_claim = None
+                if reply is not None:
+                    await self.outbound.put(reply)
+                if conversation is not None:
+                    await sync_to_async(store_message, thread_sensitive=False)(
+                        conversation, text_data_json["message"], sender_id, client_id=client_id
+                    )
+                return
+
+            with RECEIVE_STAGE.time('rate_limit'):
+                rejected = await get_rate_limiter().allow(sender_id, self.room_name)
+            if rejected:
+                if pending_claim:
+                    await get_dedupe().release(*pending_claim)
+                RATE_LIMITED.inc(rejected[0])
+                # Keyed, so a client hammering the limit gets one pending error.
+                await self.outbound.put(rate_limited_frame(*rejected), key='rate_limited')
+                return
 
-            settings.mongo_db['messages'].insert_one({
-                "room": self.room_name,
+            with RECEIVE_STAGE.time('sequence'):
+                backlog = get_backlog()
+                seq = await backlog.next_seq(self.room_name)
+                frame = {"message": message, "seq": seq}
+                await backlog.append(self.room_name, seq, frame)
+
+            event = {
+                "type": "chat_message",
                 "message": message,
                 "sender_id": sender_id,
-                "timestamp": datetime.utcnow()
-            })
+                "seq": seq,
+                # Encoded once here instead of once per recipient.
+                "text": json.dumps(frame)
+            }
+            with RECEIVE_STAGE.time('group_send'):
+                await asyncio.gather(*(
+                    self.channel_layer.group_send(group, event) for group in self.room_groups
+                ))
+
+            if pending_claim:
+                pending_claim = None
+                await get_dedupe().complete(sender_id, client_id, seq)
+                await self.outbound.put(ack_frame(client_id, seq))
 
+            with RECEIVE_STAGE.time('store'):
+                await sync_to_async(store_message, thread_sensitive=False)(
+                    self.room_name, message, sender_id, seq, client_id
+                )
+
+        except FrameTooLarge as e:
+            RECEIVE_ERRORS.inc()
+            print(f"Closing socket: {e}")
+            await self.close(code=MESSAGE_TOO_BIG)
         except Exception as e:
+            RECEIVE_ERRORS.inc()
             print(f"Error in receive: {e}")
+            if pending_claim:
+                # Not sent to anyone, so let the client's retry through.
+                try:
+                    await get_dedupe().release(*pending_claim)
+                except Exception as e:
+                    print(f"Error releasing client id: {e}")
 
-    def chat_message(self, event):
-        message = event["message"]
-        self.send(text_data=json.dumps({"message": message}))
+    async def chat_message(self, event):
+        frame = chat_frame(event)
+        if frame["seq"] in self.replayed:
+            self.replayed.discard(frame["seq"])
+            return
+        get_backlog().observe(self.room_name, frame["seq"], frame)
+        await self.outbound.put(OutgoingFrame(frame, event.get("text")))
+
+    async def chat_ephemeral(self, event):
+        await self.outbound.put(event["frame"])
+
+    async def chat_direct(self, event):
+        await self.outbound.put(event["frame"])
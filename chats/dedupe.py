@@ -0,0 +1,174 @@
+"""
+Idempotent sends with client message ids.
+
+Mobile clients retry a send when the connection flakes, and without help the
+retry is broadcast, published and stored a second time. A client may now
+attach its own id to a room or direct message:
+
+    {"message": "hi", "client_id": "5f0c..."}
+
+The first frame with a given (user, client_id) is handled as usual, and the
+sender gets one ack once the message has been sequenced and fanned out:
+
+    {"type": "ack", "client_id": "5f0c...", "seq": 42}
+
+Any later frame with the same id inside the dedupe window is answered with
+the same ack plus ``"duplicate": true`` and goes no further: no sequence
+number, fan-out, Kafka or Mongo work. A retry that races the original gets
+``"seq": null``, since the original hasn't finished yet. Direct messages
+(chats/direct.py) take a client_id too; they are acked with ``direct_sent``
+and their retries with ``"seq": null``, as DMs have no sequence numbers. Frames without a
+client_id behave exactly as before and are not acked.
+
+Two backends, chosen with settings.CHAT_DEDUPE_BACKEND:
+
+* InMemoryDedupe remembers the last ``window`` ids per user for ``ttl``
+  seconds, in this process only. A retry that reconnects to another worker
+  is not caught here.
+* RedisDedupe keeps one key per id with a ``ttl`` expiry, shared by all
+  workers.
+
+Mongo has a unique index on (sender_id, client_id) as the last line of
+defense, and both writers treat a duplicate key as already stored.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+
+# Longer ids are ignored rather than stored; a UUID is 36 characters.
+MAX_CLIENT_ID_LENGTH = 64
+
+
+def client_message_id(data):
+    """
+    The client_id of an inbound frame, or None if it has no usable one.
+    """
+    client_id = data.get("client_id")
+    if isinstance(client_id, str) and 0 < len(client_id) <= MAX_CLIENT_ID_LENGTH:
+        return client_id
+    return None
+
+
+def ack_frame(client_id, seq, duplicate=False):
+    frame = {"type": "ack", "client_id": client_id, "seq": seq}
+    if duplicate:
+        frame["duplicate"] = True
+    return frame
+
+
+class InMemoryDedupe:
+
+    # Users whose ids have all expired are dropped every SWEEP_INTERVAL claims.
+    SWEEP_INTERVAL = 10000
+
+    def __init__(self, window=256, ttl=300, clock=time.monotonic):
+        self.window = window
+        self.ttl = ttl
+        self.clock = clock
+        self._seen = {}
+        self._claims = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, ids, now):
+        # Every id gets the same ttl, so insertion order is expiry order.
+        while ids and next(iter(ids.values()))[1] <= now:
+            ids.popitem(last=False)
+
+    async def claim(self, user_id, client_id):
+        """
+        Record ``client_id`` for ``user_id``. Returns ``(True, None)`` for a
+        new id, otherwise ``(False, seq)`` with the seq of the original
+        message, or None if it is still being handled.
+        """
+        with self._lock:
+            now = self.clock()
+            ids = self._seen.setdefault(user_id, OrderedDict())
+            self._expire(ids, now)
+            if client_id in ids:
+                return False, ids[client_id][0]
+            ids[client_id] = (None, now + self.ttl)
+            while len(ids) > self.window:
+                ids.popitem(last=False)
+
+            self._claims += 1
+            if self._claims % self.SWEEP_INTERVAL == 0:
+                self._sweep(now)
+        return True, None
+
+    async def complete(self, user_id, client_id, seq):
+        with self._lock:
+            ids = self._seen.get(user_id)
+            if ids is not None and client_id in ids:
+                ids[client_id] = (seq, ids[client_id][1])
+
+    async def release(self, user_id, client_id):
+        """
+        Forget a claim whose message was not sent, so the client may retry.
+        """
+        with self._lock:
+            ids = self._seen.get(user_id)
+            if ids is not None:
+                ids.pop(client_id, None)
+
+    def _sweep(self, now):
+        for user_id in list(self._seen):
+            self._expire(self._seen[user_id], now)
+            if not self._seen[user_id]:
+                del self._seen[user_id]
+
+
+class RedisDedupe:
+
+    # Value of a claimed id whose message has no seq yet.
+    PENDING = b''
+
+    def __init__(self, url, ttl=300, window=None):
+        import redis.asyncio as redis
+
+        # ``window`` is accepted so both backends share OPTIONS; keys expire
+        # by ttl alone here.
+        self.redis = redis.from_url(url)
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(user_id, client_id):
+        return f"chat:dedupe:{user_id}:{client_id}"
+
+    async def claim(self, user_id, client_id):
+        key = self._key(user_id, client_id)
+        if await self.redis.set(key, self.PENDING, nx=True, ex=self.ttl):
+            return True, None
+        seq = await self.redis.get(key)
+        return False, int(seq) if seq else None
+
+    async def complete(self, user_id, client_id, seq):
+        await self.redis.set(self._key(user_id, client_id), seq, xx=True, ex=self.ttl)
+
+    async def release(self, user_id, client_id):
+        await self.redis.delete(self._key(user_id, client_id))
+
+
+_dedupe = None
+
+
+def get_dedupe():
+    global _dedupe
+
+    if _dedupe is None:
+        backend = import_string(settings.CHAT_DEDUPE_BACKEND)
+        _dedupe = backend(**settings.CHAT_DEDUPE['OPTIONS'])
+    return _dedupe
+
+
+def _reset_dedupe(setting, **kwargs):
+    global _dedupe
+    if setting in ('CHAT_DEDUPE_BACKEND', 'CHAT_DEDUPE'):
+        _dedupe = None
+
+
+setting_changed.connect(_reset_dedupe)
@@ -0,0 +1,185 @@
+"""
+One-to-one direct messages routed through a user -> channel registry.
+
+Every open WebSocket registers its channel name under its user's id. To
+deliver a DM, the sender's consumer looks up the recipient's channels and
+does one channel_layer.send per connection. Every device gets it, and no
+per-conversation group has to be created and torn down. The sender's other
+connections get a copy too, so all of their devices show the conversation.
+
+Clients send
+
+    {"type": "direct", "to": 7, "message": "hi"}
+
+Each connection of both users, other than the one that sent it, then
+receives
+
+    {"type": "direct", "id": "<hex>", "from": 3, "to": 7, "message": "hi"}
+
+and the sending connection gets ``{"type": "direct_sent", "id", "to",
+"devices"}`` back instead. DMs count against the sender's rate limit, with the
+conversation standing in for the room. A user with several sockets open
+gets one copy per socket; clients deduplicate on ``id``. DMs are published
+to the chat topic under the conversation ``dm_<low id>_<high id>``, so the
+persistence worker stores them like room messages; Room names can't start
+with ``dm_``, so the two never mix.
+
+Two registry backends, chosen with settings.CHAT_CHANNEL_REGISTRY_BACKEND:
+
+* InMemoryChannelRegistry only knows this process's connections.
+* RedisChannelRegistry keeps a sorted set per user, scored by expiry time.
+  Each process refreshes its own entries every ttl / 3 seconds. Entries of a
+  worker that died without unregistering expire after ``ttl``.
+"""
+import asyncio
+import threading
+import time
+from uuid import uuid4
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+from .ratelimit import get_rate_limiter, rate_limited_frame
+
+
+CONVERSATION_PREFIX = 'dm_'
+
+
+def conversation_name(user_id, other_id):
+    low, high = sorted((int(user_id), int(other_id)))
+    return f"{CONVERSATION_PREFIX}{low}_{high}"
+
+
+class InMemoryChannelRegistry:
+
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    async def register(self, user_id, channel_name):
+        with self._lock:
+            self._channels.setdefault(user_id, set()).add(channel_name)
+
+    async def unregister(self, user_id, channel_name):
+        with self._lock:
+            channels = self._channels.get(user_id)
+            if channels is not None:
+                channels.discard(channel_name)
+                if not channels:
+                    del self._channels[user_id]
+
+    async def channels(self, user_id):
+        with self._lock:
+            return sorted(self._channels.get(user_id, ()))
+
+
+class RedisChannelRegistry:
+
+    def __init__(self, url, ttl=120):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.ttl = ttl
+        self._local = {}
+        self._refresher = None
+
+    @staticmethod
+    def _key(user_id):
+        return f"chat:channels:{user_id}"
+
+    async def _add(self, entries):
+        expires = time.time() + self.ttl
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for user_id, channel_name in entries:
+                pipe.zadd(self._key(user_id), {channel_name: expires})
+                pipe.expire(self._key(user_id), self.ttl)
+            await pipe.execute()
+
+    async def register(self, user_id, channel_name):
+        self._local[(user_id, channel_name)] = True
+        await self._add([(user_id, channel_name)])
+        loop = asyncio.get_running_loop()
+        if self._refresher is None or self._refresher.done() or self._refresher.get_loop() is not loop:
+            self._refresher = loop.create_task(self._refresh())
+
+    async def unregister(self, user_id, channel_name):
+        self._local.pop((user_id, channel_name), None)
+        await self.redis.zrem(self._key(user_id), channel_name)
+
+    async def channels(self, user_id):
+        key = self._key(user_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(key, '-inf', time.time())
+            pipe.zrange(key, 0, -1)
+            _, channels = await pipe.execute()
+        return [channel.decode() for channel in channels]
+
+    async def _refresh(self):
+        while self._local:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                await self._add(list(self._local))
+            except Exception as e:
+                print(f"Error refreshing channel registry: {e}")
+
+
+async def send_direct(channel_layer, sender_id, data, sender_channel=None):
+    """
+    Deliver a client's direct message from ``sender_channel``, which gets
+    the reply rather than a copy. Returns ``(reply, conversation)``:
+    the frame to answer the sender with (None for malformed messages), and
+    the conversation to store the message under (None if it wasn't sent).
+    """
+    recipient_id, message = data.get("to"), data.get("message")
+    if not isinstance(recipient_id, int) or message is None:
+        return None, None
+
+    conversation = conversation_name(sender_id, recipient_id)
+    rejected = await get_rate_limiter().allow(sender_id, conversation)
+    if rejected:
+        return rate_limited_frame(*rejected), None
+
+    registry = get_channel_registry()
+    recipient_channels = await registry.channels(recipient_id)
+    if not recipient_channels and not await user_exists(recipient_id):
+        return {"type": "direct_sent", "to": recipient_id, "devices": 0, "error": "unknown_user"}, None
+
+    frame = {"type": "direct", "id": uuid4().hex, "from": sender_id, "to": recipient_id, "message": message}
+    channels = set(recipient_channels)
+    if recipient_id != sender_id:
+        channels.update(await registry.channels(sender_id))
+    channels.discard(sender_channel)
+    await asyncio.gather(*(
+        channel_layer.send(channel, {"type": "chat_direct", "frame": frame}) for channel in channels
+    ))
+
+    ack = {"type": "direct_sent", "id": frame["id"], "to": recipient_id, "devices": len(recipient_channels)}
+    return ack, conversation
+
+
+async def user_exists(user_id):
+    return await database_sync_to_async(get_user_model().objects.filter(pk=user_id).exists)()
+
+
+_registry = None
+
+
+def get_channel_registry():
+    global _registry
+
+    if _registry is None:
+        backend = import_string(settings.CHAT_CHANNEL_REGISTRY_BACKEND)
+        _registry = backend(**settings.CHAT_CHANNEL_REGISTRY['OPTIONS'])
+    return _registry
+
+
+def _reset_registry(setting, **kwargs):
+    global _registry
+    if setting in ('CHAT_CHANNEL_REGISTRY_BACKEND', 'CHAT_CHANNEL_REGISTRY'):
+        _registry = None
+
+
+setting_changed.connect(_reset_registry)
@@ -0,0 +1,325 @@
+"""
+Ephemeral room events: typing indicators, presence and read receipts.
+
+These never reach Kafka or Mongo. Clients send
+
+    {"type": "typing"}                  ({"active": false} when they stop)
+    {"type": "read", "seq": 42}
+
+and presence changes come from connects and disconnects. Rather than fanning
+out every event on its own, a process collects each room's events for
+settings.CHAT_EPHEMERAL['window'] seconds. It then sends one batch to the
+room, so a burst of typing events becomes a single frame per recipient:
+
+    {"type": "ephemeral", "typing": {"3": true}, "read": {"5": 42},
+     "presence": {"online": 12, "joined": [7], "left": []}}
+
+Only keys with something in them are sent. Join/leave broadcasts can be
+turned off with CHAT_EPHEMERAL['broadcast_presence']. Presence is kept per room as a
+count of connections per user. The number of online users is the size of
+that map, so reading it is O(1) and never needs a recount. Use
+chats.ephemeral.RedisPresence to share presence between workers; its
+entries expire unless the worker holding the connections keeps refreshing
+them, so users of a worker that crashed go offline after ``ttl`` seconds.
+"""
+import asyncio
+import threading
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+from server import metrics
+
+
+TYPING = 'typing'
+READ = 'read'
+EPHEMERAL_TYPES = (TYPING, READ)
+
+EPHEMERAL_EVENTS = metrics.counter('chat_ephemeral_events_total', 'Ephemeral events collected.', ('kind',))
+EPHEMERAL_BATCHES = metrics.counter('chat_ephemeral_batches_total', 'Coalesced ephemeral batches sent to rooms.')
+
+
+class InMemoryPresence:
+
+    def __init__(self):
+        self._rooms = {}
+        self._lock = threading.Lock()
+
+    async def join(self, room_name, user_id):
+        """
+        Count a new connection. Returns True if the user just came online.
+        """
+        with self._lock:
+            users = self._rooms.setdefault(room_name, {})
+            users[user_id] = users.get(user_id, 0) + 1
+            return users[user_id] == 1
+
+    async def leave(self, room_name, user_id):
+        """
+        Count a closed connection. Returns True if that was the user's last one.
+        """
+        with self._lock:
+            users = self._rooms.get(room_name, {})
+            count = users.get(user_id, 0) - 1
+            if count > 0:
+                users[user_id] = count
+                return False
+            users.pop(user_id, None)
+            if not users:
+                self._rooms.pop(room_name, None)
+            return count == 0
+
+    async def online(self, room_name):
+        return len(self._rooms.get(room_name, ()))
+
+
+# Presence in Redis is two kinds of sorted sets, scored by expiry time:
+# KEYS[1] the room's users, KEYS[2] the workers holding a user's connections
+# in that room. ARGV is the user, the worker, the new expiry, now and the ttl.
+# Returns 1 if the user had no live worker before.
+PRESENCE_JOIN_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[4])
+local was_online = redis.call('ZCARD', KEYS[2]) > 0
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[2])
+redis.call('ZADD', KEYS[1], 'GT', ARGV[3], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+if was_online then
+    return 0
+end
+return 1
+"""
+
+# Same KEYS; ARGV is the user, the worker and now. Returns 1 if no other
+# worker still holds the user.
+PRESENCE_LEAVE_SCRIPT = """
+redis.call('ZREM', KEYS[2], ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[3])
+if redis.call('ZCARD', KEYS[2]) > 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+class RedisPresence:
+    """
+    Presence shared by all workers. Each worker counts its own connections
+    per user and room, and records in Redis only which workers hold a user,
+    refreshing its entries every ttl / 3 seconds. A worker that dies
+    without closing its connections stops refreshing, and its users drop
+    out of online() ``ttl`` seconds later.
+    """
+
+    def __init__(self, url, ttl=60):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.ttl = ttl
+        self.node = uuid4().hex
+        self.join_script = self.redis.register_script(PRESENCE_JOIN_SCRIPT)
+        self.leave_script = self.redis.register_script(PRESENCE_LEAVE_SCRIPT)
+        # (room, user) -> this worker's open connections
+        self._local = {}
+        self._refresher = None
+
+    @staticmethod
+    def _keys(room_name, user_id):
+        return [f"chat:presence:{room_name}", f"chat:presence:{room_name}:{user_id}"]
+
+    async def join(self, room_name, user_id):
+        count = self._local.get((room_name, user_id), 0)
+        self._local[(room_name, user_id)] = count + 1
+        loop = asyncio.get_running_loop()
+        if self._refresher is None or self._refresher.done() or self._refresher.get_loop() is not loop:
+            self._refresher = loop.create_task(self._refresh())
+        if count:
+            return False
+        now = time.time()
+        came_online = await self.join_script(
+            keys=self._keys(room_name, user_id), args=[user_id, self.node, now + self.ttl, now, self.ttl]
+        )
+        return came_online == 1
+
+    async def leave(self, room_name, user_id):
+        count = self._local.get((room_name, user_id), 0) - 1
+        if count > 0:
+            self._local[(room_name, user_id)] = count
+            return False
+        self._local.pop((room_name, user_id), None)
+        went_offline = await self.leave_script(
+            keys=self._keys(room_name, user_id), args=[user_id, self.node, time.time()]
+        )
+        return count == 0 and went_offline == 1
+
+    async def online(self, room_name):
+        key = self._keys(room_name, None)[0]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(key, '-inf', time.time())
+            pipe.zcard(key)
+            _, online = await pipe.execute()
+        return online
+
+    async def _refresh(self):
+        while self._local:
+            await asyncio.sleep(self.ttl / 3)
+            expires = time.time() + self.ttl
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for room_name, user_id in list(self._local):
+                        room_key, user_key = self._keys(room_name, user_id)
+                        pipe.zadd(user_key, {self.node: expires})
+                        pipe.zadd(room_key, {user_id: expires}, gt=True)
+                        pipe.expire(user_key, self.ttl)
+                        pipe.expire(room_key, self.ttl)
+                    await pipe.execute()
+            except Exception as e:
+                print(f"Error refreshing presence: {e}")
+
+
+class RoomBatch:
+
+    def __init__(self, groups):
+        self.groups = groups
+        self.typing = {}
+        self.read = {}
+        self.joined = []
+        self.left = []
+        self.handle = None
+
+    def frame(self, online):
+        frame = {"type": "ephemeral"}
+        if self.typing:
+            frame["typing"] = {str(user_id): active for user_id, active in self.typing.items()}
+        if self.read:
+            frame["read"] = {str(user_id): seq for user_id, seq in self.read.items()}
+        if self.joined or self.left:
+            frame["presence"] = {"online": online, "joined": self.joined, "left": self.left}
+        return frame
+
+
+class EphemeralBatcher:
+    """
+    Collects a room's ephemeral events and sends them as one group message
+    per window. Runs on the event loop; sync consumers reach it through
+    async_to_sync.
+    """
+
+    def __init__(self, window=0.1):
+        self.window = window
+        self._batches = {}
+
+    def _batch(self, room_name, groups):
+        batch = self._batches.get(room_name)
+        if batch is None:
+            batch = self._batches[room_name] = RoomBatch(groups)
+        loop = asyncio.get_running_loop()
+        if batch.handle is None or batch.handle[0] is not loop:
+            # First event of this window, or the loop that was going to flush
+            # it is gone.
+            task = loop.call_later(self.window, lambda: asyncio.ensure_future(self.flush(room_name)))
+            batch.handle = (loop, task)
+        return batch
+
+    async def typing(self, room_name, groups, user_id, active=True):
+        EPHEMERAL_EVENTS.inc(TYPING)
+        self._batch(room_name, groups).typing[user_id] = active
+
+    async def read(self, room_name, groups, user_id, seq):
+        EPHEMERAL_EVENTS.inc(READ)
+        batch = self._batch(room_name, groups)
+        batch.read[user_id] = max(seq, batch.read.get(user_id, seq))
+
+    async def presence(self, room_name, groups, user_id, online):
+        EPHEMERAL_EVENTS.inc('presence')
+        batch = self._batch(room_name, groups)
+        # A quick reconnect shows up as neither joined nor left.
+        if online:
+            if user_id in batch.left:
+                batch.left.remove(user_id)
+            else:
+                batch.joined.append(user_id)
+        else:
+            if user_id in batch.joined:
+                batch.joined.remove(user_id)
+            else:
+                batch.left.append(user_id)
+
+    async def flush(self, room_name):
+        from channels.layers import get_channel_layer
+
+        batch = self._batches.pop(room_name, None)
+        if batch is None:
+            return
+        try:
+            online = await get_presence().online(room_name)
+            frame = batch.frame(online)
+            if len(frame) == 1:
+                return
+            channel_layer = get_channel_layer()
+            await asyncio.gather(*(
+                channel_layer.group_send(group, {"type": "chat_ephemeral", "frame": frame})
+                for group in batch.groups
+            ))
+            EPHEMERAL_BATCHES.inc()
+        except Exception as e:
+            print(f"Error flushing ephemeral events: {e}")
+
+
+_presence = None
+_batcher = None
+
+
+def get_presence():
+    global _presence
+
+    if _presence is None:
+        backend = import_string(settings.CHAT_PRESENCE_BACKEND)
+        _presence = backend(**settings.CHAT_EPHEMERAL['OPTIONS'])
+    return _presence
+
+
+def get_ephemeral_batcher():
+    global _batcher
+
+    if _batcher is None:
+        _batcher = EphemeralBatcher(settings.CHAT_EPHEMERAL['window'])
+    return _batcher
+
+
+def _reset_ephemeral(setting, **kwargs):
+    global _presence, _batcher
+    if setting in ('CHAT_PRESENCE_BACKEND', 'CHAT_EPHEMERAL'):
+        _presence = None
+        _batcher = None
+
+
+setting_changed.connect(_reset_ephemeral)
+
+
+async def collect_client_event(room_name, groups, user_id, data):
+    """
+    Queue a typing or read event sent by a client. Malformed events are
+    ignored.
+    """
+    batcher = get_ephemeral_batcher()
+    if data.get("type") == TYPING:
+        await batcher.typing(room_name, groups, user_id, bool(data.get("active", True)))
+    elif data.get("type") == READ and isinstance(data.get("seq"), int):
+        await batcher.read(room_name, groups, user_id, data["seq"])
+
+
+async def mark_online(room_name, groups, user_id):
+    came_online = await get_presence().join(room_name, user_id)
+    if came_online and settings.CHAT_EPHEMERAL['broadcast_presence']:
+        await get_ephemeral_batcher().presence(room_name, groups, user_id, True)
+
+
+async def mark_offline(room_name, groups, user_id):
+    went_offline = await get_presence().leave(room_name, user_id)
+    if went_offline and settings.CHAT_EPHEMERAL['broadcast_presence']:
+        await get_ephemeral_batcher().presence(room_name, groups, user_id, False)
@@ -0,0 +1,103 @@
+"""
+Keyset pagination over a room's messages.
+
+Pages are read newest-first on the (room, timestamp, _id) index and the
+cursor is the (timestamp, _id) of the last message returned, so fetching
+any page is an index seek plus ``limit`` documents, however deep it is and
+however big the collection gets.
+"""
+import base64
+import json
+from datetime import datetime
+
+
+HISTORY_PROJECTION = {'message': 1, 'sender_id': 1, 'timestamp': 1}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(doc):
+    from bson import ObjectId
+
+    _id = doc['_id']
+    key = {'ts': doc['timestamp'].isoformat()}
+    if isinstance(_id, ObjectId):
+        key['oid'] = str(_id)
+    else:
+        key['id'] = _id
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    from bson import ObjectId
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        timestamp = datetime.fromisoformat(key['ts'])
+        _id = ObjectId(key['oid']) if 'oid' in key else key['id']
+    except Exception:
+        raise InvalidCursor(cursor)
+    return timestamp, _id
+
+
+def history_query(collection, room_name, limit, cursor=None):
+    """
+    The find() cursor for one page of ``room_name``'s history, with one
+    message more than ``limit`` to tell whether another page follows.
+    """
+    query = {'room': room_name}
+    if cursor:
+        timestamp, _id = decode_cursor(cursor)
+        query['$or'] = [
+            {'timestamp': {'$lt': timestamp}},
+            {'timestamp': timestamp, '_id': {'$lt': _id}},
+        ]
+    return (
+        collection.find(query, HISTORY_PROJECTION)
+        .sort([('timestamp', -1), ('_id', -1)])
+        .limit(limit + 1)
+    )
+
+
+def fetch_room_history(collection, room_name, limit, cursor=None):
+    """
+    Return (messages, next_cursor) for one page of ``room_name``'s history,
+    newest first. ``next_cursor`` is None on the last page.
+    """
+    docs = list(history_query(collection, room_name, limit, cursor))
+
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+
+# Sequence-number lookups, used to seed room sequences and to replay gaps
+# larger than the in-memory backlog (see chats/backlog.py).
+
+def replay_frame(doc):
+    return {'message': doc.get('message'), 'seq': doc['seq']}
+
+
+def latest_seq(collection, room_name):
+    doc = collection.find_one({'room': room_name, 'seq': {'$exists': True}}, {'seq': 1}, sort=[('seq', -1)])
+    return doc['seq'] if doc else 0
+
+
+def messages_after(collection, room_name, last_seq, limit):
+    """
+    Frames for messages with seq > last_seq. If there are more than ``limit``
+    of them only the most recent ``limit`` are returned; older ones can be
+    read through the history API.
+    """
+    docs = list(
+        collection.find({'room': room_name, 'seq': {'$gt': last_seq}}, {'message': 1, 'seq': 1})
+        .sort('seq', -1)
+        .limit(limit)
+    )
+    return [replay_frame(doc) for doc in reversed(docs)]
+
+
+def latest_messages(collection, room_name, limit):
+    return messages_after(collection, room_name, 0, limit)
@@ -0,0 +1,74 @@
+"""
+Indexes the chat code relies on in the Mongo messages collection.
+
+Create (and check) them with ``python manage.py ensure_message_indexes``.
+"""
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+
+
+MESSAGE_INDEXES = [
+    # Room history, newest first, with _id as the keyset tie-breaker.
+    IndexModel(
+        [('room', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)],
+        name='room_timestamp_id',
+    ),
+    # Reconnect replay and sequence seeding.
+    IndexModel([('room', ASCENDING), ('seq', ASCENDING)], name='room_seq'),
+    # Retried sends with a client message id (chats/dedupe.py). Only messages
+    # that carry one are indexed.
+    IndexModel(
+        [('sender_id', ASCENDING), ('client_id', ASCENDING)],
+        name='sender_client_id',
+        unique=True,
+        partialFilterExpression={'client_id': {'$exists': True}},
+    ),
+    # Message search (chats/search.py). Searches always name a room, so it
+    # is an equality prefix and each search only reads that room's postings;
+    # sender_id lets the sender filter be applied from the index.
+    IndexModel(
+        [('room', ASCENDING), ('message', TEXT), ('sender_id', ASCENDING)],
+        name='room_message_text',
+    ),
+]
+
+
+def ensure_indexes(collection, indexes=MESSAGE_INDEXES):
+    """
+    Create any missing indexes. Creating an index that already exists with the
+    same keys and options is a no-op in Mongo.
+    """
+    return collection.create_indexes(indexes)
+
+
+def stored_keys(keys):
+    """
+    The keys of an index as index_information() reports them. Mongo stores
+    the fields of a text index as weights and puts ('_fts', 'text'),
+    ('_ftsx', 1) in their place.
+    """
+    stored, weights = [], {}
+    for field, kind in keys:
+        if kind == TEXT:
+            weights[field] = 1
+            if not stored or stored[-1][0] != '_ftsx':
+                stored += [('_fts', TEXT), ('_ftsx', 1)]
+        else:
+            stored.append((field, kind))
+    return stored, weights
+
+
+def missing_indexes(collection, indexes=MESSAGE_INDEXES):
+    """
+    Names of the expected indexes that are absent or differ in keys/options.
+    """
+    existing = collection.index_information()
+    missing = []
+    for index in indexes:
+        spec = dict(index.document)
+        name = spec.pop('name')
+        keys, weights = stored_keys(spec.pop('key').items())
+        info = existing.get(name)
+        if (info is None or list(info['key']) != keys or info.get('weights', {}) != weights
+                or any(info.get(k) != v for k, v in spec.items())):
+            missing.append(name)
+    return missing
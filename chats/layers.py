@@ -0,0 +1,236 @@
+"""
+Channel layer wrapper that fans group messages out inside the process.
+
+With a stock layer, a group_send to a room with 5,000 members pushes 5,000
+messages through Redis even if they all live on the same Daphne process.
+LocalFanoutChannelLayer keeps group membership for its own consumers in
+memory and subscribes a single per-process "node" channel to each group on
+the wrapped layer. A group_send then costs one message per process in the
+group, and each process copies it to its local members' queues itself.
+
+Direct sends (channel_layer.send) and anything else go straight to the
+wrapped layer. Configure it around the real backend:
+
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "chats.layers.LocalFanoutChannelLayer",
+            "CONFIG": {
+                "inner": {
+                    "BACKEND": "channels_redis.core.RedisChannelLayer",
+                    "CONFIG": {"hosts": [("127.0.0.1", 6379)]},
+                },
+            },
+        },
+    }
+"""
+import asyncio
+import time
+
+from channels.layers import BaseChannelLayer
+from django.utils.module_loading import import_string
+
+
+FANOUT_MESSAGE_TYPE = 'fanout.deliver'
+
+# Group memberships on the wrapped layer expire (a day on channels_redis), so
+# the node channel re-subscribes to every group it still has local members in
+# once they are this old, whether or not anyone joins or sends.
+RESUBSCRIBE_INTERVAL = 3600
+
+
+class LocalFanoutChannelLayer(BaseChannelLayer):
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, inner, expiry=60, capacity=100, channel_capacity=None,
+                 resubscribe_interval=RESUBSCRIBE_INTERVAL, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        backend = import_string(inner['BACKEND'])
+        self.inner = backend(**inner.get('CONFIG', {}))
+        self.resubscribe_interval = resubscribe_interval
+        self.stats = {'inner_group_sends': 0, 'node_messages': 0, 'local_deliveries': 0, 'local_drops': 0}
+        self._reset()
+
+    def _reset(self):
+        self._loop = None
+        self.node_channel = None
+        self._pump = None
+        self._resubscriber = None
+        self.local_groups = {}
+        self.subscribed_at = {}
+        self.channel_groups = {}
+        self.local_queues = {}
+        self.inner_receives = {}
+
+    def _check_loop(self):
+        # Queues and the pump task belong to an event loop. Daphne runs a
+        # single loop, but tests and async_to_sync callers may not.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._cancel_tasks()
+            self._reset()
+            self._loop = loop
+
+    def _cancel_tasks(self):
+        for task in (self._pump, self._resubscriber):
+            if task is not None:
+                task.cancel()
+
+    def _queue(self, channel):
+        queue = self.local_queues.get(channel)
+        if queue is None:
+            queue = self.local_queues[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        return queue
+
+    # Channel layer API
+
+    async def new_channel(self, prefix=None):
+        if prefix is None:
+            return await self.inner.new_channel()
+        return await self.inner.new_channel(prefix)
+
+    async def send(self, channel, message):
+        await self.inner.send(channel, message)
+
+    async def receive(self, channel):
+        """
+        Wait for the next message for ``channel``, whether it was fanned out
+        locally or sent to it directly through the wrapped layer.
+        """
+        self._check_loop()
+        queue = self._queue(channel)
+        if not queue.empty():
+            return queue.get_nowait()
+
+        local = asyncio.ensure_future(queue.get())
+        # An unfinished inner receive is kept for the next call rather than
+        # cancelled, so a message it is about to return isn't lost.
+        inner = self.inner_receives.get(channel)
+        if inner is None:
+            inner = self.inner_receives[channel] = asyncio.ensure_future(self.inner.receive(channel))
+
+        try:
+            await asyncio.wait({local, inner}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            local.cancel()
+            inner.cancel()
+            self.inner_receives.pop(channel, None)
+            if channel not in self.channel_groups:
+                self.local_queues.pop(channel, None)
+            raise
+
+        if local.done():
+            return local.result()
+
+        local.cancel()
+        del self.inner_receives[channel]
+        return inner.result()
+
+    async def flush(self):
+        self._cancel_tasks()
+        self._reset()
+        await self.inner.flush()
+
+    async def close(self):
+        if hasattr(self.inner, 'close'):
+            await self.inner.close()
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self._check_loop()
+
+        self.local_groups.setdefault(group, set()).add(channel)
+        self.channel_groups.setdefault(channel, set()).add(group)
+
+        if group not in self.subscribed_at:
+            self.subscribed_at[group] = time.monotonic()
+            await self.inner.group_add(group, await self._node_channel())
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self._check_loop()
+
+        groups = self.channel_groups.get(channel)
+        if groups is not None:
+            groups.discard(group)
+            if not groups:
+                del self.channel_groups[channel]
+
+        members = self.local_groups.get(group)
+        if not members:
+            return
+        members.discard(channel)
+        if not members:
+            del self.local_groups[group]
+            del self.subscribed_at[group]
+            await self.inner.group_discard(group, self.node_channel)
+
+    async def group_send(self, group, message):
+        self.require_valid_group_name(group)
+        self.stats['inner_group_sends'] += 1
+        await self.inner.group_send(group, {
+            'type': FANOUT_MESSAGE_TYPE,
+            'group': group,
+            'message': message,
+        })
+
+    # Node channel
+
+    async def _node_channel(self):
+        if self.node_channel is None:
+            self.node_channel = await self.inner.new_channel()
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.ensure_future(self._pump_node_channel())
+        if self._resubscriber is None or self._resubscriber.done():
+            self._resubscriber = asyncio.ensure_future(self._resubscribe_periodically())
+        return self.node_channel
+
+    async def _resubscribe_periodically(self):
+        while True:
+            await asyncio.sleep(self.resubscribe_interval)
+            try:
+                await self.resubscribe()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error renewing fan-out subscriptions: {e}")
+
+    async def resubscribe(self):
+        """
+        Renew the node channel's membership of the groups it joined on the
+        wrapped layer at least ``resubscribe_interval`` seconds ago.
+        """
+        now = time.monotonic()
+        for group, subscribed in list(self.subscribed_at.items()):
+            if now - subscribed >= self.resubscribe_interval and group in self.local_groups:
+                self.subscribed_at[group] = now
+                await self.inner.group_add(group, self.node_channel)
+
+    async def _pump_node_channel(self):
+        while True:
+            try:
+                envelope = await self.inner.receive(self.node_channel)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error receiving on fan-out channel: {e}")
+                await asyncio.sleep(1)
+                continue
+            self.stats['node_messages'] += 1
+            self.deliver_locally(envelope['group'], envelope['message'])
+
+    def deliver_locally(self, group, message):
+        for channel in self.local_groups.get(group, ()):
+            try:
+                # Consumers only read events, but give each its own dict so
+                # one can't see another's changes.
+                self._queue(channel).put_nowait(dict(message))
+                self.stats['local_deliveries'] += 1
+            except asyncio.QueueFull:
+                # Same behaviour as a full channel on the wrapped layer:
+                # the message is dropped for that member only.
+                self.stats['local_drops'] += 1
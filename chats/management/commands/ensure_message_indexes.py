@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chats import mongo
+from chats.indexes import MESSAGE_INDEXES, ensure_indexes, missing_indexes
+
+
+class Command(BaseCommand):
+    help = "Create the Mongo indexes used by the chat messages collection and verify they exist."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Only verify the indexes; exit with an error if any are missing.")
+
+    def handle(self, *args, **options):
+        collection = mongo.get_collection('messages')
+
+        if not options['check']:
+            created = ensure_indexes(collection)
+            self.stdout.write(f"Ensured indexes: {', '.join(created)}")
+
+        missing = missing_indexes(collection)
+        if missing:
+            raise CommandError(f"Missing or mismatched indexes: {', '.join(missing)}")
+
+        self.stdout.write(self.style.SUCCESS(f"All {len(MESSAGE_INDEXES)} message indexes are in place."))
@@ -0,0 +1,53 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chats import mongo
+from chats.persistence import JsonLinesDeadLetter
+from chats.persistence_worker import MessagePersistenceWorker, deserialize_event
+
+
+class Command(BaseCommand):
+    help = "Consume the chat_messages topic and bulk-upsert it into the Mongo messages collection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--topic', default='chat_messages')
+        parser.add_argument('--group', default='chat-persistence',
+                            help="Kafka consumer group; run more workers with the same group to scale out.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--poll-timeout-ms', type=int, default=1000)
+        parser.add_argument('--max-retries', type=int, default=5,
+                            help="Write attempts after the first before a batch is dead-lettered.")
+        parser.add_argument('--dead-letter-path', default=str(settings.DATA_DIR / 'persist_dead_letter_messages.jsonl'))
+
+    def handle(self, *args, **options):
+        from kafka import KafkaConsumer
+
+        consumer = KafkaConsumer(
+            options['topic'],
+            bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS,
+            group_id=options['group'],
+            enable_auto_commit=False,
+            auto_offset_reset='earliest',
+            max_poll_records=options['batch_size'],
+            value_deserializer=deserialize_event,
+        )
+        worker = MessagePersistenceWorker(
+            consumer,
+            lambda: mongo.get_collection('messages'),
+            JsonLinesDeadLetter(options['dead_letter_path']),
+            batch_size=options['batch_size'],
+            poll_timeout_ms=options['poll_timeout_ms'],
+            max_retries=options['max_retries'],
+        )
+
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+
+        self.stdout.write(f"Persisting '{options['topic']}' as consumer group '{options['group']}'")
+        try:
+            worker.run()
+        finally:
+            consumer.close(autocommit=False)
+            self.stdout.write(f"Stopped: {worker.stats}")
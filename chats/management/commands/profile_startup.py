@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from server.startup import measure
+
+
+class Command(BaseCommand):
+    help = "Report where the cold start of server.asgi:application goes, measured in fresh interpreters."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Cold starts to take the median of.")
+        parser.add_argument('--top', type=int, default=15, help="Packages to list, slowest first.")
+        parser.add_argument('--json', action='store_true', help="Print the raw figures as JSON.")
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError("--runs must be at least 1")
+        report = measure(options['runs'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+            return
+
+        self.stdout.write(f"Cold start of server.asgi:application, median of {report['runs']} runs: "
+                          f"{report['total'] * 1000:.0f}ms")
+        for phase in ('interpreter', 'settings', 'setup', 'asgi'):
+            self.stdout.write(f"  {phase:<12} {report['phases'][phase] * 1000:8.1f}ms")
+
+        self.stdout.write("Import time by package (self time, -X importtime):")
+        packages = sorted(report['packages'].items(), key=lambda item: item[1], reverse=True)
+        for name, seconds in packages[:options['top']]:
+            self.stdout.write(f"  {name:<24} {seconds * 1000:8.1f}ms")
+
+        if report['deferred_loaded']:
+            self.stdout.write(self.style.WARNING(
+                f"Loaded at start-up but meant to be deferred: {', '.join(report['deferred_loaded'])}"
+            ))
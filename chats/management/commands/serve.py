@@ -0,0 +1,49 @@
+import argparse
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from server.launcher import Supervisor, process_local_state
+
+
+class Command(BaseCommand):
+    help = ("Serve server.asgi:application with one or more Daphne workers on a shared port; "
+            "SIGTERM drains WebSockets with 1012 and flushes Kafka and Mongo, SIGHUP reloads.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default='0.0.0.0')
+        parser.add_argument('--port', type=int, default=8000)
+        parser.add_argument('--workers', type=int,
+                            default=int(os.environ.get('WEB_CONCURRENCY', 1)),
+                            help="Worker processes; defaults to $WEB_CONCURRENCY or 1. More than one "
+                                 "needs the Redis backends, and at most one per usable core helps.")
+        parser.add_argument('--drain-timeout', type=float, default=20,
+                            help="Seconds a stopping worker waits for its connections to close.")
+        parser.add_argument('--no-reuse-port', dest='reuse_port', action='store_false', default=None,
+                            help="Accept on one shared socket instead of a SO_REUSEPORT socket per worker.")
+        parser.add_argument('--worker-fd', type=int, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['worker_fd'] is not None:
+            from server.worker import run_worker
+
+            run_worker(options['worker_fd'], options['drain_timeout'], options['verbosity'])
+            return
+
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1")
+        if options['workers'] > 1:
+            problems = process_local_state()
+            if problems:
+                raise CommandError(
+                    f"--workers {options['workers']} needs state shared between workers, but:\n  "
+                    + "\n  ".join(problems)
+                )
+        Supervisor(
+            host=options['bind'],
+            port=options['port'],
+            workers=options['workers'],
+            reuse_port=options['reuse_port'],
+            drain_timeout=options['drain_timeout'],
+            verbosity=options['verbosity'],
+        ).run()
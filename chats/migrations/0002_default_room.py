@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+def create_default_room(apps, schema_editor):
+    Room = apps.get_model('chats', 'Room')
+    Room.objects.get_or_create(name='chat', defaults={'is_public': True})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_default_room, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0002_default_room'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='room',
+            constraint=models.CheckConstraint(condition=models.Q(('name__startswith', 'dm_'), _negated=True), name='room_name_not_conversation', violation_error_message="Room names starting with 'dm_' are reserved for direct messages."),
+        ),
+    ]
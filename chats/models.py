@@ -1,3 +1,42 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class Room(models.Model):
+    """
+    A chat room. Public rooms can be joined by any authenticated user, private
+    ones only by their members.
+
+    Rooms with a lot of members can be split into ``shard_count`` channel
+    layer groups so a broadcast isn't one huge group_send (see chats/rooms.py).
+    """
+    name = models.SlugField(max_length=80, unique=True)
+    is_public = models.BooleanField(default=False)
+    shard_count = models.PositiveSmallIntegerField(default=1)
+    members = models.ManyToManyField(settings.AUTH_USER_MODEL, through='RoomMembership', related_name='rooms')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Direct message conversations are stored as rooms named
+            # dm_<low id>_<high id> (see chats/direct.py).
+            models.CheckConstraint(
+                condition=~models.Q(name__startswith='dm_'),
+                name='room_name_not_conversation',
+                violation_error_message="Room names starting with 'dm_' are reserved for direct messages.",
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class RoomMembership(models.Model):
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='room_memberships')
+    joined_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'user'], name='unique_room_membership'),
+        ]
@@ -0,0 +1,189 @@
+"""
+Access to the chat Mongo database.
+
+settings.py used to build a MongoClient at import time. Every manage.py
+command, test run and ASGI worker then paid for the client (and pymongo's
+monitor threads), whether it touched Mongo or not. A client forked into
+another process was unsafe to use, too. Now a client is created on first
+use, once per process, with the pool sizes and timeouts in
+settings.MONGO_CLIENT.
+
+pymongo is blocking. Async code calls it through run(), which uses a thread
+pool of the same size as the connection pool. A burst of queries then waits
+in the executor's queue rather than tying up the event loop, and there is
+never a thread waiting for a connection that doesn't exist.
+
+Connection pool and executor counters are published on /metrics.
+
+Tests point settings.MONGO_DATABASE at a stand-in (a dict of fake
+collections) instead of a real database.
+"""
+import asyncio
+import functools
+import os
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+from server import metrics
+
+
+class PoolStats:
+    """
+    Connection pool counters, fed by pymongo's pool monitoring events.
+    """
+
+    def __init__(self):
+        self.open = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.calls_in_flight = 0
+        self._lock = threading.Lock()
+
+    def listener(self):
+        from pymongo import monitoring
+
+        stats = self
+
+        class Listener(monitoring.ConnectionPoolListener):
+
+            def pool_created(self, event):
+                pass
+
+            def pool_cleared(self, event):
+                pass
+
+            def pool_closed(self, event):
+                pass
+
+            def connection_created(self, event):
+                stats._add('open', 1)
+
+            def connection_ready(self, event):
+                pass
+
+            def connection_closed(self, event):
+                stats._add('open', -1)
+
+            def connection_check_out_started(self, event):
+                pass
+
+            def connection_check_out_failed(self, event):
+                stats._add('checkout_failures', 1)
+
+            def connection_checked_out(self, event):
+                stats._checked_out()
+
+            def connection_checked_in(self, event):
+                stats._add('in_use', -1)
+
+        return Listener()
+
+    def _add(self, name, amount):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _checked_out(self):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def as_dict(self):
+        with self._lock:
+            max_size = settings.MONGO_CLIENT.get('maxPoolSize') or 0
+            return {
+                'open': self.open,
+                'in_use': self.in_use,
+                'max_in_use': self.max_in_use,
+                'utilization': self.in_use / max_size if max_size else 0.0,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'calls_in_flight': self.calls_in_flight,
+            }
+
+
+pool_stats = PoolStats()
+metrics.register_stats('mongo_pool', 'Mongo connection pool and executor counters.', pool_stats.as_dict)
+
+
+_client = None
+_executor = None
+_pid = None
+_lock = threading.Lock()
+
+
+def _start():
+    global _client, _executor, _pid
+    from concurrent.futures import ThreadPoolExecutor
+    from pymongo import MongoClient
+
+    options = dict(settings.MONGO_CLIENT)
+    _client = MongoClient(settings.MONGO_URI, event_listeners=[pool_stats.listener()], **options)
+    _executor = ThreadPoolExecutor(options.get('maxPoolSize') or 100, thread_name_prefix='mongo')
+    _pid = os.getpid()
+
+
+def get_client():
+    """
+    This process's MongoClient, created on first use.
+    """
+    if _client is not None and _pid == os.getpid():
+        return _client
+    with _lock:
+        if _client is None or _pid != os.getpid():
+            _start()
+        return _client
+
+
+def get_database():
+    override = getattr(settings, 'MONGO_DATABASE', None)
+    if override is not None:
+        return override
+    return get_client()[settings.MONGO_DB_NAME]
+
+
+def get_collection(name):
+    return get_database()[name]
+
+
+def get_executor():
+    get_client()
+    return _executor
+
+
+async def run(fn, *args, **kwargs):
+    """
+    Call blocking pymongo code from async code without blocking the loop.
+    """
+    # Stand-in databases don't need a client; the loop's default executor will do.
+    executor = get_executor() if getattr(settings, 'MONGO_DATABASE', None) is None else None
+    pool_stats._add('calls_in_flight', 1)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+    finally:
+        pool_stats._add('calls_in_flight', -1)
+
+
+def close():
+    """
+    Close this process's client and executor, if they were started.
+    """
+    global _client, _executor
+
+    with _lock:
+        client, executor, _client, _executor = _client, _executor, None, None
+    if client is not None and _pid == os.getpid():
+        executor.shutdown(wait=True)
+        client.close()
+
+
+def _reset_client(setting, **kwargs):
+    if setting in ('MONGO_URI', 'MONGO_DB_NAME', 'MONGO_CLIENT'):
+        close()
+
+
+setting_changed.connect(_reset_client)
@@ -0,0 +1,280 @@
+"""
+Write-behind persistence for chat messages.
+
+Consumers hand messages to the process-wide MessageWriter, which returns
+immediately. A background thread coalesces queued messages into
+``insert_many(ordered=False)`` batches, flushing when a batch is full or when
+the oldest queued message has waited ``flush_interval`` seconds. Failed
+batches are retried with backoff and then dead-lettered, and whatever is
+still queued is drained when the process exits.
+
+Settings live in settings.CHAT_MESSAGE_WRITER. The writer is only used when
+CHAT_PERSISTENCE = 'direct'; by default the `persist_messages` worker
+(chats/persistence_worker.py) writes messages from the Kafka topic instead.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+from server import metrics
+from . import mongo
+
+
+DUPLICATE_KEY_ERROR = 11000
+
+INSERT_LATENCY = metrics.histogram('chat_message_writer_insert_seconds', 'Time per insert_many batch.')
+
+
+def message_event(doc):
+    """
+    Kafka payload for a stored message document.
+    """
+    return {
+        "message_id": doc["_id"],
+        "room": doc["room"],
+        "message": doc["message"],
+        "sender_id": doc["sender_id"],
+        "seq": doc.get("seq"),
+        "client_id": doc.get("client_id"),
+        "timestamp": doc["timestamp"].isoformat(),
+    }
+
+
+def message_document(event):
+    """
+    Inverse of message_event(): the Mongo document for a Kafka payload.
+    """
+    doc = {
+        "_id": event["message_id"],
+        "room": event["room"],
+        "message": event["message"],
+        "sender_id": event["sender_id"],
+        "timestamp": datetime.fromisoformat(event["timestamp"]),
+    }
+    if event.get("seq") is not None:
+        doc["seq"] = event["seq"]
+    if event.get("client_id") is not None:
+        doc["client_id"] = event["client_id"]
+    return doc
+
+
+class WriterStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.dead_lettered = 0
+        self.rejected = 0
+        self.high_watermark = 0
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def observe_depth(self, depth):
+        if depth > self.high_watermark:
+            with self._lock:
+                self.high_watermark = max(self.high_watermark, depth)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'batches': self.batches,
+                'retries': self.retries,
+                'dead_lettered': self.dead_lettered,
+                'rejected': self.rejected,
+                'high_watermark': self.high_watermark,
+            }
+
+
+class JsonLinesDeadLetter:
+    """
+    Appends messages that could not be written to a local JSON lines file, so
+    they survive a Mongo outage and can be replayed later.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, docs, error):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._lock, open(self.path, 'a') as fh:
+            for doc in docs:
+                fh.write(json.dumps({'error': repr(error), 'doc': doc}, default=str) + '\n')
+
+
+class MessageWriter:
+
+    def __init__(self, get_collection, dead_letter, batch_size=500, flush_interval=0.1,
+                 max_queue=10000, enqueue_timeout=0.0, max_retries=5, retry_backoff=0.5):
+        self.get_collection = get_collection
+        self.dead_letter = dead_letter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self.stats = WriterStats()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='chat-message-writer', daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def submit(self, doc):
+        """
+        Queue a message for writing. Never blocks for longer than
+        ``enqueue_timeout``; when the queue is still full the message is
+        dead-lettered instead and False is returned.
+        """
+        try:
+            if self.enqueue_timeout:
+                self._queue.put(doc, timeout=self.enqueue_timeout)
+            else:
+                self._queue.put_nowait(doc)
+        except queue.Full:
+            self.stats.incr('rejected')
+            self._dead_letter([doc], queue.Full('write-behind queue is full'))
+            return False
+
+        self.stats.incr('enqueued')
+        self.stats.observe_depth(self._queue.qsize())
+        return True
+
+    def close(self, timeout=10):
+        """
+        Write out everything still queued and stop the background thread.
+        """
+        self._stopping.set()
+        self._thread.join(timeout)
+
+    def _next_batch(self):
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0 and not self._stopping.is_set():
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        # pymongo is imported on first use, not when the consumers are loaded.
+        from pymongo.errors import BulkWriteError
+
+        pending = batch
+        for attempt in range(self.max_retries + 1):
+            try:
+                with INSERT_LATENCY.time():
+                    self.get_collection().insert_many(pending, ordered=False)
+                self.stats.incr('written', len(pending))
+                self.stats.incr('batches')
+                return
+            except BulkWriteError as e:
+                # ordered=False means everything but the reported documents
+                # went in; duplicates are already stored, so only retry the rest.
+                errors = e.details.get('writeErrors', [])
+                failed = {err['index'] for err in errors if err.get('code') != DUPLICATE_KEY_ERROR}
+                self.stats.incr('written', len(pending) - len(failed))
+                pending = [doc for i, doc in enumerate(pending) if i in failed]
+                if not pending:
+                    self.stats.incr('batches')
+                    return
+                error = e
+            except Exception as e:
+                error = e
+
+            if attempt < self.max_retries:
+                self.stats.incr('retries')
+                time.sleep(self.retry_backoff * (2 ** attempt))
+
+        print(f"Error writing chat messages, dead-lettering {len(pending)}: {error}")
+        self._dead_letter(pending, error)
+
+    def _dead_letter(self, docs, error):
+        self.stats.incr('dead_lettered', len(docs))
+        try:
+            self.dead_letter(docs, error)
+        except Exception as e:
+            print(f"Error dead-lettering chat messages: {e}")
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def get_message_writer():
+    """
+    Return this process's MessageWriter, starting it on first use.
+    """
+    global _writer, _writer_pid
+
+    if _writer is not None and _writer_pid == os.getpid():
+        return _writer
+
+    with _writer_lock:
+        if _writer is None or _writer_pid != os.getpid():
+            options = dict(settings.CHAT_MESSAGE_WRITER)
+            dead_letter = JsonLinesDeadLetter(options.pop('dead_letter_path'))
+            _writer = MessageWriter(lambda: mongo.get_collection('messages'), dead_letter, **options)
+            _writer_pid = os.getpid()
+        return _writer
+
+
+def close_message_writer(timeout=10):
+    """
+    Drain and stop the shared writer, if one was started.
+    """
+    global _writer
+
+    with _writer_lock:
+        writer, _writer = _writer, None
+
+    if writer is not None and _writer_pid == os.getpid():
+        writer.close(timeout)
+
+
+def _reset_writer(setting, **kwargs):
+    if setting in ('CHAT_MESSAGE_WRITER', 'MONGO_DATABASE'):
+        close_message_writer()
+
+
+setting_changed.connect(_reset_writer)
+atexit.register(close_message_writer)
+metrics.register_stats(
+    'chat_message_writer', 'Write-behind Mongo writer counters.',
+    lambda: _writer.stats.as_dict() if _writer is not None else {}
+)
@@ -0,0 +1,153 @@
+"""
+Consumer-group worker that persists the chat_messages topic to Mongo.
+
+Each poll returns up to ``batch_size`` records, which are bulk-upserted into
+the messages collection keyed by message id; offsets are committed only once
+that write has succeeded. A crash between the write and the commit replays the
+batch on restart, and the upserts turn the replay into a no-op, so the
+collection sees every message exactly once. Throughput scales by adding
+partitions to the topic and running more workers in the same group.
+
+A batch that still fails after ``max_retries`` attempts is handed to
+``dead_letter`` (as MessageWriter does) and committed, so one bad document
+can't stall its partitions. The retries are capped well inside the
+consumer's max_poll_interval_ms; if the group rebalances anyway, the commit
+fails, and the new owner of the partitions gets the batch again.
+
+Run it with ``python manage.py persist_messages``.
+"""
+import hashlib
+import json
+import time
+from datetime import datetime
+
+from kafka.errors import CommitFailedError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .persistence import DUPLICATE_KEY_ERROR, message_document
+
+
+def deserialize_event(raw):
+    try:
+        return json.loads(raw.decode('utf-8'))
+    except (UnicodeDecodeError, ValueError):
+        return None
+
+
+class MessagePersistenceWorker:
+
+    def __init__(self, consumer, get_collection, dead_letter, batch_size=500, poll_timeout_ms=1000,
+                 max_retries=5, retry_backoff=1.0, max_backoff=30.0):
+        self.consumer = consumer
+        self.get_collection = get_collection
+        self.dead_letter = dead_letter
+        self.batch_size = batch_size
+        self.poll_timeout_ms = poll_timeout_ms
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.stopping = False
+        self.stats = {
+            'batches': 0, 'upserted': 0, 'skipped': 0, 'retries': 0, 'dead_lettered': 0, 'commit_failures': 0,
+        }
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def run(self):
+        while not self.stopping:
+            self.run_once()
+
+    def run_once(self):
+        """
+        Poll one batch, write it and commit it. Returns the number of records
+        processed; if the worker is stopped while the write is still failing,
+        nothing is committed and the batch will be redelivered.
+        """
+        polled = self.consumer.poll(timeout_ms=self.poll_timeout_ms, max_records=self.batch_size)
+        records = [record for partition_records in polled.values() for record in partition_records]
+        if not records:
+            return 0
+
+        docs = []
+        for record in records:
+            doc = self.to_document(record)
+            if doc is None:
+                self.stats['skipped'] += 1
+                continue
+            docs.append(doc)
+
+        if docs and not self._write(docs):
+            return 0
+
+        try:
+            self.consumer.commit()
+        except CommitFailedError as e:
+            # The partitions were reassigned while the batch was written.
+            # Whoever has them now gets it again, and the upserts dedupe it.
+            self.stats['commit_failures'] += 1
+            print(f"Error committing chat message offsets, batch will be redelivered: {e}")
+            return 0
+        self.stats['batches'] += 1
+        return len(records)
+
+    @staticmethod
+    def to_document(record):
+        event = record.value
+        try:
+            if 'message_id' not in event:
+                # Published before messages carried an id: derive a stable
+                # one from the record's position so replays still dedupe.
+                position = f"{record.topic}:{record.partition}:{record.offset}"
+                event = dict(event, message_id=hashlib.sha1(position.encode()).hexdigest())
+            if 'timestamp' not in event:
+                event = dict(event, timestamp=datetime.utcfromtimestamp(record.timestamp / 1000).isoformat())
+            return message_document(event)
+        except (TypeError, KeyError, ValueError):
+            return None
+
+    def _write(self, docs):
+        """
+        Upsert ``docs``, retrying the ones that fail. Returns False if the
+        worker was stopped first, leaving the batch uncommitted.
+        """
+        pending = docs
+        backoff = self.retry_backoff
+        for attempt in range(self.max_retries + 1):
+            operations = [UpdateOne({'_id': doc['_id']}, {'$setOnInsert': doc}, upsert=True) for doc in pending]
+            try:
+                result = self.get_collection().bulk_write(operations, ordered=False)
+                self.stats['upserted'] += result.upserted_count
+                return True
+            except BulkWriteError as e:
+                # Two workers racing on the same _id can both try the insert
+                # half of the upsert; the loser's duplicate key error is fine.
+                # ordered=False wrote the rest, so only retry what failed.
+                self.stats['upserted'] += e.details.get('nUpserted', 0)
+                errors = e.details.get('writeErrors', [])
+                failed = {err['index'] for err in errors if err.get('code') != DUPLICATE_KEY_ERROR}
+                pending = [doc for i, doc in enumerate(pending) if i in failed]
+                if not pending:
+                    return True
+                error = e
+            except Exception as e:
+                error = e
+
+            if self.stopping:
+                return False
+            if attempt < self.max_retries:
+                print(f"Error persisting chat messages, retrying in {backoff:.1f}s: {error}")
+                self.stats['retries'] += 1
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+        print(f"Error persisting chat messages, dead-lettering {len(pending)}: {error}")
+        self.stats['dead_lettered'] += len(pending)
+        try:
+            self.dead_letter(pending, error)
+        except Exception as e:
+            # Nowhere to put the batch: leave it uncommitted to be redelivered.
+            print(f"Error dead-lettering chat messages: {e}")
+            return False
+        return True
@@ -0,0 +1,179 @@
+"""
+Process-wide Kafka producer shared by every chat connection.
+
+Connections used to open their own KafkaProducer and flush after every frame.
+Now there is one lazily created producer per process: sends are asynchronous
+and batched by the client (linger/batch size/compression come from
+settings.KAFKA_PRODUCER), delivery results are counted in callbacks, and the
+producer is flushed once when the process exits.
+
+The implementation is chosen with settings.CHAT_PRODUCER_BACKEND so it can be
+swapped for InMemoryProducer in tests and benchmarks.
+"""
+import atexit
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+from server import metrics
+
+
+class ProducerStats:
+    """
+    Delivery counters, updated from the Kafka client's I/O thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.delivered = 0
+        self.failed = 0
+        self.last_error = None
+
+    def record_sent(self):
+        with self._lock:
+            self.sent += 1
+
+    def record_delivered(self, *args):
+        with self._lock:
+            self.delivered += 1
+
+    def record_failed(self, exc):
+        with self._lock:
+            self.failed += 1
+            self.last_error = repr(exc)
+
+    @property
+    def pending(self):
+        return self.sent - self.delivered - self.failed
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'sent': self.sent,
+                'delivered': self.delivered,
+                'failed': self.failed,
+                'pending': self.sent - self.delivered - self.failed,
+                'last_error': self.last_error,
+            }
+
+
+def serialize_key(key):
+    # kafka-python runs the serializer for keyless sends too.
+    return key.encode('utf-8') if key is not None else None
+
+
+class KafkaMessageProducer:
+    """
+    Thin wrapper around kafka.KafkaProducer that never blocks on delivery.
+    """
+
+    def __init__(self, bootstrap_servers, **options):
+        from kafka import KafkaProducer
+
+        self.stats = ProducerStats()
+        self._producer = KafkaProducer(
+            bootstrap_servers=bootstrap_servers,
+            key_serializer=serialize_key,
+            value_serializer=lambda v: json.dumps(v).encode('utf-8'),
+            **options
+        )
+
+    def send(self, topic, value, key=None):
+        future = self._producer.send(topic, value=value, key=key)
+        self.stats.record_sent()
+        future.add_callback(self.stats.record_delivered)
+        future.add_errback(self._on_error)
+        return future
+
+    def _on_error(self, exc):
+        self.stats.record_failed(exc)
+        print(f"Error delivering to Kafka: {exc}")
+
+    def flush(self, timeout=None):
+        self._producer.flush(timeout=timeout)
+
+    def close(self, timeout=None):
+        self._producer.close(timeout=timeout)
+
+
+class InMemoryProducer:
+    """
+    Broker-less stand-in with the same interface, for tests and benchmarks.
+    Everything sent is kept in ``messages`` as (topic, key, value) tuples.
+    """
+
+    def __init__(self, bootstrap_servers=None, **options):
+        self.stats = ProducerStats()
+        self.messages = []
+        self.closed = False
+
+    def send(self, topic, value, key=None):
+        self.stats.record_sent()
+        self.messages.append((topic, key, value))
+        self.stats.record_delivered()
+
+    def flush(self, timeout=None):
+        pass
+
+    def close(self, timeout=None):
+        self.closed = True
+
+
+_producer = None
+_producer_pid = None
+_producer_lock = threading.Lock()
+
+
+def get_producer():
+    """
+    Return this process's shared producer, creating it on first use.
+
+    The pid check makes sure a forked worker builds its own client instead of
+    inheriting the parent's sender thread and sockets.
+    """
+    global _producer, _producer_pid
+
+    if _producer is not None and _producer_pid == os.getpid():
+        return _producer
+
+    with _producer_lock:
+        if _producer is None or _producer_pid != os.getpid():
+            backend = import_string(settings.CHAT_PRODUCER_BACKEND)
+            _producer = backend(settings.KAFKA_BOOTSTRAP_SERVERS, **settings.KAFKA_PRODUCER)
+            _producer_pid = os.getpid()
+        return _producer
+
+
+def close_producer(timeout=10):
+    """
+    Flush outstanding messages and close the shared producer, if any.
+    """
+    global _producer
+
+    with _producer_lock:
+        producer, _producer = _producer, None
+
+    if producer is not None and _producer_pid == os.getpid():
+        try:
+            producer.flush(timeout=timeout)
+            producer.close(timeout=timeout)
+        except Exception as e:
+            print(f"Error closing Kafka producer: {e}")
+
+
+def _reset_producer(setting, **kwargs):
+    if setting in ('CHAT_PRODUCER_BACKEND', 'KAFKA_PRODUCER', 'KAFKA_BOOTSTRAP_SERVERS'):
+        close_producer()
+
+
+setting_changed.connect(_reset_producer)
+atexit.register(close_producer)
+metrics.register_stats(
+    'chat_producer', 'Kafka producer delivery counters.',
+    lambda: _producer.stats.as_dict() if _producer is not None else {}
+)
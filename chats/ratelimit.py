@@ -0,0 +1,169 @@
+"""
+Token-bucket flood protection for inbound chat frames.
+
+Every frame a client sends is fanned out to the whole room and written to
+Kafka. One client in a loop can therefore eat the fan-out capacity of
+everyone else. Each frame now takes a token from two buckets: one for the
+sender and one for the room. Each bucket refills at ``rate`` tokens per
+second, up to ``burst`` tokens. A frame is only let through when both
+buckets have a token, and then both are charged. A rejected frame is
+answered with an error frame that tells the client which limit it hit and
+when to retry.
+
+Two backends, chosen with settings.CHAT_RATE_LIMIT_BACKEND:
+
+* InMemoryRateLimiter keeps buckets per process, so with N workers a client
+  can get up to N times the configured rate.
+* RedisRateLimiter checks and charges both buckets in one Lua script, so the
+  limits hold across all workers.
+
+Both have ``async allow(user_id, room_name)``, which charges one token from
+each bucket. It returns None if the frame may go through, otherwise
+``(scope, retry_after)`` for the first empty bucket.
+
+Limits are set in settings.CHAT_RATE_LIMIT. Set a scope to None to turn it
+off.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+
+def rate_limited_frame(scope, retry_after):
+    """
+    Sent in place of a rejected frame; the connection stays open.
+    """
+    return {"type": "error", "code": "rate_limited", "scope": scope, "retry_after": round(retry_after, 3)}
+
+
+class BaseRateLimiter:
+    """
+    The enabled limits and their bucket names, shared by both backends.
+    """
+
+    def __init__(self, user=None, room=None):
+        self.limits = [(scope, limit) for scope, limit in (('user', user), ('room', room)) if limit]
+
+    def bucket_keys(self, user_id, room_name):
+        names = {'user': f"user:{user_id}", 'room': f"room:{room_name}"}
+        return [names[scope] for scope, _ in self.limits]
+
+
+class InMemoryRateLimiter(BaseRateLimiter):
+
+    # Buckets that have refilled completely are no different from a missing
+    # bucket, so every SWEEP_INTERVAL calls they are dropped.
+    SWEEP_INTERVAL = 10000
+
+    def __init__(self, user=None, room=None, clock=time.monotonic):
+        super().__init__(user, room)
+        self.clock = clock
+        self._buckets = {}
+        self._calls = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, key, limit, now):
+        tokens, updated = self._buckets.get(key, (limit['burst'], now))
+        return min(limit['burst'], tokens + (now - updated) * limit['rate'])
+
+    async def allow(self, user_id, room_name):
+        keys = self.bucket_keys(user_id, room_name)
+        with self._lock:
+            now = self.clock()
+            levels = []
+            for key, (scope, limit) in zip(keys, self.limits):
+                tokens = self._refill(key, limit, now)
+                if tokens < 1:
+                    return scope, (1 - tokens) / limit['rate']
+                levels.append(tokens)
+
+            for key, tokens in zip(keys, levels):
+                self._buckets[key] = (tokens - 1, now)
+
+            self._calls += 1
+            if self._calls % self.SWEEP_INTERVAL == 0:
+                self._sweep(now)
+        return None
+
+    def _sweep(self, now):
+        limits = dict(self.limits)
+        for key in list(self._buckets):
+            limit = limits[key.split(':', 1)[0]]
+            if self._refill(key, limit, now) >= limit['burst']:
+                del self._buckets[key]
+
+
+# KEYS are the bucket hashes, ARGV holds rate and burst for each of them.
+# Uses the server clock, so workers with skewed clocks still agree.
+TOKEN_BUCKET_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local levels = {}
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + (now - updated) * rate)
+    if tokens < 1 then
+        return {i, tostring((1 - tokens) / rate)}
+    end
+    levels[i] = tokens
+end
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    redis.call('HSET', KEYS[i], 'tokens', tostring(levels[i] - 1), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[i], math.ceil(burst / rate) + 1)
+end
+return {0, '0'}
+"""
+
+
+class RedisRateLimiter(BaseRateLimiter):
+
+    def __init__(self, url, user=None, room=None):
+        import redis.asyncio as redis
+
+        super().__init__(user, room)
+        self.redis = redis.from_url(url)
+        self.script = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def allow(self, user_id, room_name):
+        if not self.limits:
+            return None
+        keys = [f"chat:ratelimit:{key}" for key in self.bucket_keys(user_id, room_name)]
+        args = []
+        for _, limit in self.limits:
+            args += [limit['rate'], limit['burst']]
+        denied, retry_after = await self.script(keys=keys, args=args)
+        if not denied:
+            return None
+        scope, _ = self.limits[int(denied) - 1]
+        return scope, float(retry_after)
+
+
+_rate_limiter = None
+
+
+def get_rate_limiter():
+    global _rate_limiter
+
+    if _rate_limiter is None:
+        backend = import_string(settings.CHAT_RATE_LIMIT_BACKEND)
+        options = settings.CHAT_RATE_LIMIT
+        _rate_limiter = backend(user=options['user'], room=options['room'], **options['OPTIONS'])
+    return _rate_limiter
+
+
+def _reset_rate_limiter(setting, **kwargs):
+    global _rate_limiter
+    if setting in ('CHAT_RATE_LIMIT_BACKEND', 'CHAT_RATE_LIMIT'):
+        _rate_limiter = None
+
+
+setting_changed.connect(_reset_rate_limiter)
@@ -0,0 +1,51 @@
+"""
+Room lookup, access checks and channel layer group naming.
+
+Every room maps to one channel layer group, ``chat_<room>``, so a broadcast
+only reaches that room's members. Rooms with ``shard_count > 1`` are split
+into ``chat_<room>_<n>`` sub-groups: each connection joins one of them
+(picked by hashing its channel name) and a broadcast is sent to every
+sub-group, so no single group_send has to walk thousands of channels.
+"""
+import zlib
+
+from django.conf import settings
+
+from .models import Room
+
+
+def room_groups(room_name, shard_count=1):
+    if shard_count <= 1:
+        return [f"chat_{room_name}"]
+    return [f"chat_{room_name}_{shard}" for shard in range(shard_count)]
+
+
+def group_for_channel(room_name, shard_count, channel_name):
+    groups = room_groups(room_name, shard_count)
+    return groups[zlib.crc32(channel_name.encode()) % len(groups)]
+
+
+def get_room_for_user(user, room_name):
+    """
+    Return the Room if ``user`` may join it, otherwise None.
+
+    Anonymous users can't join any room; public rooms are open to every
+    authenticated user and private rooms only to their members.
+    """
+    if user is None or not user.is_authenticated:
+        return None
+
+    room = Room.objects.filter(name=room_name).first()
+    if room is None:
+        return None
+    if room.is_public or room.memberships.filter(user=user).exists():
+        return room
+    return None
+
+
+def requested_room_name(scope):
+    """
+    Room named in the URL, or CHAT_DEFAULT_ROOM for the legacy ws/chat/ route.
+    """
+    kwargs = scope.get('url_route', {}).get('kwargs', {})
+    return kwargs.get('room_name', settings.CHAT_DEFAULT_ROOM)
@@ -1,6 +1,22 @@
+from django.conf import settings
 from django.urls import path
 from . import consumers 
 
+
+def get_group_consumer():
+    """
+    Pick the chat consumer implementation from settings.CHAT_CONSUMER so the
+    sync and async versions can be A/B tested ('sync' or 'async').
+    """
+    if getattr(settings, 'CHAT_CONSUMER', 'async') == 'sync':
+        return consumers.GroupConsumer
+    return consumers.AsyncGroupConsumer
+
+
+consumer = get_group_consumer().as_asgi()
+
 websocket_urlpatterns = [
-    path("ws/chat/", consumers.GroupConsumer.as_asgi()),
+    path("ws/chat/<slug:room_name>/", consumer),
+    # Legacy route, joins settings.CHAT_DEFAULT_ROOM.
+    path("ws/chat/", consumer),
 ]
@@ -0,0 +1,88 @@
+"""
+Full-text search over a room's messages.
+
+Backed by the ``room_message_text`` index (chats/indexes.py), a Mongo text
+index on ``message`` with ``room`` as an equality prefix and ``sender_id``
+as a suffix. Because of the prefix, a search only reads the postings of
+one room, so its cost depends on the size of that room's matching history,
+not on the size of the collection. A sender filter is answered from the
+index entries as well, without fetching the documents it excludes.
+
+``q`` uses Mongo's $text syntax: words match any of them (stemmed, stop
+words ignored), "quoted phrases" must all appear, and -word excludes.
+
+Results are ranked by text score, newest first among equal scores. Pages
+use a keyset cursor on (score, timestamp, _id), like room history, so a
+page never repeats or skips a message.
+"""
+import base64
+import json
+
+from .history import InvalidCursor, decode_cursor, encode_cursor
+
+
+SEARCH_PROJECTION = {'message': 1, 'sender_id': 1, 'timestamp': 1, 'score': 1}
+
+MAX_QUERY_LENGTH = 200
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+def encode_search_cursor(doc):
+    key = {'score': doc['score'], 'after': encode_cursor(doc)}
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+
+def decode_search_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        score = float(key['score'])
+        timestamp, _id = decode_cursor(key['after'])
+    except Exception:
+        raise InvalidCursor(cursor)
+    return score, timestamp, _id
+
+
+def search_pipeline(room_name, query, limit, sender_id=None, cursor=None):
+    match = {'room': room_name, '$text': {'$search': query}}
+    if sender_id is not None:
+        match['sender_id'] = sender_id
+
+    pipeline = [
+        {'$match': match},
+        {'$addFields': {'score': {'$meta': 'textScore'}}},
+    ]
+    if cursor:
+        score, timestamp, _id = decode_search_cursor(cursor)
+        pipeline.append({'$match': {'$or': [
+            {'score': {'$lt': score}},
+            {'score': score, 'timestamp': {'$lt': timestamp}},
+            {'score': score, 'timestamp': timestamp, '_id': {'$lt': _id}},
+        ]}})
+    # $sort followed by $limit is a top-k sort; only limit + 1 documents are
+    # kept in memory however many match.
+    pipeline += [
+        {'$sort': {'score': -1, 'timestamp': -1, '_id': -1}},
+        {'$limit': limit + 1},
+        {'$project': SEARCH_PROJECTION},
+    ]
+    return pipeline
+
+
+def search_messages(collection, room_name, query, limit, sender_id=None, cursor=None):
+    """
+    Return (messages, next_cursor) for one page of ``room_name``'s messages
+    matching ``query``, best match first. ``next_cursor`` is None on the
+    last page.
+    """
+    query = (query or '').strip()
+    if not query or len(query) > MAX_QUERY_LENGTH:
+        raise InvalidQuery(query)
+
+    docs = list(collection.aggregate(search_pipeline(room_name, query, limit, sender_id, cursor)))
+
+    next_cursor = encode_search_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
@@ -0,0 +1,208 @@
+"""
+Bounded outbound queue for each WebSocket connection.
+
+chat_message used to send every frame straight to the client. For a client
+on a slow link those frames pile up in the server without limit. Now
+frames go into a per-connection queue of settings.CHAT_SEND_QUEUE
+['max_size'] entries, and a writer task drains it. When the queue is full,
+the policy decides what happens:
+
+* 'drop_oldest' discards the oldest queued frame.
+* 'coalesce' discards the oldest frame too, but remembers the seq range
+  it covered. The client gets a single ``{"type": "gap", ...}`` frame
+  before the next message, so it can fetch what it missed with
+  ``?last_seq=`` or the history API.
+* 'disconnect' closes the socket with SLOW_CONSUMER. The client reconnects
+  and replays from its last seq.
+
+Frames queued with a ``key`` replace an older queued frame that has the
+same key, and they never count against the limit twice.
+
+The writer awaits the ASGI send. How much backpressure that gives depends
+on the server: uvicorn waits for the socket to drain, while Daphne buffers
+in Twisted. Either way, the consumer keeps at most max_size frames per
+connection, and its channel layer queue keeps draining. Depths and drops
+are added up process-wide in ``send_queue_stats``.
+"""
+import asyncio
+from collections import OrderedDict
+
+from django.conf import settings
+
+from server import metrics
+from .wire import OutgoingFrame
+
+
+DROP_OLDEST = 'drop_oldest'
+COALESCE = 'coalesce'
+DISCONNECT = 'disconnect'
+POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+# Close code sent to a client that can't keep up under the 'disconnect' policy.
+SLOW_CONSUMER = 4408
+
+
+class SendQueueStats:
+    """
+    Process-wide counters. Only touched from the event loop, so no lock.
+    """
+
+    def __init__(self):
+        self.connections = 0
+        self.depth = 0
+        self.high_watermark = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.disconnected = 0
+
+    def as_dict(self):
+        return {
+            'connections': self.connections,
+            'depth': self.depth,
+            'high_watermark': self.high_watermark,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'disconnected': self.disconnected,
+        }
+
+
+send_queue_stats = SendQueueStats()
+metrics.register_stats('chat_send_queue', 'Per-connection outbound queue counters.', send_queue_stats.as_dict)
+
+
+def gap_frame(first_seq, last_seq, count):
+    return {"type": "gap", "first_seq": first_seq, "last_seq": last_seq, "count": count}
+
+
+class OutboundQueue:
+    """
+    One connection's queue and writer task.
+
+    ``send`` is an async callable taking an OutgoingFrame, and ``close`` an
+    async callable taking a close code. Both are usually thin wrappers around
+    the consumer's base_send. Plain dicts put on the queue are wrapped in an
+    OutgoingFrame.
+    """
+
+    def __init__(self, send, close, max_size=256, policy=COALESCE, stats=send_queue_stats):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown send queue policy {policy!r}, expected one of {POLICIES}")
+        self._send = send
+        self._close = close
+        self.max_size = max_size
+        self.policy = policy
+        self.stats = stats
+        self.dropped = 0
+        self.closed = False
+        self._frames = OrderedDict()
+        self._counter = 0
+        self._gap = None
+        self._ready = asyncio.Event()
+        self._writer = None
+
+    @classmethod
+    def from_settings(cls, send, close):
+        options = settings.CHAT_SEND_QUEUE
+        return cls(send, close, max_size=options['max_size'], policy=options['policy'])
+
+    @property
+    def depth(self):
+        return len(self._frames)
+
+    async def start(self):
+        if self._writer is None:
+            self.stats.connections += 1
+            self._writer = asyncio.ensure_future(self._run())
+
+    async def put(self, frame, key=None):
+        """
+        Queue a frame without waiting. Returns False if the frame was not
+        queued because the queue is closed.
+        """
+        if self.closed:
+            return False
+        if not isinstance(frame, OutgoingFrame):
+            frame = OutgoingFrame(frame)
+
+        if key is not None and key in self._frames:
+            self._frames[key] = frame
+            self.stats.coalesced += 1
+            return True
+
+        if len(self._frames) >= self.max_size:
+            if self.policy == DISCONNECT:
+                await self._disconnect()
+                return False
+            self._drop_oldest()
+
+        if key is None:
+            self._counter += 1
+            key = ('frame', self._counter)
+        self._frames[key] = frame
+        self.stats.depth += 1
+        if self.stats.depth > self.stats.high_watermark:
+            self.stats.high_watermark = self.stats.depth
+        self._ready.set()
+        return True
+
+    def _drop_oldest(self):
+        _, frame = self._frames.popitem(last=False)
+        self.stats.depth -= 1
+        self.dropped += 1
+        self.stats.dropped += 1
+
+        seq = frame.get("seq")
+        if self.policy == COALESCE and seq is not None:
+            if self._gap is None:
+                self._gap = [seq, seq, 0]
+            self._gap[0] = min(self._gap[0], seq)
+            self._gap[1] = max(self._gap[1], seq)
+            self._gap[2] += 1
+            self.stats.coalesced += 1
+
+    async def _disconnect(self):
+        self.stats.disconnected += 1
+        await self.close()
+        try:
+            await self._close(SLOW_CONSUMER)
+        except Exception as e:
+            print(f"Error closing slow consumer: {e}")
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            while self._frames or self._gap:
+                if self._gap is not None:
+                    first_seq, last_seq, count = self._gap
+                    self._gap = None
+                    frame = OutgoingFrame(gap_frame(first_seq, last_seq, count))
+                else:
+                    _, frame = self._frames.popitem(last=False)
+                    self.stats.depth -= 1
+                try:
+                    await self._send(frame)
+                    self.stats.sent += 1
+                except Exception as e:
+                    print(f"Error sending frame: {e}")
+            self._ready.clear()
+
+    async def close(self):
+        """
+        Stop the writer and forget whatever is still queued.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.stats.depth -= len(self._frames)
+        self._frames.clear()
+        self._gap = None
+        if self._writer is not None:
+            self.stats.connections -= 1
+            self._writer.cancel()
+            if self._writer is not asyncio.current_task():
+                try:
+                    await self._writer
+                except asyncio.CancelledError:
+                    pass
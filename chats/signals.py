@@ -0,0 +1,21 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_tokens_for_user(sender, instance, **kwargs):
+    # Imported lazily: the middleware module builds its cache from settings.
+    from .Jwtmiddleware import token_user_cache
+    token_user_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def drop_cached_tokens_on_blacklist(sender, instance, created, **kwargs):
+    from .Jwtmiddleware import token_user_cache
+    if created and instance.token.user_id is not None:
+        token_user_cache.invalidate_user(instance.token.user_id)
@@ -0,0 +1,297 @@
+"""
+In-memory stand-ins for the chat backends, used by the tests and benchmarks.
+"""
+import copy
+import itertools
+import re
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+from pymongo.errors import BulkWriteError
+
+from .indexes import stored_keys
+
+
+class FakeBulkWriteResult:
+
+    def __init__(self, upserted_count=0, inserted_count=0):
+        self.upserted_count = upserted_count
+        self.inserted_count = inserted_count
+
+
+def _compare(op, value, arg):
+    if op == '$in':
+        return value in arg
+    if op == '$nin':
+        return value not in arg
+    if op == '$ne':
+        return value != arg
+    if op == '$exists':
+        return (value is not None) == arg
+    if value is None:
+        return False
+    if op == '$lt':
+        return value < arg
+    if op == '$lte':
+        return value <= arg
+    if op == '$gt':
+        return value > arg
+    if op == '$gte':
+        return value >= arg
+    raise NotImplementedError(op)
+
+
+def matches(doc, query):
+    """
+    Evaluate the small subset of Mongo query syntax the chat code uses.
+    """
+    for key, condition in query.items():
+        if key == '$or':
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == '$and':
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(k.startswith('$') for k in condition):
+            if not all(_compare(op, doc.get(key), arg) for op, arg in condition.items()):
+                return False
+        elif doc.get(key) != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+
+    def __init__(self, docs, projection=None):
+        self._docs = docs
+        self._projection = projection
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=1):
+        keys = [(key_or_list, direction)] if isinstance(key_or_list, str) else key_or_list
+        for key, direction in reversed(keys):
+            self._docs.sort(key=lambda doc: doc.get(key), reverse=direction < 0)
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def __iter__(self):
+        docs = self._docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        for doc in docs:
+            if self._projection:
+                fields = {k for k, v in self._projection.items() if v} | {'_id'}
+                doc = {k: v for k, v in doc.items() if k in fields}
+            yield copy.deepcopy(doc)
+
+
+class FakeCollection:
+    """
+    A tiny subset of pymongo's Collection API backed by a list.
+
+    ``_id`` is unique, as is ``unique_key`` when given, and violations are
+    reported as duplicate key write errors. ``fail_next`` makes the next N
+    write calls raise ``error`` so retry paths can be exercised.
+    """
+
+    def __init__(self, unique_key=None):
+        self.docs = []
+        self.unique_key = unique_key
+        self.indexes = {'_id_': {'key': [('_id', 1)]}}
+        self.fail_next = 0
+        self.error = ConnectionError('fake collection is down')
+        self.calls = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def find(self, query=None, projection=None):
+        with self._lock:
+            return FakeCursor([doc for doc in self.docs if matches(doc, query or {})], projection)
+
+    def find_one(self, query=None, projection=None, sort=None):
+        cursor = self.find(query, projection)
+        if sort:
+            cursor.sort(sort)
+        return next(iter(cursor.limit(1)), None)
+
+    def count_documents(self, query):
+        return len(list(self.find(query)))
+
+    def create_indexes(self, indexes):
+        names = []
+        for index in indexes:
+            spec = dict(index.document)
+            name = spec.pop('name')
+            keys, weights = stored_keys(spec.pop('key').items())
+            self.indexes[name] = dict(spec, key=keys, **({'weights': weights} if weights else {}))
+            names.append(name)
+        return names
+
+    def aggregate(self, pipeline):
+        """
+        Supports the $match, $addFields, $sort, $limit and $project stages
+        chats/search.py uses. $text matches messages containing any of the
+        search words; the score is how many of them they contain.
+        """
+        with self._lock:
+            docs = [(doc, 0) for doc in self.docs]
+        for stage in pipeline:
+            (op, arg), = stage.items()
+            if op == '$match':
+                arg = dict(arg)
+                text = arg.pop('$text', None)
+                if text is not None:
+                    terms = set(re.findall(r'\w+', text['$search'].lower()))
+                    docs = [(doc, len(terms & set(re.findall(r'\w+', (doc.get('message') or '').lower()))))
+                            for doc, _ in docs]
+                    docs = [(doc, score) for doc, score in docs if score]
+                docs = [(doc, score) for doc, score in docs if matches(doc, arg)]
+            elif op == '$addFields':
+                if any(value != {'$meta': 'textScore'} for value in arg.values()):
+                    raise NotImplementedError(arg)
+                docs = [(dict(doc, **{field: score for field in arg}), score) for doc, score in docs]
+            elif op == '$sort':
+                for key, direction in reversed(list(arg.items())):
+                    docs.sort(key=lambda item: item[0].get(key), reverse=direction < 0)
+            elif op == '$limit':
+                docs = docs[:arg]
+            elif op == '$project':
+                fields = {k for k, v in arg.items() if v} | {'_id'}
+                docs = [({k: v for k, v in doc.items() if k in fields}, score) for doc, score in docs]
+            else:
+                raise NotImplementedError(op)
+        return iter([copy.deepcopy(doc) for doc, _ in docs])
+
+    def index_information(self):
+        return copy.deepcopy(self.indexes)
+
+    def _maybe_fail(self):
+        if self.fail_next:
+            self.fail_next -= 1
+            raise self.error
+
+    def _conflicts(self, doc):
+        for stored in self.docs:
+            if stored.get('_id') == doc['_id']:
+                return True
+            if self.unique_key and stored.get(self.unique_key) == doc.get(self.unique_key):
+                return True
+        return False
+
+    def insert_many(self, docs, ordered=True):
+        with self._lock:
+            self.calls.append(('insert_many', len(docs)))
+            self._maybe_fail()
+
+            write_errors = []
+            for index, doc in enumerate(docs):
+                doc.setdefault('_id', next(self._ids))
+                if self._conflicts(doc):
+                    write_errors.append({'index': index, 'code': 11000, 'errmsg': 'duplicate key'})
+                    if ordered:
+                        break
+                    continue
+                self.docs.append(copy.deepcopy(doc))
+
+            if write_errors:
+                raise BulkWriteError({'writeErrors': write_errors, 'nUpserted': 0})
+            return FakeBulkWriteResult(inserted_count=len(docs))
+
+    def insert_one(self, doc):
+        self.insert_many([doc])
+
+    def bulk_write(self, requests, ordered=True):
+        """
+        Supports UpdateOne(filter, {'$setOnInsert': doc}, upsert=True).
+        """
+        with self._lock:
+            self.calls.append(('bulk_write', len(requests)))
+            self._maybe_fail()
+
+            upserted = 0
+            for request in requests:
+                query, update = request._filter, request._doc
+                if any(all(stored.get(k) == v for k, v in query.items()) for stored in self.docs):
+                    continue
+                if request._upsert:
+                    doc = dict(query, **update.get('$setOnInsert', {}))
+                    self.docs.append(copy.deepcopy(doc))
+                    upserted += 1
+            return FakeBulkWriteResult(upserted_count=upserted)
+
+
+FakeRecord = namedtuple('FakeRecord', 'topic partition offset key value timestamp')
+FakeTopicPartition = namedtuple('FakeTopicPartition', 'topic partition')
+
+
+class FakeBroker:
+    """
+    Partitioned, in-memory topics with per-group committed offsets, enough to
+    run consumer-group workers without Kafka.
+    """
+
+    def __init__(self, partitions=1):
+        self.partitions = partitions
+        self.topics = {}
+        self.committed = {}
+
+    def produce(self, topic, value, key=None):
+        partitions = self.topics.setdefault(topic, [[] for _ in range(self.partitions)])
+        partition = zlib.crc32(key.encode()) % self.partitions if key else 0
+        log = partitions[partition]
+        log.append(FakeRecord(topic, partition, len(log), key, value, int(time.time() * 1000)))
+
+    def consumer(self, topic, group, partitions=None):
+        if partitions is None:
+            partitions = range(self.partitions)
+        return FakeConsumer(self, topic, group, list(partitions))
+
+
+class FakeConsumer:
+    """
+    Mimics KafkaConsumer.poll()/commit() with manual offset commits. A new
+    consumer resumes from the group's committed offsets, like a restarted
+    worker would.
+    """
+
+    def __init__(self, broker, topic, group, partitions):
+        self.broker = broker
+        self.topic = topic
+        self.group = group
+        self.positions = {
+            p: broker.committed.get((group, topic, p), 0) for p in partitions
+        }
+        self.closed = False
+
+    def poll(self, timeout_ms=0, max_records=500):
+        logs = self.broker.topics.get(self.topic, [])
+        batch = {}
+        remaining = max_records
+        for partition, position in self.positions.items():
+            if remaining <= 0 or partition >= len(logs):
+                continue
+            records = logs[partition][position:position + remaining]
+            if records:
+                batch[FakeTopicPartition(self.topic, partition)] = records
+                self.positions[partition] = position + len(records)
+                remaining -= len(records)
+        return batch
+
+    def commit(self):
+        for partition, position in self.positions.items():
+            self.broker.committed[(self.group, self.topic, partition)] = position
+
+    def close(self, autocommit=True):
+        if autocommit:
+            self.commit()
+        self.closed = True
@@ -0,0 +1,96 @@
+import json
+from datetime import datetime
+
+from django.test import SimpleTestCase, override_settings
+
+from chats.backlog import InMemoryBacklog, replay_frames, requested_last_seq
+from chats.consumers import AsyncGroupConsumer, GroupConsumer
+from chats.testing import FakeCollection
+from chats.tests.test_consumers import GroupConsumerTestCase
+
+
+def frame(seq):
+    return {'message': f"m{seq}", 'seq': seq}
+
+
+class InMemoryBacklogTests(SimpleTestCase):
+
+    def setUp(self):
+        self.collection = FakeCollection()
+        self.enterContext(override_settings(MONGO_DATABASE={'messages': self.collection}))
+        self.backlog = InMemoryBacklog(size=5)
+
+    async def test_sequence_is_seeded_from_store(self):
+        self.collection.docs.append({'_id': 'x', 'room': 'team', 'seq': 41})
+        self.assertEqual(await self.backlog.next_seq('team'), 42)
+        self.assertEqual(await self.backlog.next_seq('team'), 43)
+        self.assertEqual(await self.backlog.next_seq('other'), 1)
+
+    async def test_gap_within_buffer_is_replayed_from_memory(self):
+        for seq in range(1, 9):
+            self.backlog.observe('team', seq, frame(seq))
+
+        self.assertEqual(await self.backlog.since('team', 6), [frame(7), frame(8)])
+        self.assertEqual(await self.backlog.since('team', 8), [])
+        self.assertEqual(await self.backlog.recent('team', 2), [frame(7), frame(8)])
+
+    async def test_gap_beyond_buffer_is_unknown(self):
+        for seq in range(1, 9):
+            self.backlog.observe('team', seq, frame(seq))
+
+        self.assertIsNone(await self.backlog.since('team', 2))
+        self.assertIsNone(await self.backlog.since('empty', 0))
+
+    async def test_out_of_order_and_duplicate_observations(self):
+        for seq in (1, 3, 2, 3, 4):
+            self.backlog.observe('team', seq, frame(seq))
+        self.assertEqual(await self.backlog.since('team', 0), [frame(1), frame(2), frame(3), frame(4)])
+
+    def test_requested_last_seq(self):
+        self.assertEqual(requested_last_seq({'query_string': b'last_seq=12'}), 12)
+        self.assertIsNone(requested_last_seq({'query_string': b'last_seq=x'}))
+        self.assertIsNone(requested_last_seq({}))
+
+
+@override_settings(CHAT_BACKLOG={'OPTIONS': {'size': 3}, 'join_count': 2, 'max_replay': 10})
+class ReplayTests(GroupConsumerTestCase):
+
+    async def send_messages(self, count):
+        sender = await self.connect(self.alice)
+        for i in range(count):
+            await sender.send_to(text_data=json.dumps({"message": f"m{i + 1}"}))
+        for _ in range(count):
+            await sender.receive_from()
+        await sender.disconnect()
+
+    async def received(self, communicator):
+        frames = []
+        while not await communicator.receive_nothing(timeout=0.05):
+            frames.append(json.loads(await communicator.receive_from()))
+        await communicator.disconnect()
+        return [f["seq"] for f in frames]
+
+    async def test_join_gets_recent_backlog(self):
+        await self.send_messages(3)
+        for consumer_class in (GroupConsumer, AsyncGroupConsumer):
+            client = await self.connect(self.bob, consumer_class=consumer_class)
+            self.assertEqual(await self.received(client), [2, 3])
+
+    async def test_reconnect_gets_only_the_gap(self):
+        await self.send_messages(3)
+        client = await self.connect(self.bob, "/ws/chat/?last_seq=2")
+        self.assertEqual(await self.received(client), [3])
+
+    async def test_gap_beyond_buffer_falls_back_to_mongo(self):
+        for seq in range(1, 6):
+            self.messages.docs.append({
+                '_id': f"m{seq}", 'room': 'chat', 'message': f"m{seq}", 'seq': seq,
+                'sender_id': 1, 'timestamp': datetime(2025, 1, 1),
+            })
+        await self.send_messages(3)
+
+        client = await self.connect(self.bob, "/ws/chat/?last_seq=2")
+        self.assertEqual(await self.received(client), [3, 4, 5, 6, 7, 8])
+
+    async def test_replay_frames_for_empty_room_reads_store(self):
+        self.assertEqual(await replay_frames('chat', None), [])
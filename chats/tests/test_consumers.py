@@ -0,0 +1,152 @@
+import json
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase, override_settings
+from django.urls import path
+
+from chats.consumers import ROOM_ACCESS_DENIED, AsyncGroupConsumer, GroupConsumer
+from chats.models import Room, RoomMembership
+from chats.persistence import close_message_writer
+from chats.producer import close_producer, get_producer
+from chats.testing import FakeCollection
+
+User = get_user_model()
+
+TEST_CHANNEL_LAYERS = {
+    "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+}
+
+
+@override_settings(
+    CHANNEL_LAYERS=TEST_CHANNEL_LAYERS,
+    CHAT_PRODUCER_BACKEND='chats.producer.InMemoryProducer',
+    # Join/leave batches would interleave with the frames tests expect;
+    # chats/tests/test_ephemeral.py turns them back on.
+    CHAT_EPHEMERAL={'OPTIONS': {}, 'window': 0.05, 'broadcast_presence': False},
+)
+class GroupConsumerTestCase(TestCase):
+    consumer_class = AsyncGroupConsumer
+
+    def setUp(self):
+        self.messages = FakeCollection()
+        # A fresh backlog per test.
+        self.enterContext(override_settings(
+            CHAT_BACKLOG_BACKEND='chats.backlog.InMemoryBacklog',
+            MONGO_DATABASE={'messages': self.messages},
+        ))
+        self.addCleanup(close_producer)
+
+        self.alice = User.objects.create_user(email='alice@example.com', username='alice', password='test')
+        self.bob = User.objects.create_user(email='bob@example.com', username='bob', password='test')
+        self.carol = User.objects.create_user(email='carol@example.com', username='carol', password='test')
+
+    def application(self, consumer_class=None):
+        consumer = (consumer_class or self.consumer_class).as_asgi()
+        return URLRouter([
+            path("ws/chat/<slug:room_name>/", consumer),
+            path("ws/chat/", consumer),
+        ])
+
+    async def connect(self, user, url="/ws/chat/", consumer_class=None, expect_connected=True, subprotocols=None):
+        communicator = WebsocketCommunicator(self.application(consumer_class), url, subprotocols=subprotocols)
+        communicator.scope["user"] = user
+        connected, code = await communicator.connect()
+        self.assertEqual(connected, expect_connected)
+        return communicator if connected else code
+
+
+class GroupConsumerProtocolTests(GroupConsumerTestCase):
+    """
+    Both consumer implementations must speak the same wire protocol.
+    """
+
+    async def _assert_broadcast(self, consumer_class):
+        sender = await self.connect(self.alice, consumer_class=consumer_class)
+        receiver = await self.connect(self.bob, consumer_class=consumer_class)
+
+        await sender.send_to(text_data=json.dumps({"message": "hello"}))
+
+        for communicator in (sender, receiver):
+            response = await communicator.receive_from()
+            self.assertEqual(json.loads(response), {"message": "hello", "seq": 1})
+
+        await sender.disconnect()
+        await receiver.disconnect()
+
+        [(topic, key, event)] = get_producer().messages
+        self.assertEqual((topic, key), ('chat_messages', 'chat'))
+        self.assertEqual(
+            {k: event[k] for k in ("room", "message", "sender_id")},
+            {"room": "chat", "message": "hello", "sender_id": self.alice.id}
+        )
+        close_message_writer()
+        return event
+
+    async def test_sync_consumer_broadcasts_to_room(self):
+        await self._assert_broadcast(GroupConsumer)
+
+    async def test_async_consumer_broadcasts_to_room(self):
+        await self._assert_broadcast(AsyncGroupConsumer)
+
+    async def test_worker_mode_only_publishes(self):
+        await self._assert_broadcast(AsyncGroupConsumer)
+        self.assertEqual(self.messages.docs, [])
+
+    async def test_direct_mode_writes_through_buffer(self):
+        with self.settings(CHAT_PERSISTENCE='direct'):
+            event = await self._assert_broadcast(AsyncGroupConsumer)
+        [stored] = self.messages.docs
+        self.assertEqual(stored["_id"], event["message_id"])
+        self.assertEqual(stored["sender_id"], self.alice.id)
+
+
+class RoomRoutingTests(GroupConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.private = Room.objects.create(name='team')
+        RoomMembership.objects.create(room=self.private, user=self.alice)
+        RoomMembership.objects.create(room=self.private, user=self.bob)
+
+    async def test_messages_stay_in_their_room(self):
+        in_team = await self.connect(self.alice, "/ws/chat/team/")
+        in_lobby = await self.connect(self.carol, "/ws/chat/chat/")
+
+        await in_team.send_to(text_data=json.dumps({"message": "team only"}))
+
+        self.assertEqual(json.loads(await in_team.receive_from())["message"], "team only")
+        self.assertTrue(await in_lobby.receive_nothing())
+        await in_team.disconnect()
+        await in_lobby.disconnect()
+
+    async def test_non_members_are_rejected(self):
+        for consumer_class in (GroupConsumer, AsyncGroupConsumer):
+            code = await self.connect(self.carol, "/ws/chat/team/", consumer_class, expect_connected=False)
+            self.assertEqual(code, ROOM_ACCESS_DENIED)
+
+    async def test_unknown_rooms_and_anonymous_users_are_rejected(self):
+        await self.connect(self.alice, "/ws/chat/nope/", expect_connected=False)
+        await self.connect(AnonymousUser(), "/ws/chat/", expect_connected=False)
+
+    async def _assert_sharded_broadcast(self, consumer_class):
+        self.private.shard_count = 4
+        await self.private.asave()
+
+        alice = await self.connect(self.alice, "/ws/chat/team/", consumer_class)
+        others = [await self.connect(self.bob, "/ws/chat/team/", consumer_class) for _ in range(8)]
+
+        await alice.send_to(text_data=json.dumps({"message": "hi all"}))
+
+        for communicator in [alice] + others:
+            self.assertEqual(json.loads(await communicator.receive_from())["message"], "hi all")
+            self.assertTrue(await communicator.receive_nothing(timeout=0.01))
+            await communicator.disconnect()
+
+    async def test_sharded_room_reaches_every_member(self):
+        await self._assert_sharded_broadcast(AsyncGroupConsumer)
+
+    async def test_sharded_room_reaches_every_member_sync(self):
+        await self._assert_sharded_broadcast(GroupConsumer)
@@ -0,0 +1,146 @@
+import json
+
+from django.test import SimpleTestCase
+
+from chats.consumers import GroupConsumer
+from chats.dedupe import InMemoryDedupe, client_message_id
+from chats.indexes import MESSAGE_INDEXES, ensure_indexes, missing_indexes
+from chats.producer import get_producer
+from chats.testing import FakeCollection
+from chats.tests.test_consumers import GroupConsumerTestCase
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class InMemoryDedupeTests(SimpleTestCase):
+
+    async def test_retries_get_the_original_seq(self):
+        dedupe = InMemoryDedupe()
+        self.assertEqual(await dedupe.claim(1, 'a'), (True, None))
+        self.assertEqual(await dedupe.claim(1, 'a'), (False, None))
+        await dedupe.complete(1, 'a', 7)
+        self.assertEqual(await dedupe.claim(1, 'a'), (False, 7))
+        # Ids are per user.
+        self.assertEqual(await dedupe.claim(2, 'a'), (True, None))
+
+    async def test_window_and_ttl_bound_what_is_remembered(self):
+        clock = FakeClock()
+        dedupe = InMemoryDedupe(window=2, ttl=10, clock=clock)
+        for client_id in 'abc':
+            await dedupe.claim(1, client_id)
+        self.assertEqual(await dedupe.claim(1, 'a'), (True, None))
+
+        clock.now = 11
+        self.assertEqual(await dedupe.claim(1, 'c'), (True, None))
+
+    async def test_released_ids_can_be_retried(self):
+        dedupe = InMemoryDedupe()
+        await dedupe.claim(1, 'a')
+        await dedupe.release(1, 'a')
+        self.assertEqual(await dedupe.claim(1, 'a'), (True, None))
+
+    def test_unusable_client_ids_are_ignored(self):
+        self.assertEqual(client_message_id({"client_id": "abc"}), "abc")
+        for client_id in (None, "", 12, "x" * 65):
+            self.assertIsNone(client_message_id({"client_id": client_id}))
+
+
+class ClientIdIndexTests(SimpleTestCase):
+
+    def test_index_is_unique_and_partial(self):
+        messages = FakeCollection()
+        self.assertIn('sender_client_id', missing_indexes(messages))
+        ensure_indexes(messages, MESSAGE_INDEXES)
+        self.assertEqual(missing_indexes(messages), [])
+        info = messages.index_information()['sender_client_id']
+        self.assertTrue(info['unique'])
+        self.assertEqual(info['partialFilterExpression'], {'client_id': {'$exists': True}})
+
+
+class DuplicateSendTests(GroupConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(self.settings(CHAT_DEDUPE_BACKEND='chats.dedupe.InMemoryDedupe'))
+
+    async def _assert_retry_is_acked_once(self, consumer_class):
+        sender = await self.connect(self.alice, consumer_class=consumer_class)
+        receiver = await self.connect(self.bob, consumer_class=consumer_class)
+        payload = json.dumps({"message": "hello", "client_id": "c-1"})
+
+        await sender.send_to(text_data=payload)
+        frames = [json.loads(await sender.receive_from()) for _ in range(2)]
+        self.assertCountEqual(frames, [
+            {"message": "hello", "seq": 1},
+            {"type": "ack", "client_id": "c-1", "seq": 1},
+        ])
+
+        await sender.send_to(text_data=payload)
+        self.assertEqual(
+            json.loads(await sender.receive_from()),
+            {"type": "ack", "client_id": "c-1", "seq": 1, "duplicate": True},
+        )
+
+        self.assertEqual(json.loads(await receiver.receive_from()), {"message": "hello", "seq": 1})
+        self.assertTrue(await receiver.receive_nothing())
+
+        [(_, _, event)] = get_producer().messages
+        self.assertEqual(event["client_id"], "c-1")
+
+        await sender.disconnect()
+        await receiver.disconnect()
+
+    async def test_async_consumer(self):
+        await self._assert_retry_is_acked_once(None)
+
+    async def test_sync_consumer(self):
+        await self._assert_retry_is_acked_once(GroupConsumer)
+
+    async def _assert_direct_retry_is_sent_once(self, consumer_class):
+        sender = await self.connect(self.alice, consumer_class=consumer_class)
+        recipient = await self.connect(self.bob, consumer_class=consumer_class)
+        payload = json.dumps({"type": "direct", "to": self.bob.id, "message": "psst", "client_id": "d-1"})
+
+        await sender.send_to(text_data=payload)
+        self.assertEqual(json.loads(await sender.receive_from())["type"], "direct_sent")
+        await sender.send_to(text_data=payload)
+        self.assertEqual(
+            json.loads(await sender.receive_from()),
+            {"type": "ack", "client_id": "d-1", "seq": None, "duplicate": True},
+        )
+
+        self.assertEqual(json.loads(await recipient.receive_from())["message"], "psst")
+        self.assertTrue(await recipient.receive_nothing())
+        [(_, _, event)] = get_producer().messages
+        self.assertEqual(event["client_id"], "d-1")
+
+        await sender.disconnect()
+        await recipient.disconnect()
+
+    async def test_direct_retries_async_consumer(self):
+        await self._assert_direct_retry_is_sent_once(None)
+
+    async def test_direct_retries_sync_consumer(self):
+        await self._assert_direct_retry_is_sent_once(GroupConsumer)
+
+    async def test_unsent_direct_messages_can_be_retried(self):
+        sender = await self.connect(self.alice)
+        payload = json.dumps({"type": "direct", "to": 999999, "message": "hello?", "client_id": "d-2"})
+        for _ in range(2):
+            await sender.send_to(text_data=payload)
+            self.assertEqual(json.loads(await sender.receive_from())["error"], "unknown_user")
+        await sender.disconnect()
+
+    async def test_messages_without_client_id_are_not_acked(self):
+        sender = await self.connect(self.alice)
+        await sender.send_to(text_data=json.dumps({"message": "hello"}))
+        self.assertEqual(json.loads(await sender.receive_from()), {"message": "hello", "seq": 1})
+        self.assertTrue(await sender.receive_nothing())
+        await sender.disconnect()
@@ -0,0 +1,64 @@
+import json
+
+from chats.consumers import GroupConsumer
+from chats.producer import get_producer
+from chats.tests.test_consumers import GroupConsumerTestCase
+
+
+class DirectMessageTests(GroupConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(self.settings(CHAT_CHANNEL_REGISTRY_BACKEND='chats.direct.InMemoryChannelRegistry'))
+
+    async def test_every_other_device_of_both_users_gets_the_message(self):
+        alice = await self.connect(self.alice)
+        alice_tablet = await self.connect(self.alice)
+        bob_phone = await self.connect(self.bob)
+        bob_laptop = await self.connect(self.bob, consumer_class=GroupConsumer)
+        carol = await self.connect(self.carol)
+
+        await alice.send_to(text_data=json.dumps({"type": "direct", "to": self.bob.id, "message": "psst"}))
+
+        # The sending socket only gets the ack.
+        ack = json.loads(await alice.receive_from())
+        self.assertEqual((ack["type"], ack["to"], ack["devices"]), ("direct_sent", self.bob.id, 2))
+        self.assertTrue(await alice.receive_nothing())
+
+        for communicator in (alice_tablet, bob_phone, bob_laptop):
+            frame = json.loads(await communicator.receive_from())
+            self.assertEqual(frame, {
+                "type": "direct", "id": ack["id"], "from": self.alice.id, "to": self.bob.id, "message": "psst",
+            })
+        self.assertTrue(await carol.receive_nothing())
+
+        [(_, key, event)] = get_producer().messages
+        self.assertEqual(key, f"dm_{min(self.alice.id, self.bob.id)}_{max(self.alice.id, self.bob.id)}")
+        self.assertEqual(event["message"], "psst")
+
+        for communicator in (alice, alice_tablet, bob_phone, bob_laptop, carol):
+            await communicator.disconnect()
+
+    async def test_offline_and_unknown_recipients(self):
+        alice = await self.connect(self.alice)
+
+        await alice.send_to(text_data=json.dumps({"type": "direct", "to": self.carol.id, "message": "later"}))
+        # Not delivered anywhere, but still stored.
+        ack = json.loads(await alice.receive_from())
+        self.assertEqual((ack["type"], ack["to"], ack["devices"]), ("direct_sent", self.carol.id, 0))
+        self.assertTrue(await alice.receive_nothing())
+
+        await alice.send_to(text_data=json.dumps({"type": "direct", "to": 999999, "message": "hello?"}))
+        self.assertEqual(json.loads(await alice.receive_from())["error"], "unknown_user")
+
+        await alice.disconnect()
+        self.assertEqual(len(get_producer().messages), 1)
+
+    async def test_disconnected_devices_are_unregistered(self):
+        bob = await self.connect(self.bob)
+        await bob.disconnect()
+        alice = await self.connect(self.alice)
+
+        await alice.send_to(text_data=json.dumps({"type": "direct", "to": self.bob.id, "message": "gone"}))
+        self.assertEqual(json.loads(await alice.receive_from())["devices"], 0)
+        await alice.disconnect()
@@ -0,0 +1,82 @@
+import json
+
+from django.test import SimpleTestCase
+
+from chats.ephemeral import InMemoryPresence, RoomBatch
+from chats.producer import get_producer
+from chats.tests.test_consumers import GroupConsumerTestCase
+
+
+class InMemoryPresenceTests(SimpleTestCase):
+
+    async def test_users_with_several_connections_count_once(self):
+        presence = InMemoryPresence()
+        self.assertTrue(await presence.join('chat', 1))
+        self.assertFalse(await presence.join('chat', 1))
+        self.assertTrue(await presence.join('chat', 2))
+        self.assertEqual(await presence.online('chat'), 2)
+
+        self.assertFalse(await presence.leave('chat', 1))
+        self.assertEqual(await presence.online('chat'), 2)
+        self.assertTrue(await presence.leave('chat', 1))
+        self.assertTrue(await presence.leave('chat', 2))
+        self.assertEqual(await presence.online('chat'), 0)
+
+        # A stray leave can't push a count negative.
+        self.assertFalse(await presence.leave('chat', 3))
+        self.assertEqual(await presence.online('chat'), 0)
+
+    def test_empty_sections_are_left_out(self):
+        batch = RoomBatch(['chat_chat'])
+        batch.read[5] = 42
+        self.assertEqual(batch.frame(online=3), {"type": "ephemeral", "read": {"5": 42}})
+
+
+class EphemeralEventTests(GroupConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(self.settings(
+            CHAT_EPHEMERAL={'OPTIONS': {}, 'window': 0.1, 'broadcast_presence': True},
+            CHAT_PRESENCE_BACKEND='chats.ephemeral.InMemoryPresence',
+        ))
+
+    async def test_bursts_become_one_frame_and_nothing_is_stored(self):
+        alice = await self.connect(self.alice)
+        self.assertEqual(json.loads(await alice.receive_from())["presence"]["joined"], [self.alice.id])
+        bob = await self.connect(self.bob)
+
+        joined = json.loads(await alice.receive_from())
+        self.assertEqual(joined["presence"], {"online": 2, "joined": [self.bob.id], "left": []})
+        self.assertEqual(json.loads(await bob.receive_from()), joined)
+
+        for _ in range(50):
+            await bob.send_to(text_data=json.dumps({"type": "typing"}))
+        await bob.send_to(text_data=json.dumps({"type": "read", "seq": 7}))
+        await bob.send_to(text_data=json.dumps({"type": "read", "seq": 3}))
+
+        batch = json.loads(await alice.receive_from())
+        self.assertEqual(batch, {
+            "type": "ephemeral",
+            "typing": {str(self.bob.id): True},
+            "read": {str(self.bob.id): 7},
+        })
+        self.assertTrue(await alice.receive_nothing(timeout=0.3))
+
+        await bob.disconnect()
+        left = json.loads(await alice.receive_from())
+        self.assertEqual(left["presence"], {"online": 1, "joined": [], "left": [self.bob.id]})
+        await alice.disconnect()
+
+        self.assertEqual(get_producer().messages, [])
+        self.assertEqual(self.messages.docs, [])
+
+    async def test_second_device_is_not_a_new_join(self):
+        first = await self.connect(self.alice)
+        await first.receive_from()
+        second = await self.connect(self.alice)
+        self.assertTrue(await first.receive_nothing(timeout=0.3))
+
+        await second.disconnect()
+        self.assertTrue(await first.receive_nothing(timeout=0.3))
+        await first.disconnect()
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+from io import StringIO
+
+from bson import ObjectId
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from chats.history import InvalidCursor, decode_cursor, encode_cursor, fetch_room_history
+from chats.indexes import MESSAGE_INDEXES
+from chats.models import Room
+from chats.testing import FakeCollection
+
+User = get_user_model()
+
+START = datetime(2025, 1, 1)
+
+
+def seed(collection, room, count, same_timestamp_every=1):
+    for i in range(count):
+        collection.docs.append({
+            '_id': f"{room}-{i:04d}",
+            'room': room,
+            'message': f"message {i}",
+            'sender_id': 1,
+            'timestamp': START + timedelta(seconds=i // same_timestamp_every),
+        })
+
+
+class HistoryPaginationTests(SimpleTestCase):
+
+    def setUp(self):
+        self.collection = FakeCollection()
+        seed(self.collection, 'team', 25, same_timestamp_every=3)
+        seed(self.collection, 'other', 5)
+
+    def test_pages_walk_back_without_gaps_or_repeats(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = fetch_room_history(self.collection, 'team', 10, cursor)
+            seen.extend(doc['_id'] for doc in page)
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, [f"team-{i:04d}" for i in reversed(range(25))])
+
+    def test_projection_only_returns_needed_fields(self):
+        page, _ = fetch_room_history(self.collection, 'team', 1)
+        self.assertEqual(set(page[0]), {'_id', 'message', 'sender_id', 'timestamp'})
+
+    def test_cursor_round_trip(self):
+        for _id in ('abc', ObjectId()):
+            self.assertEqual(decode_cursor(encode_cursor({'_id': _id, 'timestamp': START})), (START, _id))
+
+        with self.assertRaises(InvalidCursor):
+            decode_cursor('garbage')
+
+
+class RoomHistoryViewTests(APITestCase):
+
+    def setUp(self):
+        self.collection = FakeCollection()
+        seed(self.collection, 'chat', 3)
+        self.enterContext(override_settings(MONGO_DATABASE={'messages': self.collection}))
+
+        self.user = User.objects.create_user(email='test@example.com', username='test', password='test')
+        self.client.force_authenticate(self.user)
+
+    def test_history_is_paginated(self):
+        url = reverse('room-history', args=['chat'])
+        response = self.client.get(url, {'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['message'] for m in response.data['results']], ['message 2', 'message 1'])
+
+        response = self.client.get(url, {'limit': 2, 'cursor': response.data['next_cursor']})
+        self.assertEqual([m['message'] for m in response.data['results']], ['message 0'])
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_private_room_requires_membership(self):
+        Room.objects.create(name='secret')
+        response = self.client.get(reverse('room-history', args=['secret']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_bad_parameters(self):
+        url = reverse('room-history', args=['chat'])
+        self.assertEqual(self.client.get(url, {'limit': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'cursor': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class EnsureMessageIndexesCommandTests(SimpleTestCase):
+
+    def test_creates_then_verifies(self):
+        collection = FakeCollection()
+        with override_settings(MONGO_DATABASE={'messages': collection}):
+            with self.assertRaises(CommandError):
+                call_command('ensure_message_indexes', '--check', stdout=StringIO())
+            call_command('ensure_message_indexes', stdout=StringIO())
+            call_command('ensure_message_indexes', '--check', stdout=StringIO())
+
+        self.assertEqual(len(collection.indexes), len(MESSAGE_INDEXES) + 1)
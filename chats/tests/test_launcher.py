@@ -0,0 +1,137 @@
+import socket
+import sys
+import time
+import unittest
+from unittest import mock
+
+from daphne.ws_protocol import WebSocketProtocol
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, override_settings
+
+from server.launcher import Supervisor, process_local_state
+from server.worker import SERVICE_RESTART, DrainingServer, ServerWebSocketProtocol
+
+
+class SleepingSupervisor(Supervisor):
+
+    script = 'import time; time.sleep(60)'
+
+    def worker_command(self, fd):
+        return [sys.executable, '-c', self.script]
+
+
+class SupervisorTests(SimpleTestCase):
+
+    def make_supervisor(self, **kwargs):
+        supervisor = SleepingSupervisor(host='127.0.0.1', port=0, workers=2, drain_timeout=0, grace=5, **kwargs)
+        self.addCleanup(supervisor.shutdown)
+        return supervisor
+
+    @unittest.skipUnless(hasattr(socket, 'SO_REUSEPORT'), "needs SO_REUSEPORT")
+    def test_every_worker_gets_its_own_socket_on_the_same_port(self):
+        supervisor = self.make_supervisor()
+        first = supervisor.worker_socket()
+        second = supervisor.worker_socket()
+        self.addCleanup(first.close)
+        self.addCleanup(second.close)
+
+        self.assertIsNot(first, second)
+        self.assertEqual(first.getsockname()[1], second.getsockname()[1])
+        self.assertNotEqual(supervisor.port, 0)
+
+    def test_dead_workers_are_restarted_with_backoff(self):
+        supervisor = self.make_supervisor(restart_backoff=60)
+        for slot in range(2):
+            supervisor.spawn(slot)
+
+        crashed, _ = supervisor.workers[0]
+        crashed.kill()
+        crashed.wait()
+        # The first crash is restarted straight away, the next one waits.
+        self.assertEqual(supervisor.reap(), 1)
+        self.assertNotEqual(supervisor.workers[0][0].pid, crashed.pid)
+
+        supervisor.workers[0][0].kill()
+        supervisor.workers[0][0].wait()
+        self.assertEqual(supervisor.reap(), 0)
+        self.assertNotIn(0, supervisor.workers)
+        self.assertIn(0, supervisor.pending)
+
+    def test_shutdown_kills_workers_that_do_not_drain(self):
+        supervisor = self.make_supervisor(reuse_port=False)
+        supervisor.grace = 0
+        supervisor.script = 'import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); time.sleep(60)'
+        processes = [supervisor.spawn(slot) for slot in range(2)]
+
+        start = time.monotonic()
+        supervisor.shutdown()
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(supervisor.retiring, [])
+        self.assertTrue(all(process.poll() is not None for process in processes))
+
+
+SHARED_STATE = dict(
+    CHAT_RATE_LIMIT_BACKEND='chats.ratelimit.RedisRateLimiter',
+    CHAT_PRESENCE_BACKEND='chats.ephemeral.RedisPresence',
+    CHAT_CHANNEL_REGISTRY_BACKEND='chats.direct.RedisChannelRegistry',
+    CHAT_DEDUPE_BACKEND='chats.dedupe.RedisDedupe',
+    CHAT_BACKLOG_BACKEND='chats.backlog.RedisBacklog',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://x'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels_redis.core.RedisChannelLayer'}},
+    CHAT_TOKEN_CACHE={'max_size': 10, 'ttl': 0},
+)
+
+
+class ProcessLocalStateTests(SimpleTestCase):
+
+    @override_settings(**SHARED_STATE)
+    def test_shared_backends_are_not_reported(self):
+        self.assertEqual(process_local_state(), [])
+
+    @override_settings(**dict(SHARED_STATE, CHAT_BACKLOG_BACKEND='chats.backlog.InMemoryBacklog'))
+    def test_in_memory_backends_are_reported(self):
+        self.assertEqual(process_local_state(), ["CHAT_BACKLOG_BACKEND is chats.backlog.InMemoryBacklog"])
+
+    def test_serve_refuses_several_workers_with_process_local_state(self):
+        with mock.patch.object(Supervisor, 'run') as run:
+            with self.assertRaisesMessage(CommandError, "CHAT_DEDUPE_BACKEND is chats.dedupe.InMemoryDedupe"):
+                call_command('serve', '--workers', '2')
+            call_command('serve')
+        run.assert_called_once_with()
+
+
+class DrainTests(SimpleTestCase):
+
+    async def test_websockets_are_closed_with_service_restart(self):
+        server = DrainingServer(None, endpoints=['tcp:port=0'], drain_timeout=1)
+        port = mock.Mock()
+        server.ports = [port]
+
+        websocket = mock.Mock(spec=WebSocketProtocol)
+        websocket.state = websocket.STATE_OPEN = WebSocketProtocol.STATE_OPEN
+        websocket.sendCloseFrame.side_effect = lambda code: server.connections.pop(websocket)
+        http_request = mock.Mock()
+        server.connections = {websocket: {}, http_request: {}}
+        # The HTTP request finishes while the server is draining.
+        asyncio_sleep = mock.AsyncMock(side_effect=lambda delay: server.connections.pop(http_request))
+
+        with mock.patch.object(server, 'stop') as stop, mock.patch('asyncio.sleep', asyncio_sleep):
+            await server.drain()
+
+        port.stopListening.assert_called_once_with()
+        websocket.sendCloseFrame.assert_called_once_with(code=SERVICE_RESTART)
+        self.assertEqual(server.connections, {})
+        stop.assert_called_once_with()
+
+
+class ServerWebSocketProtocolTests(SimpleTestCase):
+
+    def test_server_close_codes_bypass_the_application_check(self):
+        protocol = ServerWebSocketProtocol()
+        with mock.patch.object(protocol, 'sendCloseFrame') as send_close_frame:
+            protocol.serverClose(code=1009)
+            send_close_frame.assert_called_once_with(code=1009)
+
+            send_close_frame.reset_mock()
+            protocol.serverClose(code=4403)
+            send_close_frame.assert_called_once_with(code=4403, reasonUtf8=None, isReply=False)
@@ -0,0 +1,104 @@
+import asyncio
+from unittest import mock
+
+from channels.layers import InMemoryChannelLayer
+from django.test import SimpleTestCase, override_settings
+
+from chats.layers import LocalFanoutChannelLayer
+from chats.tests import test_consumers
+
+
+INNER = {"BACKEND": "channels.layers.InMemoryChannelLayer"}
+
+
+class LocalFanoutChannelLayerTests(SimpleTestCase):
+
+    def make_nodes(self, count):
+        shared = InMemoryChannelLayer()
+        nodes = []
+        for _ in range(count):
+            node = LocalFanoutChannelLayer(inner=INNER)
+            node.inner = shared
+            nodes.append(node)
+        return shared, nodes
+
+    async def join(self, node, group, members):
+        channels = [await node.new_channel() for _ in range(members)]
+        for channel in channels:
+            await node.group_add(group, channel)
+        return channels
+
+    async def test_group_send_costs_one_inner_message_per_node(self):
+        shared, (a, b) = self.make_nodes(2)
+        on_a = await self.join(a, 'chat_room', 3)
+        on_b = await self.join(b, 'chat_room', 2)
+
+        with mock.patch.object(shared, 'send', wraps=shared.send) as inner_send:
+            await a.group_send('chat_room', {'type': 'chat.message', 'message': 'hi'})
+            received = await asyncio.gather(*(a.receive(c) for c in on_a), *(b.receive(c) for c in on_b))
+
+        self.assertEqual(inner_send.call_count, 2)
+        self.assertEqual([m['message'] for m in received], ['hi'] * 5)
+        self.assertEqual(a.stats['local_deliveries'] + b.stats['local_deliveries'], 5)
+
+    async def test_direct_sends_still_arrive(self):
+        _, (node,) = self.make_nodes(1)
+        [channel] = await self.join(node, 'chat_room', 1)
+
+        await node.send(channel, {'type': 'direct'})
+        self.assertEqual((await node.receive(channel))['type'], 'direct')
+
+        await node.group_send('chat_room', {'type': 'grouped'})
+        self.assertEqual((await node.receive(channel))['type'], 'grouped')
+
+    async def test_receive_waiting_before_group_add_gets_group_messages(self):
+        _, (node,) = self.make_nodes(1)
+        channel = await node.new_channel()
+        pending = asyncio.ensure_future(node.receive(channel))
+        await asyncio.sleep(0)
+
+        await node.group_add('chat_room', channel)
+        await node.group_send('chat_room', {'type': 'grouped'})
+        self.assertEqual((await asyncio.wait_for(pending, 1))['type'], 'grouped')
+
+    async def test_last_local_member_unsubscribes_node(self):
+        shared, (node,) = self.make_nodes(1)
+        first, second = await self.join(node, 'chat_room', 2)
+        self.assertEqual(list(shared.groups['chat_room']), [node.node_channel])
+
+        await node.group_discard('chat_room', first)
+        self.assertIn('chat_room', shared.groups)
+        await node.group_discard('chat_room', second)
+        self.assertNotIn('chat_room', shared.groups)
+
+    async def test_idle_groups_are_resubscribed_before_they_expire(self):
+        shared, (node,) = self.make_nodes(1)
+        node.resubscribe_interval = 0.05
+        [channel] = await self.join(node, 'chat_room', 1)
+        # Nobody joins or sends while the inner membership ages past expiry.
+        shared.groups['chat_room'][node.node_channel] = 1
+
+        await asyncio.sleep(0.2)
+        await node.group_send('chat_room', {'type': 'grouped'})
+        self.assertEqual((await asyncio.wait_for(node.receive(channel), 1))['type'], 'grouped')
+        await node.flush()
+
+    async def test_full_local_queue_drops_for_that_member_only(self):
+        _, (node,) = self.make_nodes(1)
+        node.capacity = 1
+        slow, fast = await self.join(node, 'chat_room', 2)
+
+        node.deliver_locally('chat_room', {'type': 'one'})
+        await node.receive(fast)
+        node.deliver_locally('chat_room', {'type': 'two'})
+
+        self.assertEqual(node.stats['local_drops'], 1)
+        self.assertEqual((await node.receive(slow))['type'], 'one')
+        self.assertEqual((await node.receive(fast))['type'], 'two')
+
+
+@override_settings(CHANNEL_LAYERS={
+    "default": {"BACKEND": "chats.layers.LocalFanoutChannelLayer", "CONFIG": {"inner": INNER}},
+})
+class ConsumersOverLocalFanoutTests(test_consumers.GroupConsumerProtocolTests):
+    pass
@@ -0,0 +1,88 @@
+import json
+import threading
+
+from django.test import SimpleTestCase, override_settings
+
+from chats.tests.test_consumers import GroupConsumerTestCase
+from server import metrics
+
+
+class MetricTests(SimpleTestCase):
+
+    def test_histogram_renders_cumulative_buckets(self):
+        latency = metrics.Histogram('test_seconds', 'Test.', ('stage',), buckets=(0.1, 1.0))
+        latency.observe(0.05, 'a')
+        latency.observe(0.5, 'a')
+        latency.observe(5, 'a')
+
+        self.assertEqual(latency.render(), [
+            'test_seconds_bucket{stage="a",le="0.1"} 1',
+            'test_seconds_bucket{stage="a",le="1.0"} 2',
+            'test_seconds_bucket{stage="a",le="+Inf"} 3',
+            'test_seconds_sum{stage="a"} 5.55',
+            'test_seconds_count{stage="a"} 3',
+        ])
+
+    def test_threads_are_added_up_at_scrape_time(self):
+        requests = metrics.Counter('test_total', 'Test.', ('view',))
+
+        def work():
+            for _ in range(1000):
+                requests.inc('home')
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(requests.values(), {('home',): 4000})
+        self.assertEqual(len(requests._shards), 4)
+
+    def test_stats_objects_are_published_as_gauges(self):
+        metrics.register_stats('test_cache', 'Test.', lambda: {'hits': 3, 'last_error': 'boom'})
+        self.addCleanup(metrics._stats.pop, 'test_cache')
+
+        text = metrics.render()
+        self.assertIn('test_cache_hits 3\n', text)
+        self.assertNotIn('test_cache_last_error', text)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled_metrics_record_nothing(self):
+        latency = metrics.Histogram('test_seconds', 'Test.')
+        with latency.time():
+            pass
+        self.assertEqual(latency.values(), {})
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(METRICS_ACCESS={'allowed_networks': ['127.0.0.1', '10.0.0.0/8'], 'token': 's3cret'})
+    def test_scrapes_need_an_allowed_address_or_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 403)
+        self.assertEqual(self.client.get(
+            '/metrics', REMOTE_ADDR='203.0.113.7', HTTP_AUTHORIZATION='Bearer wrong'
+        ).status_code, 403)
+        self.assertEqual(self.client.get(
+            '/metrics', REMOTE_ADDR='203.0.113.7', HTTP_AUTHORIZATION='Bearer s3cret'
+        ).status_code, 200)
+
+
+class MetricsEndpointTests(GroupConsumerTestCase):
+
+    async def test_receive_stages_and_views_are_exported(self):
+        sender = await self.connect(self.alice)
+        await sender.send_to(text_data=json.dumps({"message": "hello"}))
+        await sender.receive_from()
+        await sender.disconnect()
+
+        await self.async_client.get('/accounts/v1/whoami/')
+        response = await self.async_client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        text = response.content.decode()
+        for stage in ('parse', 'sequence', 'group_send', 'store', 'producer_send'):
+            self.assertIn(f'chat_receive_stage_seconds_count{{stage="{stage}"}}', text)
+        self.assertIn('http_view_seconds_count{view="GetCurrentProfile",method="GET",status="401"}', text)
+        self.assertIn('chat_send_queue_connections', text)
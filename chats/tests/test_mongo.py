@@ -0,0 +1,49 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from chats import mongo
+from chats.testing import FakeCollection
+
+
+class MongoClientTests(SimpleTestCase):
+
+    def setUp(self):
+        self.addCleanup(mongo.close)
+
+    def test_client_is_created_lazily_once_per_process(self):
+        mongo.close()
+        self.assertIsNone(mongo._client)
+
+        with override_settings(MONGO_URI='mongodb://127.0.0.1:1/', MONGO_CLIENT={
+            'maxPoolSize': 4, 'connectTimeoutMS': 100, 'serverSelectionTimeoutMS': 100,
+        }):
+            client = mongo.get_client()
+            self.assertIs(mongo.get_client(), client)
+            self.assertEqual(client.max_pool_size, 4)
+            self.assertEqual(mongo.get_executor()._max_workers, 4)
+
+            with mock.patch('os.getpid', return_value=-1):
+                self.assertIsNot(mongo.get_client(), client)
+
+    @override_settings(MONGO_DATABASE={'messages': FakeCollection()})
+    async def test_run_calls_blocking_code_off_the_loop(self):
+        collection = mongo.get_collection('messages')
+        await mongo.run(collection.insert_many, [{'_id': 1, 'room': 'chat'}])
+        self.assertEqual(await mongo.run(collection.count_documents, {'room': 'chat'}), 1)
+        self.assertIsNone(mongo._client)
+        self.assertEqual(mongo.pool_stats.as_dict()['calls_in_flight'], 0)
+
+    @override_settings(MONGO_CLIENT={'maxPoolSize': 4})
+    def test_pool_stats_follow_checkouts(self):
+        stats = mongo.PoolStats()
+        listener = stats.listener()
+        listener.connection_created(None)
+        listener.connection_checked_out(None)
+        listener.connection_checked_out(None)
+        listener.connection_checked_in(None)
+
+        self.assertEqual(stats.as_dict(), {
+            'open': 1, 'in_use': 1, 'max_in_use': 2, 'utilization': 0.25,
+            'checkouts': 2, 'checkout_failures': 0, 'calls_in_flight': 0,
+        })
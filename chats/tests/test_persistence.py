@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chats.persistence import JsonLinesDeadLetter, MessageWriter
+from chats.testing import FakeCollection
+
+
+class MessageWriterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.collection = FakeCollection(unique_key='key')
+        self.dead = []
+
+    def make_writer(self, **options):
+        options.setdefault('flush_interval', 0.01)
+        options.setdefault('retry_backoff', 0)
+        writer = MessageWriter(lambda: self.collection, lambda docs, error: self.dead.extend(docs), **options)
+        self.addCleanup(writer.close)
+        return writer
+
+    def test_messages_are_coalesced_into_batches(self):
+        writer = self.make_writer(batch_size=10, flush_interval=0.2)
+        for i in range(25):
+            writer.submit({'key': i})
+        writer.close()
+
+        self.assertEqual(len(self.collection.docs), 25)
+        self.assertEqual(self.collection.calls, [('insert_many', 10), ('insert_many', 10), ('insert_many', 5)])
+        self.assertEqual(writer.stats.as_dict()['written'], 25)
+
+    def test_partial_batch_is_flushed_after_interval(self):
+        writer = self.make_writer(batch_size=100)
+        writer.submit({'key': 1})
+        deadline = time.monotonic() + 2
+        while not self.collection.docs and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.collection.docs), 1)
+
+    def test_failed_batch_is_retried(self):
+        self.collection.fail_next = 2
+        writer = self.make_writer(max_retries=3)
+        writer.submit({'key': 1})
+        writer.close()
+
+        self.assertEqual(len(self.collection.docs), 1)
+        self.assertEqual(writer.stats.as_dict()['retries'], 2)
+        self.assertEqual(self.dead, [])
+
+    def test_exhausted_retries_are_dead_lettered(self):
+        self.collection.fail_next = 10
+        writer = self.make_writer(max_retries=1)
+        writer.submit({'key': 1})
+        with mock.patch('builtins.print'):
+            writer.close()
+
+        self.assertEqual(self.dead, [{'key': 1}])
+        self.assertEqual(writer.stats.as_dict()['dead_lettered'], 1)
+
+    def test_duplicates_in_unordered_batch_are_not_retried(self):
+        self.collection.docs.append({'key': 1})
+        writer = self.make_writer()
+        writer.submit({'key': 1})
+        writer.submit({'key': 2})
+        writer.close()
+
+        self.assertEqual(sorted(doc['key'] for doc in self.collection.docs), [1, 2])
+        self.assertEqual(writer.stats.as_dict()['retries'], 0)
+        self.assertEqual(self.dead, [])
+
+    def test_full_queue_rejects_and_dead_letters(self):
+        writer = self.make_writer(max_queue=1)
+        writer._stopping.set()
+        writer._thread.join()
+
+        self.assertTrue(writer.submit({'key': 1}))
+        self.assertFalse(writer.submit({'key': 2}))
+        self.assertEqual(writer.stats.as_dict()['rejected'], 1)
+        self.assertEqual(self.dead, [{'key': 2}])
+
+
+class JsonLinesDeadLetterTests(SimpleTestCase):
+
+    def test_docs_are_appended_as_json_lines(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        JsonLinesDeadLetter(path)([{'key': 1}], RuntimeError('boom'))
+
+        with open(path) as fh:
+            line = json.loads(fh.readline())
+        self.assertEqual(line['doc'], {'key': 1})
+        self.assertIn('boom', line['error'])
+
+    def test_missing_data_directory_is_created(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        path = os.path.join(data_dir, 'var', 'dead_letter_messages.jsonl')
+
+        JsonLinesDeadLetter(path)([{'key': 1}], RuntimeError('boom'))
+
+        self.assertTrue(os.path.exists(path))
@@ -0,0 +1,138 @@
+from datetime import datetime
+from unittest import mock
+
+from django.test import SimpleTestCase
+from kafka.errors import CommitFailedError
+
+from chats.persistence import message_event
+from chats.persistence_worker import MessagePersistenceWorker
+from chats.testing import FakeBroker, FakeCollection
+
+
+def make_event(i, room='room-a'):
+    return message_event({
+        "_id": f"msg-{i}",
+        "room": room,
+        "message": f"hello {i}",
+        "sender_id": i % 7,
+        "timestamp": datetime(2025, 1, 1, 12, 0, i % 60),
+    })
+
+
+class MessagePersistenceWorkerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.broker = FakeBroker(partitions=4)
+        self.collection = FakeCollection()
+        self.dead_letters = []
+        for i in range(100):
+            self.broker.produce('chat_messages', make_event(i, room=f"room-{i % 5}"), key=f"room-{i % 5}")
+
+    def make_worker(self, partitions=None, **options):
+        consumer = self.broker.consumer('chat_messages', 'persist', partitions=partitions)
+        options.setdefault('retry_backoff', 0)
+        return MessagePersistenceWorker(
+            consumer, lambda: self.collection, self.dead_letter, batch_size=30, **options
+        )
+
+    def dead_letter(self, docs, error):
+        self.dead_letters.extend(docs)
+
+    def drain(self, worker):
+        while worker.run_once():
+            pass
+
+    def assert_persisted_exactly_once(self):
+        ids = [doc['_id'] for doc in self.collection.docs]
+        self.assertEqual(len(ids), 100)
+        self.assertEqual(set(ids), {f"msg-{i}" for i in range(100)})
+
+    def test_all_messages_are_persisted(self):
+        worker = self.make_worker()
+        self.drain(worker)
+
+        self.assert_persisted_exactly_once()
+        self.assertEqual(worker.stats['upserted'], 100)
+        self.assertIsInstance(self.collection.docs[0]['timestamp'], datetime)
+
+    def test_restart_between_write_and_commit_does_not_duplicate(self):
+        crashed = self.make_worker()
+        crashed.run_once()
+        crashed.consumer.commit = mock.Mock(side_effect=RuntimeError('worker killed'))
+        with self.assertRaises(RuntimeError):
+            crashed.run_once()
+
+        self.drain(self.make_worker())
+
+        self.assert_persisted_exactly_once()
+
+    def test_offsets_are_not_committed_until_write_succeeds(self):
+        self.collection.fail_next = 2
+        worker = self.make_worker()
+        with mock.patch('builtins.print'):
+            worker.run_once()
+
+        self.assertEqual(worker.stats['retries'], 2)
+        self.assertEqual(sum(self.broker.committed.values()), len(self.collection.docs))
+
+    def test_batch_that_keeps_failing_is_dead_lettered(self):
+        self.collection.fail_next = 100
+        worker = self.make_worker(max_retries=2)
+        with mock.patch('builtins.print'):
+            processed = worker.run_once()
+
+        self.assertEqual(processed, 30)
+        self.assertEqual(worker.stats['retries'], 2)
+        self.assertEqual(worker.stats['dead_lettered'], 30)
+        self.assertEqual(len(self.dead_letters), 30)
+        # Committed, so the partitions move on past the bad batch.
+        self.assertEqual(sum(self.broker.committed.values()), 30)
+
+        self.collection.fail_next = 0
+        self.drain(worker)
+        self.assertEqual(len(self.collection.docs) + len(self.dead_letters), 100)
+
+    def test_failed_commit_after_rebalance_is_redelivered(self):
+        worker = self.make_worker()
+        worker.consumer.commit = mock.Mock(side_effect=CommitFailedError())
+        with mock.patch('builtins.print'):
+            self.assertEqual(worker.run_once(), 0)
+        self.assertEqual(worker.stats['commit_failures'], 1)
+        self.assertEqual(self.broker.committed, {})
+
+        self.drain(self.make_worker())
+        self.assert_persisted_exactly_once()
+
+    def test_stopped_worker_leaves_failed_batch_uncommitted(self):
+        self.collection.fail_next = 1
+        worker = self.make_worker()
+        worker.stop()
+        self.assertEqual(worker.run_once(), 0)
+        self.assertEqual(self.broker.committed, {})
+
+        self.drain(self.make_worker())
+        self.assert_persisted_exactly_once()
+
+    def test_workers_in_a_group_split_partitions(self):
+        first = self.make_worker(partitions=[0, 1])
+        second = self.make_worker(partitions=[2, 3])
+        self.drain(first)
+        self.drain(second)
+
+        self.assert_persisted_exactly_once()
+
+    def test_legacy_and_malformed_records(self):
+        broker = FakeBroker()
+        broker.produce('chat_messages', {"room": "chat", "message": "old", "sender_id": 1})
+        broker.produce('chat_messages', None)
+        worker = MessagePersistenceWorker(
+            broker.consumer('chat_messages', 'persist'), lambda: self.collection, self.dead_letter
+        )
+        worker.run_once()
+        MessagePersistenceWorker(
+            broker.consumer('chat_messages', 'replay'), lambda: self.collection, self.dead_letter
+        ).run_once()
+
+        [doc] = self.collection.docs
+        self.assertEqual(doc['message'], "old")
+        self.assertEqual(worker.stats['skipped'], 1)
@@ -0,0 +1,72 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from chats import producer as producer_module
+from chats.producer import InMemoryProducer, KafkaMessageProducer, get_producer
+
+
+@override_settings(CHAT_PRODUCER_BACKEND='chats.producer.InMemoryProducer')
+class SharedProducerTests(SimpleTestCase):
+
+    def tearDown(self):
+        producer_module.close_producer()
+
+    def test_producer_is_created_once_per_process(self):
+        first = get_producer()
+        self.assertIsInstance(first, InMemoryProducer)
+        self.assertIs(get_producer(), first)
+
+    def test_producer_is_rebuilt_after_fork(self):
+        first = get_producer()
+        with mock.patch('chats.producer.os.getpid', return_value=-1):
+            self.assertIsNot(get_producer(), first)
+
+    def test_close_flushes_and_closes(self):
+        producer = get_producer()
+        producer_module.close_producer()
+        self.assertTrue(producer.closed)
+        self.assertIsNot(get_producer(), producer)
+
+    def test_send_records_delivery(self):
+        producer = get_producer()
+        producer.send('chat_messages', {"message": "hi"})
+        self.assertEqual(producer.messages, [('chat_messages', None, {"message": "hi"})])
+        self.assertEqual(producer.stats.as_dict()['delivered'], 1)
+
+
+class KafkaMessageProducerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.client = mock.Mock()
+        self.future = self.client.send.return_value
+        self.client_class = self.enterContext(mock.patch('kafka.KafkaProducer', return_value=self.client))
+
+    def test_send_does_not_flush(self):
+        producer = KafkaMessageProducer('kafka:9092', linger_ms=5)
+        producer.send('chat_messages', {"message": "hi"})
+        self.client.send.assert_called_once_with('chat_messages', value={"message": "hi"}, key=None)
+        self.client.flush.assert_not_called()
+        self.assertEqual(producer.stats.pending, 1)
+
+    def test_keys_are_optional(self):
+        KafkaMessageProducer('kafka:9092')
+        key_serializer = self.client_class.call_args.kwargs['key_serializer']
+        self.assertIsNone(key_serializer(None))
+        self.assertEqual(key_serializer('room'), b'room')
+
+    def test_callbacks_account_for_delivery_and_errors(self):
+        producer = KafkaMessageProducer('kafka:9092')
+        producer.send('chat_messages', {"message": "one"})
+        producer.send('chat_messages', {"message": "two"})
+
+        on_delivered = self.future.add_callback.call_args[0][0]
+        on_error = self.future.add_errback.call_args[0][0]
+        on_delivered(mock.Mock())
+        with mock.patch('builtins.print'):
+            on_error(RuntimeError("broker down"))
+
+        stats = producer.stats.as_dict()
+        self.assertEqual((stats['sent'], stats['delivered'], stats['failed']), (2, 1, 1))
+        self.assertEqual(stats['pending'], 0)
+        self.assertIn("broker down", stats['last_error'])
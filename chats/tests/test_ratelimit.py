@@ -0,0 +1,89 @@
+import json
+
+from django.test import SimpleTestCase
+
+from chats.ratelimit import InMemoryRateLimiter
+from chats.tests.test_consumers import GroupConsumerTestCase
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class InMemoryRateLimiterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = InMemoryRateLimiter(
+            user={'rate': 1, 'burst': 2}, room={'rate': 10, 'burst': 3}, clock=self.clock
+        )
+
+    async def test_burst_then_refill(self):
+        self.assertIsNone(await self.limiter.allow(1, 'chat'))
+        self.assertIsNone(await self.limiter.allow(1, 'chat'))
+        self.assertEqual(await self.limiter.allow(1, 'chat'), ('user', 1.0))
+
+        self.clock.now += 0.5
+        scope, retry_after = await self.limiter.allow(1, 'chat')
+        self.assertEqual(scope, 'user')
+        self.assertAlmostEqual(retry_after, 0.5)
+
+        self.clock.now += 0.5
+        self.assertIsNone(await self.limiter.allow(1, 'chat'))
+
+    async def test_room_limit_spans_users_and_rejections_cost_nothing(self):
+        for user_id in (1, 2, 3):
+            self.assertIsNone(await self.limiter.allow(user_id, 'chat'))
+
+        # The room is empty; user 4 keeps its own tokens for another room.
+        self.assertEqual((await self.limiter.allow(4, 'chat'))[0], 'room')
+        self.assertIsNone(await self.limiter.allow(4, 'other'))
+        self.assertIsNone(await self.limiter.allow(4, 'other'))
+
+    async def test_disabled_scopes_are_skipped(self):
+        limiter = InMemoryRateLimiter(user=None, room={'rate': 1, 'burst': 1}, clock=self.clock)
+        self.assertIsNone(await limiter.allow(1, 'chat'))
+        self.assertEqual((await limiter.allow(2, 'chat'))[0], 'room')
+
+    async def test_full_buckets_are_swept(self):
+        self.limiter.SWEEP_INTERVAL = 2
+        await self.limiter.allow(1, 'chat')
+        self.clock.now += 60
+        await self.limiter.allow(2, 'chat')
+        self.assertEqual(set(self.limiter._buckets), {'user:2', 'room:chat'})
+
+
+class ConsumerRateLimitTests(GroupConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(self.settings(
+            CHAT_RATE_LIMIT={'OPTIONS': {}, 'user': {'rate': 0.01, 'burst': 1}, 'room': None},
+        ))
+
+    async def test_rejected_frames_get_an_error_and_are_not_broadcast(self):
+        sender = await self.connect(self.alice)
+        receiver = await self.connect(self.bob)
+
+        await sender.send_to(text_data=json.dumps({"message": "first"}))
+        await sender.send_to(text_data=json.dumps({"message": "second"}))
+
+        self.assertEqual(json.loads(await sender.receive_from())["message"], "first")
+        error = json.loads(await sender.receive_from())
+        self.assertEqual((error["type"], error["code"], error["scope"]), ("error", "rate_limited", "user"))
+        self.assertGreater(error["retry_after"], 0)
+
+        self.assertEqual(json.loads(await receiver.receive_from())["message"], "first")
+        self.assertTrue(await receiver.receive_nothing())
+
+        # Bob has his own bucket.
+        await receiver.send_to(text_data=json.dumps({"message": "third"}))
+        self.assertEqual(json.loads(await sender.receive_from())["message"], "third")
+
+        await sender.disconnect()
+        await receiver.disconnect()
@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.test import SimpleTestCase, TestCase
+
+from chats.models import Room, RoomMembership
+from chats.rooms import get_room_for_user, group_for_channel, room_groups
+
+User = get_user_model()
+
+
+class RoomGroupTests(SimpleTestCase):
+
+    def test_unsharded_room_has_one_group(self):
+        self.assertEqual(room_groups('team'), ['chat_team'])
+
+    def test_sharded_room_groups(self):
+        self.assertEqual(room_groups('team', 3), ['chat_team_0', 'chat_team_1', 'chat_team_2'])
+
+    def test_channels_are_spread_over_shards(self):
+        groups = {group_for_channel('team', 4, f'specific.abc!{i}') for i in range(200)}
+        self.assertEqual(groups, set(room_groups('team', 4)))
+        self.assertEqual(group_for_channel('team', 4, 'x'), group_for_channel('team', 4, 'x'))
+
+
+class RoomAccessTests(TestCase):
+
+    def setUp(self):
+        self.member = User.objects.create_user(email='m@example.com', username='m', password='test')
+        self.outsider = User.objects.create_user(email='o@example.com', username='o', password='test')
+        self.private = Room.objects.create(name='private')
+        RoomMembership.objects.create(room=self.private, user=self.member)
+
+    def test_default_room_is_public(self):
+        self.assertEqual(get_room_for_user(self.outsider, 'chat').name, 'chat')
+
+    def test_private_room_requires_membership(self):
+        self.assertEqual(get_room_for_user(self.member, 'private'), self.private)
+        self.assertIsNone(get_room_for_user(self.outsider, 'private'))
+
+    def test_anonymous_and_unknown(self):
+        self.assertIsNone(get_room_for_user(AnonymousUser(), 'chat'))
+        self.assertIsNone(get_room_for_user(self.member, 'missing'))
+
+    def test_conversation_names_are_reserved(self):
+        with self.assertRaisesMessage(ValidationError, "reserved for direct messages"):
+            Room(name='dm_1_2').full_clean()
+        with self.assertRaises(IntegrityError):
+            Room.objects.create(name='dm_1_2')
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from chats.history import InvalidCursor
+from chats.indexes import MESSAGE_INDEXES, ensure_indexes, missing_indexes
+from chats.models import Room
+from chats.search import InvalidQuery, decode_search_cursor, search_messages
+from chats.testing import FakeCollection
+
+User = get_user_model()
+
+START = datetime(2025, 1, 1)
+
+MESSAGES = [
+    ('team', 1, 'deploy the release tonight'),
+    ('team', 2, 'release notes are ready'),
+    ('team', 1, 'lunch?'),
+    ('team', 2, 'the release deploy failed'),
+    ('team', 1, 'release'),
+    ('other', 1, 'release everything'),
+]
+
+
+def seed(collection):
+    for i, (room, sender_id, message) in enumerate(MESSAGES):
+        collection.docs.append({
+            '_id': f"m-{i:02d}",
+            'room': room,
+            'message': message,
+            'sender_id': sender_id,
+            'timestamp': START + timedelta(seconds=i),
+        })
+
+
+class SearchMessagesTests(SimpleTestCase):
+
+    def setUp(self):
+        self.collection = FakeCollection()
+        seed(self.collection)
+
+    def test_results_are_ranked_then_newest_first_across_pages(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = search_messages(self.collection, 'team', 'release deploy', 2, cursor=cursor)
+            seen.extend((doc['_id'], doc['score']) for doc in page)
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, [('m-03', 2), ('m-00', 2), ('m-04', 1), ('m-01', 1)])
+
+    def test_sender_filter(self):
+        page, _ = search_messages(self.collection, 'team', 'release', 10, sender_id=2)
+        self.assertEqual([doc['_id'] for doc in page], ['m-03', 'm-01'])
+        self.assertEqual(set(page[0]), {'_id', 'message', 'sender_id', 'timestamp', 'score'})
+
+    def test_bad_queries_and_cursors(self):
+        for query in (None, '  ', 'x' * 201):
+            with self.assertRaises(InvalidQuery):
+                search_messages(self.collection, 'team', query, 10)
+        with self.assertRaises(InvalidCursor):
+            decode_search_cursor('garbage')
+
+    def test_text_index_is_checked_as_mongo_stores_it(self):
+        ensure_indexes(self.collection, MESSAGE_INDEXES)
+        info = self.collection.index_information()['room_message_text']
+        self.assertEqual(info['key'], [('room', 1), ('_fts', 'text'), ('_ftsx', 1), ('sender_id', 1)])
+        self.assertEqual(info['weights'], {'message': 1})
+        self.assertEqual(missing_indexes(self.collection), [])
+
+
+class RoomSearchViewTests(APITestCase):
+
+    def setUp(self):
+        self.collection = FakeCollection()
+        seed(self.collection)
+        self.enterContext(override_settings(MONGO_DATABASE={'messages': self.collection}))
+        Room.objects.create(name='team', is_public=True)
+
+        self.user = User.objects.create_user(email='test@example.com', username='test', password='test')
+        self.client.force_authenticate(self.user)
+
+    def test_search_is_paginated(self):
+        url = reverse('room-search', args=['team'])
+        response = self.client.get(url, {'q': 'release', 'sender': 1, 'limit': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['id'] for m in response.data['results']], ['m-04'])
+
+        response = self.client.get(url, {'q': 'release', 'sender': 1, 'cursor': response.data['next_cursor']})
+        self.assertEqual([m['message'] for m in response.data['results']], ['deploy the release tonight'])
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_private_room_requires_membership(self):
+        Room.objects.create(name='secret')
+        response = self.client.get(reverse('room-search', args=['secret']), {'q': 'release'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_bad_parameters(self):
+        url = reverse('room-search', args=['team'])
+        for params in ({}, {'q': 'release', 'sender': 'x'}, {'q': 'release', 'cursor': 'x'}):
+            self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,104 @@
+import asyncio
+import json
+
+from django.test import SimpleTestCase
+
+from chats.send_queue import COALESCE, DISCONNECT, DROP_OLDEST, SLOW_CONSUMER, OutboundQueue, SendQueueStats
+
+
+class StalledClient:
+    """
+    Records frames; every send blocks until the test opens the gate.
+    """
+
+    def __init__(self):
+        self.frames = []
+        self.close_codes = []
+        self.gate = asyncio.Event()
+
+    async def send(self, frame):
+        await self.gate.wait()
+        self.frames.append(json.loads(frame.text))
+
+    async def close(self, code):
+        self.close_codes.append(code)
+
+
+class OutboundQueueTests(SimpleTestCase):
+
+    async def make_queue(self, policy, max_size=2):
+        self.client = StalledClient()
+        self.stats = SendQueueStats()
+        queue = OutboundQueue(self.client.send, self.client.close, max_size=max_size, policy=policy, stats=self.stats)
+        await queue.start()
+        return queue
+
+    async def flood(self, queue, count):
+        for seq in range(1, count + 1):
+            await queue.put({"message": f"m{seq}", "seq": seq})
+            # Let the writer pick up the first frame and stall on it.
+            await asyncio.sleep(0)
+
+    async def drain(self, queue):
+        self.client.gate.set()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        await queue.close()
+
+    async def test_frames_are_sent_in_order(self):
+        queue = await self.make_queue(DROP_OLDEST, max_size=10)
+        await self.flood(queue, 3)
+        await self.drain(queue)
+
+        self.assertEqual([f["seq"] for f in self.client.frames], [1, 2, 3])
+        self.assertEqual(self.stats.as_dict()['sent'], 3)
+        self.assertEqual(self.stats.depth, 0)
+        self.assertEqual(self.stats.connections, 0)
+
+    async def test_drop_oldest_keeps_the_newest_frames(self):
+        queue = await self.make_queue(DROP_OLDEST)
+        await self.flood(queue, 5)
+        self.assertEqual(queue.depth, 2)
+        self.assertEqual(self.stats.high_watermark, 2)
+        await self.drain(queue)
+
+        self.assertEqual([f["seq"] for f in self.client.frames], [1, 4, 5])
+        self.assertEqual(queue.dropped, 2)
+        self.assertEqual(self.stats.dropped, 2)
+
+    async def test_coalesce_reports_the_gap(self):
+        queue = await self.make_queue(COALESCE)
+        await self.flood(queue, 5)
+        await self.drain(queue)
+
+        self.assertEqual(self.client.frames, [
+            {"message": "m1", "seq": 1},
+            {"type": "gap", "first_seq": 2, "last_seq": 3, "count": 2},
+            {"message": "m4", "seq": 4},
+            {"message": "m5", "seq": 5},
+        ])
+
+    async def test_disconnect_closes_slow_clients(self):
+        queue = await self.make_queue(DISCONNECT)
+        await self.flood(queue, 4)
+
+        self.assertEqual(self.client.close_codes, [SLOW_CONSUMER])
+        self.assertTrue(queue.closed)
+        self.assertFalse(await queue.put({"message": "late", "seq": 9}))
+        self.assertEqual(self.stats.disconnected, 1)
+        self.assertEqual(self.stats.depth, 0)
+
+    async def test_keyed_frames_replace_each_other(self):
+        queue = await self.make_queue(DROP_OLDEST)
+        await self.flood(queue, 1)
+        await queue.put({"typing": ["alice"]}, key="typing")
+        await queue.put({"typing": ["alice", "bob"]}, key="typing")
+        self.assertEqual(queue.depth, 1)
+        await self.drain(queue)
+
+        self.assertEqual(self.client.frames, [{"message": "m1", "seq": 1}, {"typing": ["alice", "bob"]}])
+        self.assertEqual(self.stats.coalesced, 1)
+
+    def test_unknown_policy_is_rejected(self):
+        with self.assertRaises(ValueError):
+            OutboundQueue(None, None, policy='block')
@@ -0,0 +1,20 @@
+from django.test import SimpleTestCase
+
+from server.startup import measure_once, parse_importtime
+
+
+class StartupProfileTests(SimpleTestCase):
+
+    def test_importtime_output_is_grouped_by_package(self):
+        output = "\n".join([
+            "import time: self [us] | cumulative | imported package",
+            "import time:      1000 |       1000 |     django.utils",
+            "import time:       500 |       1500 |   django",
+            "import time:      2000 |       2000 | chats.consumers",
+        ])
+        self.assertEqual(parse_importtime(output), {'django': 0.0015, 'chats': 0.002})
+
+    def test_heavy_stacks_are_not_imported_at_startup(self):
+        report = measure_once(importtime=False)
+        self.assertEqual(report['deferred_loaded'], [])
+        self.assertGreater(report['phases']['asgi'], 0)
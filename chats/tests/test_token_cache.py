@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from chats.Jwtmiddleware import get_user_from_token, jwt_auth, token_user_cache
+from chats.token_cache import TokenUserCache
+
+User = get_user_model()
+
+
+def fake_user(pk):
+    return SimpleNamespace(pk=pk, is_authenticated=True)
+
+
+class TokenUserCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = TokenUserCache(max_size=2, ttl=60)
+        self.tokens = [RefreshToken() for _ in range(3)]
+        for token in self.tokens:
+            token['exp'] = token.current_time.timestamp() + 3600
+
+    def put(self, index, user):
+        token = self.tokens[index]
+        self.cache.set(str(token), token, user)
+        return str(token)
+
+    def test_hit_and_miss_counters(self):
+        token = self.put(0, fake_user(1))
+        self.assertEqual(self.cache.get(token).pk, 1)
+        self.assertIsNone(self.cache.get(str(self.tokens[1])))
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'evictions': 0, 'size': 1})
+
+    def test_least_recently_used_entry_is_evicted(self):
+        first = self.put(0, fake_user(1))
+        second = self.put(1, fake_user(2))
+        self.cache.get(first)
+        self.put(2, fake_user(3))
+
+        self.assertIsNotNone(self.cache.get(first))
+        self.assertIsNone(self.cache.get(second))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_ttl_is_capped_at_token_expiry(self):
+        self.tokens[0]['exp'] = self.tokens[0].current_time.timestamp() + 5
+        token = self.put(0, fake_user(1))
+        with mock.patch('chats.token_cache.time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(self.cache.get(token))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_different_token_with_same_jti_is_a_miss(self):
+        token = self.put(0, fake_user(1))
+        forged = token[:-1] + ('A' if token[-1] != 'A' else 'B')
+        self.assertIsNone(self.cache.get(forged))
+
+    def test_invalidate_user(self):
+        first = self.put(0, fake_user(1))
+        second = self.put(1, fake_user(2))
+        self.cache.invalidate_user(1)
+        self.assertIsNone(self.cache.get(first))
+        self.assertIsNotNone(self.cache.get(second))
+
+
+class HandshakeTokenCacheTests(TestCase):
+
+    def setUp(self):
+        token_user_cache.clear()
+        self.addCleanup(token_user_cache.clear)
+        self.user = User.objects.create_user(email='test@example.com', username='test', password='test')
+        self.refresh = RefreshToken.for_user(self.user)
+        self.access = str(self.refresh.access_token)
+
+    async def test_second_handshake_skips_database(self):
+        with mock.patch.object(jwt_auth, 'get_user', wraps=jwt_auth.get_user) as get_user:
+            self.assertEqual((await get_user_from_token(self.access)).pk, self.user.pk)
+            self.assertEqual((await get_user_from_token(self.access)).pk, self.user.pk)
+        self.assertEqual(get_user.call_count, 1)
+        self.assertEqual(token_user_cache.stats()['hits'], 1)
+
+    async def test_invalid_token_is_anonymous(self):
+        user = await get_user_from_token('not-a-token')
+        self.assertFalse(user.is_authenticated)
+
+    async def test_inactive_and_deleted_users_are_anonymous(self):
+        # CustomUser has no is_active column, only AbstractBaseUser's True.
+        with mock.patch.object(User, 'is_active', False):
+            self.assertFalse((await get_user_from_token(self.access)).is_authenticated)
+
+        await self.user.adelete()
+        self.assertFalse((await get_user_from_token(self.access)).is_authenticated)
+
+    async def test_saving_user_invalidates(self):
+        await get_user_from_token(self.access)
+        self.user.first_name = 'changed'
+        await self.user.asave()
+        self.assertEqual(token_user_cache.stats()['size'], 0)
+
+    async def test_blacklisting_refresh_token_invalidates(self):
+        await get_user_from_token(self.access)
+        await sync_to_async(self.refresh.blacklist)()
+        self.assertEqual(token_user_cache.stats()['size'], 0)
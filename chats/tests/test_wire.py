@@ -0,0 +1,82 @@
+import json
+import unittest
+import zlib
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from chats import wire
+from chats.tests.test_consumers import GroupConsumerTestCase
+
+
+class NegotiationTests(SimpleTestCase):
+
+    def test_json_is_the_default(self):
+        self.assertEqual(wire.negotiate({}), (None, wire.JSON))
+        self.assertEqual(wire.negotiate({'subprotocols': ['chat.v2']}), (None, wire.JSON))
+        self.assertEqual(wire.negotiate({'subprotocols': ['linkup.json']}), ('linkup.json', wire.JSON))
+
+    def test_msgpack_is_only_offered_when_installed(self):
+        scope = {'subprotocols': ['linkup.msgpack', 'linkup.json']}
+        with mock.patch.object(wire, 'msgpack', None):
+            self.assertEqual(wire.negotiate(scope), ('linkup.json', wire.JSON))
+
+
+@unittest.skipIf(wire.msgpack is None, "msgpack is not installed")
+class BinaryEncodingTests(SimpleTestCase):
+
+    @override_settings(CHAT_WIRE={'compress_threshold': 100, 'compress_level': 6, 'max_frame_size': 4096})
+    def test_large_payloads_are_compressed(self):
+        small = wire.pack({"message": "hi", "seq": 1})
+        large = wire.pack({"message": "x" * 1000, "seq": 2})
+
+        self.assertEqual(small[0], wire.PLAIN)
+        self.assertEqual(large[0], wire.DEFLATED)
+        self.assertLess(len(large), 100)
+        self.assertEqual(wire.decode(bytes_data=small), {"message": "hi", "seq": 1})
+        self.assertEqual(wire.decode(bytes_data=large), {"message": "x" * 1000, "seq": 2})
+
+    @override_settings(CHAT_WIRE={'compress_threshold': 100, 'compress_level': 6, 'max_frame_size': 4096})
+    def test_frames_may_not_inflate_past_the_max_frame_size(self):
+        bomb = bytes([wire.DEFLATED]) + zlib.compress(wire.msgpack.packb({"message": "x" * 100000}))
+        with self.assertRaises(wire.FrameTooLarge):
+            wire.decode(bytes_data=bomb)
+
+        truncated = wire.pack({"message": "x" * 1000})[:-4]
+        with self.assertRaisesMessage(ValueError, "Truncated"):
+            wire.decode(bytes_data=truncated)
+
+    def test_shared_frames_are_encoded_once_per_process(self):
+        data = {"message": "hello", "seq": 1}
+        text = json.dumps(data)
+        with mock.patch.object(wire, 'binary_cache', wire.BinaryCache()), \
+                mock.patch.object(wire, 'pack', wraps=wire.pack) as pack:
+            copies = [wire.OutgoingFrame(dict(data), text) for _ in range(5)]
+            self.assertEqual(len({frame.binary() for frame in copies}), 1)
+            self.assertIs(copies[0].text, text)
+        self.assertEqual(pack.call_count, 1)
+
+
+@unittest.skipIf(wire.msgpack is None, "msgpack is not installed")
+class BinaryClientTests(GroupConsumerTestCase):
+
+    async def test_binary_and_json_clients_share_a_room(self):
+        binary = await self.connect(self.alice, subprotocols=['linkup.msgpack'])
+        text = await self.connect(self.bob)
+
+        await binary.send_to(bytes_data=wire.pack({"message": "hello"}))
+
+        self.assertEqual(wire.decode(bytes_data=await binary.receive_from()), {"message": "hello", "seq": 1})
+        self.assertEqual(json.loads(await text.receive_from()), {"message": "hello", "seq": 1})
+
+        await binary.disconnect()
+        await text.disconnect()
+
+    @override_settings(CHAT_WIRE={'compress_threshold': 100, 'compress_level': 6, 'max_frame_size': 4096})
+    async def test_oversized_frames_close_the_socket_with_1009(self):
+        binary = await self.connect(self.alice, subprotocols=['linkup.msgpack'])
+
+        await binary.send_to(bytes_data=wire.pack({"message": "x" * 100000}))
+
+        self.assertEqual(await binary.receive_output(), {"type": "websocket.close", "code": wire.MESSAGE_TOO_BIG})
+        await binary.disconnect()
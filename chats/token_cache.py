@@ -0,0 +1,105 @@
+"""
+Bounded TTL/LRU cache of JWT -> user for WebSocket handshakes.
+
+Entries are keyed by the token's ``jti`` and remember a hash of the exact
+token that was verified, so a hit is only served for a byte-identical token
+and the signature check can safely be skipped. Entries never outlive the
+token's own expiry, and are dropped whenever the user is saved or deleted
+(e.g. deactivated) or one of their refresh tokens is blacklisted on logout
+(see chats/signals.py).
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode()).digest()
+
+
+def unverified_claims(token):
+    try:
+        return jwt.decode(token, options={'verify_signature': False})
+    except jwt.InvalidTokenError:
+        return None
+
+
+class TokenUserCache:
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._jtis_by_user = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token):
+        claims = unverified_claims(token)
+        jti = claims and claims.get('jti')
+
+        with self._lock:
+            entry = self._entries.get(jti) if jti else None
+            if entry is not None and entry[2] <= time.monotonic():
+                self._remove(jti)
+                entry = None
+            if entry is None or entry[0] != token_digest(token):
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(jti)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, token, validated_token, user):
+        jti = validated_token.get('jti')
+        if not jti or user is None or not user.is_authenticated:
+            return
+
+        ttl = self.ttl
+        if 'exp' in validated_token:
+            ttl = min(ttl, validated_token['exp'] - time.time())
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._remove(jti)
+            self._entries[jti] = (token_digest(token), user, time.monotonic() + ttl)
+            self._jtis_by_user.setdefault(user.pk, set()).add(jti)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for jti in list(self._jtis_by_user.get(user_id, ())):
+                self._remove(jti)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._jtis_by_user.clear()
+
+    def _remove(self, jti):
+        entry = self._entries.pop(jti, None)
+        if entry is None:
+            return
+        jtis = self._jtis_by_user.get(entry[1].pk)
+        if jtis is not None:
+            jtis.discard(jti)
+            if not jtis:
+                del self._jtis_by_user[entry[1].pk]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+            }
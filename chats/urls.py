@@ -0,0 +1,8 @@
+from django.urls import path
+from .views import RoomHistoryView, RoomSearchView
+
+
+urlpatterns = [
+    path('v1/rooms/<slug:room_name>/messages/', RoomHistoryView.as_view(), name='room-history'),
+    path('v1/rooms/<slug:room_name>/search/', RoomSearchView.as_view(), name='room-search'),
+]
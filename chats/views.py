@@ -1,3 +1,142 @@
-from django.shortcuts import render
+from rest_framework import status
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from server.metrics import TimedViewMixin
+from . import mongo
+from .history import InvalidCursor, fetch_room_history
+from .rooms import get_room_for_user
+from .search import InvalidQuery, search_messages
 
-# Create your views here.
+
+class RoomHistoryView(TimedViewMixin, APIView):
+    """
+    GET /chats/v1/rooms/<room>/messages/ → Read a room's message history
+
+    What this endpoint does:
+      1) Checks the user may join the room (public, or a member)
+      2) Returns up to `limit` messages (default 50, max 200), newest first
+      3) Accepts the `next_cursor` of a previous page as `cursor` to continue
+         further back; it is null on the last page
+      4) Reads the (room, timestamp, _id) index directly, so every page costs
+         the same no matter how far back it is
+    """
+    permission_classes = [IsAuthenticated]
+
+    default_limit = 50
+    max_limit = 200
+
+    def get(self, request, room_name):
+        if get_room_for_user(request.user, room_name) is None:
+            return Response({
+                'error': 'Room not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return Response({
+                'error': 'limit must be a positive integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            messages, next_cursor = fetch_room_history(
+                mongo.get_collection('messages'),
+                room_name,
+                limit,
+                request.query_params.get('cursor'),
+            )
+        except InvalidCursor:
+            return Response({
+                'error': 'Invalid cursor'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'results': [
+                {
+                    'id': str(doc['_id']),
+                    'message': doc.get('message'),
+                    'sender_id': doc.get('sender_id'),
+                    'timestamp': doc.get('timestamp'),
+                }
+                for doc in messages
+            ],
+            'next_cursor': next_cursor,
+        }, status=status.HTTP_200_OK)
+
+
+class RoomSearchView(TimedViewMixin, APIView):
+    """
+    GET /chats/v1/rooms/<room>/search/?q=... → Search a room's messages
+
+    What this endpoint does:
+      1) Checks the user may join the room (public, or a member)
+      2) Matches `q` (1-200 characters) against the room's messages with the
+         room_message_text index; `sender` (a user id) narrows it to one sender
+      3) Returns up to `limit` messages (default 20, max 100), best match
+         first and newest first among equal matches, each with its `score`
+      4) Accepts the `next_cursor` of a previous page as `cursor`; it is null
+         on the last page
+    """
+    permission_classes = [IsAuthenticated]
+
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request, room_name):
+        if get_room_for_user(request.user, room_name) is None:
+            return Response({
+                'error': 'Room not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return Response({
+                'error': 'limit must be a positive integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        sender_id = request.query_params.get('sender')
+        if sender_id is not None:
+            try:
+                sender_id = int(sender_id)
+            except ValueError:
+                return Response({
+                    'error': 'sender must be a user id'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            messages, next_cursor = search_messages(
+                mongo.get_collection('messages'),
+                room_name,
+                request.query_params.get('q'),
+                limit,
+                sender_id=sender_id,
+                cursor=request.query_params.get('cursor'),
+            )
+        except InvalidQuery:
+            return Response({
+                'error': 'q must be 1 to 200 characters'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except InvalidCursor:
+            return Response({
+                'error': 'Invalid cursor'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'results': [
+                {
+                    'id': str(doc['_id']),
+                    'message': doc.get('message'),
+                    'sender_id': doc.get('sender_id'),
+                    'timestamp': doc.get('timestamp'),
+                    'score': doc['score'],
+                }
+                for doc in messages
+            ],
+            'next_cursor': next_cursor,
+        }, status=status.HTTP_200_OK)
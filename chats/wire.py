@@ -0,0 +1,173 @@
+"""
+Wire encoding of chat frames: JSON text by default, MessagePack on request.
+
+A client picks the encoding with the WebSocket subprotocol:
+
+* ``linkup.json`` or no subprotocol: JSON text frames, as before.
+* ``linkup.msgpack``: binary frames. The first byte is a flag (0 = plain
+  MessagePack, 1 = zlib-compressed MessagePack), and the rest is the
+  payload. Payloads above settings.CHAT_WIRE['compress_threshold'] bytes
+  are compressed. Inbound binary frames use the same layout; one that
+  inflates past settings.CHAT_WIRE['max_frame_size'] bytes closes the
+  socket with 1009 (Message Too Big).
+
+MessagePack is in requirements.txt, but still optional: without the
+``msgpack`` package the subprotocol is never accepted, and clients fall back
+to JSON.
+
+Frames are encoded once per message, not once per recipient. The sender
+puts the JSON text in the group event, and recipients send it unchanged.
+Binary encodings are cached per process, keyed on that text, so every local
+recipient shares one encoded copy. ASGI servers don't let an application
+negotiate permessage-deflate, so compression of large payloads happens here
+instead, for binary clients.
+"""
+import json
+import threading
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+
+SUBPROTOCOLS = {
+    'linkup.json': JSON,
+    'linkup.msgpack': MSGPACK,
+}
+
+PLAIN = 0
+DEFLATED = 1
+
+# Close code for an inbound frame that is too large to handle.
+MESSAGE_TOO_BIG = 1009
+
+
+class FrameTooLarge(ValueError):
+    pass
+
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def available_codecs():
+    return (JSON, MSGPACK) if msgpack is not None else (JSON,)
+
+
+def negotiate(scope):
+    """
+    ``(subprotocol, codec)`` for a connecting client. The subprotocol is the
+    client's first offer that we support, or None.
+    """
+    for offered in scope.get('subprotocols') or ():
+        codec = SUBPROTOCOLS.get(offered)
+        if codec in available_codecs():
+            return offered, codec
+    return None, JSON
+
+
+def decode(text_data=None, bytes_data=None):
+    """
+    Parse an inbound frame of either encoding.
+    """
+    if text_data is not None:
+        return json.loads(text_data)
+    if msgpack is None:
+        raise ValueError("Binary frames need the msgpack package")
+    flag, payload = bytes_data[0], bytes_data[1:]
+    if flag == DEFLATED:
+        payload = inflate(payload, settings.CHAT_WIRE['max_frame_size'])
+    return msgpack.unpackb(payload)
+
+
+def inflate(payload, max_size):
+    """
+    Decompress ``payload``, without ever holding more than ``max_size``
+    bytes of output, so a small frame can't expand into gigabytes.
+    """
+    decompressor = zlib.decompressobj()
+    data = decompressor.decompress(payload, max_size)
+    if decompressor.unconsumed_tail:
+        raise FrameTooLarge(f"Frame inflates to more than {max_size} bytes")
+    if not decompressor.eof:
+        raise ValueError("Truncated compressed frame")
+    return data
+
+
+def pack(data):
+    payload = msgpack.packb(data)
+    if len(payload) > settings.CHAT_WIRE['compress_threshold']:
+        compressed = zlib.compress(payload, settings.CHAT_WIRE['compress_level'])
+        if len(compressed) < len(payload):
+            return bytes([DEFLATED]) + compressed
+    return bytes([PLAIN]) + payload
+
+
+class BinaryCache:
+    """
+    Small LRU of JSON text -> binary frame, shared by a process's connections.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text, data):
+        with self._lock:
+            binary = self._entries.get(text)
+            if binary is not None:
+                self._entries.move_to_end(text)
+                return binary
+        binary = pack(data)
+        with self._lock:
+            self._entries[text] = binary
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return binary
+
+
+binary_cache = BinaryCache()
+
+
+class OutgoingFrame:
+    """
+    A frame on its way to one or more clients, encoded lazily and at most
+    once per encoding.
+    """
+    __slots__ = ('data', '_text', 'shared')
+
+    def __init__(self, data, text=None):
+        self.data = data
+        self._text = text
+        # Text that came in the group event is identical for every recipient,
+        # so its binary form is worth caching.
+        self.shared = text is not None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = json.dumps(self.data)
+        return self._text
+
+    def binary(self):
+        if self.shared:
+            return binary_cache.get(self._text, self.data)
+        return pack(self.data)
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+
+def websocket_message(frame, codec):
+    """
+    The websocket.send message carrying ``frame`` in ``codec``.
+    """
+    if codec == MSGPACK:
+        return {"type": "websocket.send", "bytes": frame.binary()}
+    return {"type": "websocket.send", "text": frame.text}
@@ -6,17 +6,19 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from chats.routing import websocket_urlpatterns
-
-# Import your custom JWT middleware
-from chats.Jwtmiddleware import JWTAuthMiddlewareHeader
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
 
-# Standard Django ASGI application for HTTP
+# Standard Django ASGI application for HTTP. It sets Django up, so it has to
+# come before anything that imports models.
 django_asgi_app = get_asgi_application()
 
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from chats.routing import websocket_urlpatterns  # noqa: E402
+
+# Import your custom JWT middleware
+from chats.Jwtmiddleware import JWTAuthMiddlewareHeader  # noqa: E402
+
 # ProtocolTypeRouter allows HTTP and WebSocket support
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
@@ -0,0 +1,224 @@
+"""
+Pre-fork supervisor for the ASGI server, run with ``python manage.py serve``.
+
+It starts ``workers`` Daphne processes (server/worker.py), one by default,
+that all accept on the same port:
+
+* With SO_REUSEPORT (Linux, the BSDs) the supervisor binds one listening
+  socket per worker to the port and hands it over as an inherited fd. The
+  kernel spreads new connections evenly over the sockets, so connection
+  capacity grows with the number of workers instead of every worker
+  waking up for every connection.
+* Without it, all workers accept on one shared socket.
+
+Signals:
+
+* SIGTERM / SIGINT: every worker drains (WebSockets are closed with 1012
+  Service Restart, then the Kafka and Mongo buffers are flushed) and the
+  supervisor exits once they have, killing any worker still running after
+  ``drain_timeout + grace`` seconds.
+* SIGHUP: reload. A replacement worker is started for every slot before
+  the old one is told to drain. The replacement's socket is listening
+  before it is spawned, so the port never goes dark.
+
+Workers that die are started again, with exponential backoff while they keep
+crashing.
+
+Workers share nothing but the port. The default backends keep rate limits,
+presence, the channel registry, dedupe ids, room backlogs, the cache and the
+handshake token cache in each process's memory, so more than one worker needs
+the Redis backends (see process_local_state()); ``serve`` refuses to start
+several workers otherwise.
+"""
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+
+
+# Shared-state settings and the process-local backends they default to.
+PROCESS_LOCAL_BACKENDS = {
+    'CHAT_RATE_LIMIT_BACKEND': 'chats.ratelimit.InMemoryRateLimiter',
+    'CHAT_PRESENCE_BACKEND': 'chats.ephemeral.InMemoryPresence',
+    'CHAT_CHANNEL_REGISTRY_BACKEND': 'chats.direct.InMemoryChannelRegistry',
+    'CHAT_DEDUPE_BACKEND': 'chats.dedupe.InMemoryDedupe',
+    'CHAT_BACKLOG_BACKEND': 'chats.backlog.InMemoryBacklog',
+}
+
+
+def process_local_state():
+    """
+    Descriptions of the configured state that each worker keeps to itself,
+    and that would differ between workers if there were several.
+    """
+    problems = [
+        f"{name} is {getattr(settings, name)}"
+        for name, backend in PROCESS_LOCAL_BACKENDS.items()
+        if getattr(settings, name) == backend
+    ]
+    for alias, cache in settings.CACHES.items():
+        if cache['BACKEND'] == 'django.core.cache.backends.locmem.LocMemCache':
+            problems.append(f"CACHES[{alias!r}] is {cache['BACKEND']} (set CACHE_REDIS_URL)")
+    for alias, layer in settings.CHANNEL_LAYERS.items():
+        if layer['BACKEND'] == 'channels.layers.InMemoryChannelLayer':
+            problems.append(f"CHANNEL_LAYERS[{alias!r}] is {layer['BACKEND']}")
+    # Saves, deletions and logouts only drop the entries of the worker that
+    # handled them (chats/signals.py).
+    if settings.CHAT_TOKEN_CACHE['ttl'] > 0:
+        problems.append("CHAT_TOKEN_CACHE is invalidated per process (set CHAT_TOKEN_CACHE_TTL=0)")
+    return problems
+
+
+def bind_socket(host, port, reuse_port, backlog=2048):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+
+    # A worker that exits sooner than this after starting counts as a crash.
+    MIN_UPTIME = 10.0
+
+    def __init__(self, host='0.0.0.0', port=8000, workers=None, reuse_port=None, drain_timeout=20,
+                 grace=5, restart_backoff=0.5, max_backoff=30.0, verbosity=1):
+        self.host = host
+        self.port = port
+        self.count = workers or 1
+        self.reuse_port = hasattr(socket, 'SO_REUSEPORT') if reuse_port is None else reuse_port
+        self.drain_timeout = drain_timeout
+        self.grace = grace
+        self.restart_backoff = restart_backoff
+        self.max_backoff = max_backoff
+        self.verbosity = verbosity
+        self.shared_socket = None
+        # slot -> (process, started at)
+        self.workers = {}
+        # slot -> when to start it again, and the delay before the next restart
+        self.pending = {}
+        self.backoffs = {}
+        # (process, kill at) of workers that were told to drain
+        self.retiring = []
+        self.stopping = False
+        self.reload_requested = False
+
+    def worker_command(self, fd):
+        return [
+            sys.executable, '-m', 'django', 'serve', '--worker-fd', str(fd),
+            '--drain-timeout', str(self.drain_timeout), '--verbosity', str(self.verbosity),
+        ]
+
+    def worker_socket(self):
+        if not self.reuse_port:
+            if self.shared_socket is None:
+                self.shared_socket = bind_socket(self.host, self.port, reuse_port=False)
+                self.port = self.shared_socket.getsockname()[1]
+            return self.shared_socket
+        sock = bind_socket(self.host, self.port, reuse_port=True)
+        # Port 0 picks a free port for the first socket; the rest join it.
+        self.port = sock.getsockname()[1]
+        return sock
+
+    def spawn(self, slot):
+        sock = self.worker_socket()
+        try:
+            env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+            process = subprocess.Popen(
+                self.worker_command(sock.fileno()),
+                pass_fds=(sock.fileno(),), env=env, cwd=settings.BASE_DIR,
+            )
+        finally:
+            # The worker has its own copy; a socket nobody accepts on would
+            # still be handed connections.
+            if sock is not self.shared_socket:
+                sock.close()
+        self.workers[slot] = (process, time.monotonic())
+        return process
+
+    def retire(self, process):
+        try:
+            process.send_signal(signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        self.retiring.append((process, time.monotonic() + self.drain_timeout + self.grace))
+
+    def reload(self):
+        for slot, (process, _) in list(self.workers.items()):
+            self.spawn(slot)
+            self.retire(process)
+
+    def reap(self):
+        """
+        Notice exited workers, schedule their restart and start the ones
+        that are due. Returns the number of workers started.
+        """
+        now = time.monotonic()
+        for slot, (process, started) in list(self.workers.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            del self.workers[slot]
+            backoff = 0.0 if now - started >= self.MIN_UPTIME else self.backoffs.get(slot, 0.0)
+            print(f"Worker {process.pid} exited with status {code}, restarting in {backoff:.1f}s")
+            self.pending[slot] = now + backoff
+            self.backoffs[slot] = min(max(backoff * 2, self.restart_backoff), self.max_backoff)
+
+        self.retiring = [(process, kill_at) for process, kill_at in self.retiring if process.poll() is None]
+        for process, kill_at in self.retiring:
+            if now >= kill_at:
+                process.kill()
+
+        started = 0
+        for slot, restart_at in list(self.pending.items()):
+            if now >= restart_at:
+                del self.pending[slot]
+                self.spawn(slot)
+                started += 1
+        return started
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def request_reload(self, *args):
+        self.reload_requested = True
+
+    def run(self, poll_interval=0.2):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.request_reload)
+
+        for slot in range(self.count):
+            self.spawn(slot)
+        mode = "SO_REUSEPORT" if self.reuse_port else "a shared socket"
+        print(f"Serving on {self.host}:{self.port} with {self.count} workers on {mode}")
+
+        try:
+            while not self.stopping:
+                if self.reload_requested:
+                    self.reload_requested = False
+                    print("Reloading workers")
+                    self.reload()
+                self.reap()
+                time.sleep(poll_interval)
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        for process, _ in self.workers.values():
+            self.retire(process)
+        self.workers = {}
+        self.pending = {}
+        while self.retiring:
+            self.reap()
+            time.sleep(0.1)
+        if self.shared_socket is not None:
+            self.shared_socket.close()
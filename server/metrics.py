@@ -0,0 +1,288 @@
+"""
+Hot-path timings and counters, exposed in Prometheus text format on /metrics.
+
+Metrics are declared once at module level and updated from request and
+socket handlers:
+
+    RECEIVE_STAGE = histogram('chat_receive_stage_seconds', 'Time per receive() stage.', ('stage',))
+
+    with RECEIVE_STAGE.time('group_send'):
+        ...
+
+Each thread updates its own shard of every metric. The hot path never takes
+a lock, and threads never write to the same values. Shards are only added
+up when /metrics is scraped. Existing stats objects (producer, writer, send
+queues, token cache) are published as they are, with register_stats().
+
+Set METRICS_ENABLED=0 to turn instrumentation off. Timers then return a
+shared no-op context, and /metrics returns 404.
+
+/metrics answers 403 unless the client's address is in
+settings.METRICS_ACCESS['allowed_networks'] (loopback by default) or it
+sends the bearer token set in METRICS_ACCESS['token'].
+"""
+import hmac
+import ipaddress
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_NOOP = nullcontext()
+
+enabled = settings.METRICS_ENABLED
+
+_metrics = {}
+_stats = {}
+_registry_lock = threading.Lock()
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = {}
+            with self._shards_lock:
+                self._shards.append(values)
+            self._local.values = values
+            return values
+
+    def _snapshot(self):
+        with self._shards_lock:
+            shards = list(self._shards)
+        # list() copies each dict in one step under the GIL, so a thread
+        # adding a label set mid-scrape can't break the iteration.
+        return [list(shard.items()) for shard in shards]
+
+    def _labels(self, labelvalues, extra=()):
+        pairs = list(zip(self.labelnames, labelvalues)) + list(extra)
+        if not pairs:
+            return ''
+        body = ','.join(f'{name}="{_escape(str(value))}"' for name, value in pairs)
+        return '{' + body + '}'
+
+    def reset(self):
+        with self._shards_lock:
+            for shard in self._shards:
+                shard.clear()
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        if not enabled:
+            return
+        shard = self._shard()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+    def values(self):
+        totals = {}
+        for items in self._snapshot():
+            for labelvalues, value in items:
+                totals[labelvalues] = totals.get(labelvalues, 0) + value
+        return totals
+
+    def render(self):
+        return [f'{self.name}{self._labels(labelvalues)} {_number(value)}'
+                for labelvalues, value in sorted(self.values().items())]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labelvalues):
+        if not enabled:
+            return
+        shard = self._shard()
+        entry = shard.get(labelvalues)
+        if entry is None:
+            # One slot per bucket plus +Inf, then sum and count.
+            entry = shard[labelvalues] = [0] * (len(self.buckets) + 3)
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-2] += value
+        entry[-1] += 1
+
+    def time(self, *labelvalues):
+        if not enabled:
+            return _NOOP
+        return _Timer(self, labelvalues)
+
+    def values(self):
+        totals = {}
+        for items in self._snapshot():
+            for labelvalues, entry in items:
+                total = totals.setdefault(labelvalues, [0] * len(entry))
+                for i, value in enumerate(list(entry)):
+                    total[i] += value
+        return totals
+
+    def render(self):
+        lines = []
+        for labelvalues, entry in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), entry):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                lines.append(f'{self.name}_bucket{self._labels(labelvalues, [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{self._labels(labelvalues)} {_number(entry[-2])}')
+            lines.append(f'{self.name}_count{self._labels(labelvalues)} {entry[-1]}')
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labelvalues', 'start')
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+
+def _register(metric):
+    with _registry_lock:
+        existing = _metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        _metrics[metric.name] = metric
+        return metric
+
+
+def counter(name, help, labelnames=()):
+    return _register(Counter(name, help, labelnames))
+
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, help, labelnames, buckets))
+
+
+def register_stats(prefix, help, collect):
+    """
+    Publish a stats object. ``collect`` returns a dict, and every numeric
+    value in it becomes ``<prefix>_<key>``.
+    """
+    with _registry_lock:
+        _stats[prefix] = (help, collect)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    with _registry_lock:
+        metrics = sorted(_metrics.values(), key=lambda m: m.name)
+        stats = sorted(_stats.items())
+
+    lines = []
+    for metric in metrics:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(metric.render())
+
+    for prefix, (help, collect) in stats:
+        try:
+            values = collect() or {}
+        except Exception as e:
+            print(f"Error collecting {prefix} stats: {e}")
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f'{prefix}_{key}'
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} untyped')
+            lines.append(f'{name} {_number(value)}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def scrape_allowed(request):
+    access = settings.METRICS_ACCESS
+    token = access.get('token')
+    auth_header = request.headers.get('Authorization', '')
+    if token and auth_header.startswith('Bearer '):
+        if hmac.compare_digest(auth_header[len('Bearer '):].encode(), token.encode()):
+            return True
+
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False) for network in access['allowed_networks'])
+
+
+def metrics_view(request):
+    """
+    GET /metrics → Prometheus scrape endpoint.
+    """
+    if not enabled:
+        raise Http404()
+    if not scrape_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
+VIEW_LATENCY = histogram(
+    'http_view_seconds', 'Time spent in API views.', ('view', 'method', 'status')
+)
+
+
+class TimedViewMixin:
+    """
+    Records how long each request to a DRF view takes, by view, method and
+    status code.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if not enabled:
+            return super().dispatch(request, *args, **kwargs)
+        start = time.perf_counter()
+        response = super().dispatch(request, *args, **kwargs)
+        VIEW_LATENCY.observe(
+            time.perf_counter() - start, type(self).__name__, request.method, response.status_code
+        )
+        return response
+
+
+def _toggle_metrics(setting, value, **kwargs):
+    global enabled
+    if setting == 'METRICS_ENABLED':
+        enabled = value
+
+
+setting_changed.connect(_toggle_metrics)
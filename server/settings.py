@@ -12,15 +12,18 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
-from dotenv import load_dotenv
-load_dotenv()
-from pymongo import MongoClient
 from datetime import timedelta
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Deployments pass the environment in directly; python-dotenv is only
+# imported when there is a .env file to read.
+if (BASE_DIR / '.env').exists():
+    from dotenv import load_dotenv
+    load_dotenv(BASE_DIR / '.env')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
@@ -43,8 +46,10 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'accounts',
+    'chats',
     'rest_framework',
     'rest_framework_simplejwt',
     'rest_framework_simplejwt.token_blacklist',
@@ -106,14 +111,85 @@ MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "chat_db")
 
 MONGO_URI = f"mongodb://{MONGO_USER}:{MONGO_PASS}@{MONGO_HOST}:{MONGO_PORT}/"
 
-mongo_client = MongoClient(MONGO_URI)
-mongo_db = mongo_client[MONGO_DB_NAME]
+# Client options for chats/mongo.py, which creates the client on first use in
+# each process. Async callers share a thread pool of `maxPoolSize` threads.
+MONGO_CLIENT = {
+    'maxPoolSize': int(os.getenv("MONGO_MAX_POOL_SIZE", 50)),
+    'minPoolSize': int(os.getenv("MONGO_MIN_POOL_SIZE", 0)),
+    'connectTimeoutMS': int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+    'serverSelectionTimeoutMS': int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+    'socketTimeoutMS': int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 30000)),
+    'waitQueueTimeoutMS': int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000)),
+}
+
+# How chat messages reach Mongo: 'worker' leaves it to the persist_messages
+# command consuming the chat_messages topic, 'direct' writes from the socket
+# handler through the write-behind buffer below.
+CHAT_PERSISTENCE = os.getenv("CHAT_PERSISTENCE", "worker")
+
+# Files the server writes at runtime. Outside the source tree in containers
+# (a volume in docker-compose.yml); ./var, which git ignores, by default.
+DATA_DIR = Path(os.getenv("DATA_DIR", BASE_DIR / 'var'))
+
+# Write-behind buffer for the messages collection (see chats/persistence.py).
+CHAT_MESSAGE_WRITER = {
+    'batch_size': int(os.getenv("CHAT_WRITER_BATCH_SIZE", 500)),
+    'flush_interval': float(os.getenv("CHAT_WRITER_FLUSH_INTERVAL", 0.1)),
+    'max_queue': int(os.getenv("CHAT_WRITER_MAX_QUEUE", 10000)),
+    'enqueue_timeout': float(os.getenv("CHAT_WRITER_ENQUEUE_TIMEOUT", 0)),
+    'max_retries': int(os.getenv("CHAT_WRITER_MAX_RETRIES", 5)),
+    'retry_backoff': float(os.getenv("CHAT_WRITER_RETRY_BACKOFF", 0.5)),
+    'dead_letter_path': os.getenv("CHAT_WRITER_DEAD_LETTER_PATH", str(DATA_DIR / 'dead_letter_messages.jsonl')),
+}
+
+KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
+
+# One shared producer per process (see chats/producer.py). Sends are batched
+# by the client for up to linger_ms or batch_size bytes, whichever comes first.
+CHAT_PRODUCER_BACKEND = os.getenv("CHAT_PRODUCER_BACKEND", "chats.producer.KafkaMessageProducer")
+KAFKA_PRODUCER = {
+    'linger_ms': int(os.getenv("KAFKA_LINGER_MS", 5)),
+    'batch_size': int(os.getenv("KAFKA_BATCH_SIZE", 64 * 1024)),
+    'compression_type': os.getenv("KAFKA_COMPRESSION_TYPE", "gzip") or None,
+    'acks': 1,
+}
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=120),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.TokenRefreshSerializer',
+}
+
+# In-memory refresh token blacklist (accounts/tokens.py). Other workers'
+# blacklistings are picked up every `refresh_interval` seconds. Expired rows
+# are deleted by `python manage.py prune_tokens`; run it from cron.
+ACCOUNTS_BLACKLIST_CACHE = {
+    'refresh_interval': float(os.getenv('ACCOUNTS_BLACKLIST_REFRESH_INTERVAL', 1.0)),
+    'prune_interval': 60.0,
+}
+
+# Handshake cache of JWT -> user for WebSocket connections (chats/token_cache.py).
+# Entries live at most `ttl` seconds and never past the token's own expiry.
+CHAT_TOKEN_CACHE = {
+    'max_size': int(os.getenv("CHAT_TOKEN_CACHE_SIZE", 10000)),
+    'ttl': int(os.getenv("CHAT_TOKEN_CACHE_TTL", 300)),
+}
+
+# Hot-path timings and counters, served in Prometheus format on /metrics
+# (server/metrics.py). METRICS_ENABLED=0 turns instrumentation off entirely.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Who may scrape /metrics: clients in `allowed_networks` (addresses or CIDR
+# ranges, comma-separated in METRICS_ALLOWED_NETWORKS), or anyone sending
+# "Authorization: Bearer <METRICS_TOKEN>" when a token is set.
+METRICS_ACCESS = {
+    'allowed_networks': [
+        network.strip() for network in os.getenv('METRICS_ALLOWED_NETWORKS', '127.0.0.1,::1').split(',')
+        if network.strip()
+    ],
+    'token': os.getenv('METRICS_TOKEN') or None,
 }
 
 REST_FRAMEWORK = {
@@ -126,6 +202,32 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Set CACHE_REDIS_URL when running more than one worker, so cache
+# invalidations reach all of them.
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+if os.getenv('CACHE_REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_REDIS_URL'),
+    }
+
+# Serialized whoami payloads per user (accounts/cache.py), dropped whenever
+# the user is saved or deleted.
+ACCOUNTS_PROFILE_CACHE = {
+    'alias': 'default',
+    'ttl': int(os.getenv('ACCOUNTS_PROFILE_CACHE_TTL', 300)),
+}
+
+# User typeahead (accounts/lookup.py). Results for queries of up to
+# `cached_length` characters are cached for `ttl` seconds.
+ACCOUNTS_USER_LOOKUP = {
+    'alias': 'default',
+    'ttl': int(os.getenv('ACCOUNTS_USER_LOOKUP_TTL', 60)),
+    'cached_length': 3,
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -171,11 +273,118 @@ AUTH_USER_MODEL = 'accounts.CUstomUser'
 
 ASGI_APPLICATION = "server.asgi.application"
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {
-            "hosts": [("127.0.0.1", 6379)],
-        },
+# WebSocket chat consumer implementation: 'async' (AsyncGroupConsumer) or
+# 'sync' (the original GroupConsumer), selectable for A/B comparisons.
+CHAT_CONSUMER = os.getenv('CHAT_CONSUMER', 'async')
+
+# Room joined by clients connecting to the legacy ws/chat/ route.
+CHAT_DEFAULT_ROOM = 'chat'
+
+# Redis used for state shared between chat workers (not the channel layer).
+CHAT_REDIS_URL = os.getenv('CHAT_REDIS_URL', 'redis://127.0.0.1:6379/1')
+
+# Per-connection outbound queue (see chats/send_queue.py). policy is one of
+# 'drop_oldest', 'coalesce' or 'disconnect'.
+CHAT_SEND_QUEUE = {
+    'max_size': int(os.getenv('CHAT_SEND_QUEUE_SIZE', 256)),
+    'policy': os.getenv('CHAT_SEND_QUEUE_POLICY', 'coalesce'),
+}
+
+# Token-bucket limits on inbound chat frames (chats/ratelimit.py): `rate` is
+# frames per second, `burst` the bucket size. Set a scope to None to disable
+# it; use chats.ratelimit.RedisRateLimiter to share buckets between workers.
+CHAT_RATE_LIMIT_BACKEND = os.getenv('CHAT_RATE_LIMIT_BACKEND', 'chats.ratelimit.InMemoryRateLimiter')
+CHAT_RATE_LIMIT = {
+    'OPTIONS': {},
+    'user': {
+        'rate': float(os.getenv('CHAT_RATE_LIMIT_USER_RATE', 5)),
+        'burst': int(os.getenv('CHAT_RATE_LIMIT_USER_BURST', 20)),
+    },
+    'room': {
+        'rate': float(os.getenv('CHAT_RATE_LIMIT_ROOM_RATE', 100)),
+        'burst': int(os.getenv('CHAT_RATE_LIMIT_ROOM_BURST', 300)),
+    },
+}
+if CHAT_RATE_LIMIT_BACKEND == 'chats.ratelimit.RedisRateLimiter':
+    CHAT_RATE_LIMIT['OPTIONS']['url'] = CHAT_REDIS_URL
+
+# Typing, presence and read receipts (chats/ephemeral.py) are never stored;
+# each room's events are batched for `window` seconds. Use
+# chats.ephemeral.RedisPresence to share presence between workers; users of a
+# worker that stops refreshing its entries go offline after `ttl` seconds.
+CHAT_PRESENCE_BACKEND = os.getenv('CHAT_PRESENCE_BACKEND', 'chats.ephemeral.InMemoryPresence')
+CHAT_EPHEMERAL = {
+    'OPTIONS': {},
+    'window': float(os.getenv('CHAT_EPHEMERAL_WINDOW', 0.1)),
+    'broadcast_presence': os.getenv('CHAT_BROADCAST_PRESENCE', '1') == '1',
+}
+if CHAT_PRESENCE_BACKEND == 'chats.ephemeral.RedisPresence':
+    CHAT_EPHEMERAL['OPTIONS'].update(url=CHAT_REDIS_URL, ttl=int(os.getenv('CHAT_PRESENCE_TTL', 60)))
+
+# user id -> open channel names, used to route direct messages
+# (chats/direct.py). Use chats.direct.RedisChannelRegistry with more than one
+# worker; its entries expire `ttl` seconds after a worker stops refreshing them.
+CHAT_CHANNEL_REGISTRY_BACKEND = os.getenv('CHAT_CHANNEL_REGISTRY_BACKEND', 'chats.direct.InMemoryChannelRegistry')
+CHAT_CHANNEL_REGISTRY = {'OPTIONS': {}}
+if CHAT_CHANNEL_REGISTRY_BACKEND == 'chats.direct.RedisChannelRegistry':
+    CHAT_CHANNEL_REGISTRY['OPTIONS'].update(url=CHAT_REDIS_URL, ttl=int(os.getenv('CHAT_CHANNEL_REGISTRY_TTL', 120)))
+
+# Binary (MessagePack) frames for clients that ask for the linkup.msgpack
+# subprotocol (chats/wire.py); payloads above `compress_threshold` bytes are
+# zlib-compressed. Compressed inbound frames may inflate to at most
+# `max_frame_size` bytes.
+CHAT_WIRE = {
+    'compress_threshold': int(os.getenv('CHAT_WIRE_COMPRESS_THRESHOLD', 1024)),
+    'compress_level': 6,
+    'max_frame_size': int(os.getenv('CHAT_WIRE_MAX_FRAME_SIZE', 1024 * 1024)),
+}
+
+# Client message ids (chats/dedupe.py): the last `window` ids per user are
+# remembered for `ttl` seconds, and retries inside that window are acked
+# without being sent again. Use chats.dedupe.RedisDedupe with more than one
+# worker.
+CHAT_DEDUPE_BACKEND = os.getenv('CHAT_DEDUPE_BACKEND', 'chats.dedupe.InMemoryDedupe')
+CHAT_DEDUPE = {
+    'OPTIONS': {
+        'window': int(os.getenv('CHAT_DEDUPE_WINDOW', 256)),
+        'ttl': int(os.getenv('CHAT_DEDUPE_TTL', 300)),
     },
-}
\ No newline at end of file
+}
+if CHAT_DEDUPE_BACKEND == 'chats.dedupe.RedisDedupe':
+    CHAT_DEDUPE['OPTIONS']['url'] = CHAT_REDIS_URL
+
+# Recent-message buffer per room (chats/backlog.py). Joining clients get the
+# last `join_count` messages, reconnecting ones (?last_seq=N) the gap since N,
+# from Mongo if the gap is larger than the buffer (at most `max_replay`).
+# Use chats.backlog.RedisBacklog when running more than one worker.
+CHAT_BACKLOG_BACKEND = os.getenv('CHAT_BACKLOG_BACKEND', 'chats.backlog.InMemoryBacklog')
+CHAT_BACKLOG = {
+    'OPTIONS': {'size': int(os.getenv('CHAT_BACKLOG_SIZE', 200))},
+    'join_count': 50,
+    'max_replay': 500,
+}
+if CHAT_BACKLOG_BACKEND == 'chats.backlog.RedisBacklog':
+    CHAT_BACKLOG['OPTIONS']['url'] = CHAT_REDIS_URL
+
+REDIS_CHANNEL_LAYER = {
+    "BACKEND": "channels_redis.core.RedisChannelLayer",
+    "CONFIG": {
+        "hosts": [("127.0.0.1", 6379)],
+    },
+}
+
+# LocalFanoutChannelLayer subscribes each process once per group and fans out
+# to its own consumers in memory (see chats/layers.py).
+if os.getenv("CHAT_LOCAL_FANOUT", "1") == "1":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "chats.layers.LocalFanoutChannelLayer",
+            "CONFIG": {
+                "inner": REDIS_CHANNEL_LAYER,
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": REDIS_CHANNEL_LAYER,
+    }
@@ -0,0 +1,106 @@
+"""
+Cold-start measurements for ``server.asgi:application``.
+
+Each measurement runs in a fresh interpreter, as an autoscaled or
+redeployed worker would, with ``python -X importtime``. It reports:
+
+* phases: interpreter start-up, loading settings, django.setup() and
+  importing server.asgi, plus the total wall time of the process;
+* the import time spent in each top-level package;
+* the heavy optional stacks (Kafka, Mongo, Redis, ...) that were imported
+  at start-up, which should all be loaded on first use instead.
+
+Used by ``python manage.py profile_startup`` and benchmarks/bench_startup.py.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+
+# Packages that should only be imported once they are used.
+DEFERRED_PACKAGES = ('kafka', 'pymongo', 'bson', 'redis', 'dotenv')
+
+PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings_module!r})
+from django.conf import settings
+settings.INSTALLED_APPS
+loaded = time.perf_counter()
+import django
+django.setup()
+ready = time.perf_counter()
+import server.asgi
+done = time.perf_counter()
+print(json.dumps({{
+    'settings': loaded - start,
+    'setup': ready - loaded,
+    'asgi': done - ready,
+    'modules': sorted({{name.split('.')[0] for name in sys.modules}}),
+}}))
+"""
+
+
+def parse_importtime(output):
+    """
+    Self time in seconds per top-level package, from ``-X importtime`` output.
+    """
+    totals = defaultdict(float)
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        totals[name.strip().split('.')[0]] += int(self_us) / 1e6
+    return dict(totals)
+
+
+def measure_once(python=sys.executable, importtime=True):
+    """
+    One cold start. ``-X importtime`` adds some overhead of its own, so
+    budgets are checked with ``importtime=False``, which skips the
+    per-package figures.
+    """
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SECRET_KEY', 'startup-profile')
+    start = time.perf_counter()
+    result = subprocess.run(
+        [python, *(['-X', 'importtime'] if importtime else []), '-c',
+         PROBE.format(settings_module=settings.SETTINGS_MODULE)],
+        capture_output=True, text=True, env=env, cwd=settings.BASE_DIR, check=True,
+    )
+    total = time.perf_counter() - start
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    phases = {key: probe[key] for key in ('settings', 'setup', 'asgi')}
+    phases['interpreter'] = max(0.0, total - sum(phases.values()))
+    return {
+        'total': total,
+        'phases': phases,
+        'packages': parse_importtime(result.stderr),
+        'deferred_loaded': [name for name in DEFERRED_PACKAGES if name in probe['modules']],
+    }
+
+
+def measure(runs=5, python=sys.executable, importtime=True):
+    """
+    The median of ``runs`` cold starts, per figure. The first run also warms
+    the bytecode cache, so it is not counted when there is more than one.
+    """
+    samples = [measure_once(python, importtime) for _ in range(runs + (runs > 1))][runs > 1:]
+    packages = {name for sample in samples for name in sample['packages']}
+    return {
+        'runs': len(samples),
+        'total': statistics.median(s['total'] for s in samples),
+        'phases': {
+            phase: statistics.median(s['phases'][phase] for s in samples) for phase in samples[0]['phases']
+        },
+        'packages': {
+            name: statistics.median(s['packages'].get(name, 0.0) for s in samples) for name in packages
+        },
+        'deferred_loaded': samples[-1]['deferred_loaded'],
+    }
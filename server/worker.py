@@ -0,0 +1,126 @@
+"""
+One ASGI worker of ``python manage.py serve`` (see server/launcher.py).
+
+Runs Daphne on a listening socket inherited from the supervisor. On SIGTERM
+or SIGINT the worker drains instead of dropping its connections:
+
+1. it stops accepting, so new connections go to the other workers;
+2. every open WebSocket is closed with 1012 (Service Restart), which tells
+   clients to reconnect, and lands them on a worker that is still serving;
+3. it waits up to ``drain_timeout`` seconds for the consumers' disconnect()
+   handlers and in-flight HTTP requests to finish;
+4. it flushes the Kafka producer and the Mongo message writer and closes
+   the Mongo client, so nothing that was acknowledged is lost.
+"""
+# Importing daphne.server installs the asyncio reactor, so it goes first.
+from daphne.server import Server  # isort:skip
+from daphne.ws_protocol import WebSocketProtocol  # isort:skip
+
+import asyncio
+import signal
+import time
+
+from twisted.internet import reactor
+
+from chats import mongo
+from chats.persistence import close_message_writer
+from chats.producer import close_producer
+
+
+SERVICE_RESTART = 1012
+
+
+class ServerWebSocketProtocol(WebSocketProtocol):
+    """
+    Lets consumers close with the codes reserved for servers, such as 1009
+    (Message Too Big), which autobahn's sendClose() refuses: it only lets
+    applications use 1000 and 3000-4999.
+    """
+
+    def serverClose(self, code=None):
+        if code is not None and 1000 < code < 3000:
+            self.sendCloseFrame(code=code)
+        else:
+            super().serverClose(code)
+
+
+def flush_buffers(timeout=10):
+    """
+    Hand everything this process still holds to Kafka and Mongo. The writer
+    goes before the Mongo client it writes with.
+    """
+    for close in (lambda: close_producer(timeout), lambda: close_message_writer(timeout), mongo.close):
+        try:
+            close()
+        except Exception as e:
+            print(f"Error flushing buffers on shutdown: {e}")
+
+
+class DrainingServer(Server):
+
+    def __init__(self, application, drain_timeout=20, **kwargs):
+        kwargs['signal_handlers'] = False
+        super().__init__(application, **kwargs)
+        self.drain_timeout = drain_timeout
+        self.ports = []
+        self.draining = None
+
+    def run(self):
+        reactor.callWhenRunning(self.install_protocol)
+        reactor.callWhenRunning(self.install_signal_handlers)
+        super().run()
+
+    def install_protocol(self):
+        # ws_factory is made in run(), before the reactor accepts anything.
+        self.ws_factory.protocol = ServerWebSocketProtocol
+
+    def install_signal_handlers(self):
+        loop = asyncio.get_event_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.start_drain)
+
+    def listen_success(self, port):
+        self.ports.append(port)
+        super().listen_success(port)
+
+    def start_drain(self):
+        if self.draining is None:
+            self.draining = asyncio.ensure_future(self.drain())
+
+    async def drain(self):
+        for port in self.ports:
+            port.stopListening()
+
+        sockets = [
+            protocol for protocol in self.connections
+            if isinstance(protocol, WebSocketProtocol) and protocol.state == protocol.STATE_OPEN
+        ]
+        # serverClose() goes through autobahn's sendClose(), which only lets
+        # applications use 1000 and 3000-4999; 1012 is for servers.
+        for protocol in sockets:
+            protocol.sendCloseFrame(code=SERVICE_RESTART)
+        print(f"Draining: closed {len(sockets)} WebSockets, {len(self.connections)} connections open")
+
+        # application_checker() drops a connection once its socket is closed
+        # and its application instance has returned.
+        deadline = time.monotonic() + self.drain_timeout
+        while self.connections and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self.connections:
+            print(f"Drain timed out with {len(self.connections)} connections open")
+        self.stop()
+
+
+def run_worker(fd, drain_timeout=20, verbosity=1):
+    from server.asgi import application
+
+    server = DrainingServer(
+        application,
+        endpoints=[f"fd:fileno={fd}"],
+        drain_timeout=drain_timeout,
+        verbosity=verbosity,
+    )
+    try:
+        server.run()
+    finally:
+        flush_buffers()